@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Benchmark parsing of large generated .frof files.
+
+Compares the old Earley parser with the LALR parser (with a cold and a warm
+compiled-grammar cache) and with the parsed-spec cache:
+
+    python benchmarks/parse_benchmark.py [--lines 10000] [--repeat 3]
+
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import lark  # noqa: E402
+
+import frof.parser as frof_parser  # noqa: E402
+from frof.parser import SYNTAX, FrofParser, FrofTransformer, build_plan  # noqa: E402
+
+
+def generate_frof(lines: int) -> str:
+    """
+    Generate a .frof file with about `lines` lines.
+
+    It has chains of jobs, some sweeps with options, and a definition per job.
+
+    Arguments:
+        lines (int): The approximate number of lines
+
+    Returns:
+        str: The contents of the file
+
+    """
+    out = ["# generated by parse_benchmark.py", "&v: list(range(8))"]
+    chains = max(lines // 8, 1)
+    for c in range(chains):
+        options = f'inputs="in{c}.txt", outputs="out{c}"'
+        out.append(f"a{c} -> b{c}(&v, 4) -> c{c}({options}) -> d{c}")
+        out.append(f"a{c}: echo start {c} > in{c}.txt")
+        out.append(f"b{c}: sleep 0.{c % 10}; echo {{{{&v}}}} >> in{c}.txt")
+        out.append(f"c{c}: sort in{c}.txt | uniq -c > out{c}")
+        out.append(f"d{c}: rm -f in{c}.txt out{c}  # clean up")
+        out.append("")
+        out.append(f"# chain {c}")
+        out.append("")
+    return "\n".join(out) + "\n"
+
+
+def best_of(repeat: int, fn) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    contents = generate_frof(args.lines)
+    print(f"{contents.count(chr(10))} lines, {len(contents) / 1e6:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        results = [
+            (
+                "earley (old): build grammar + parse",
+                lambda: FrofTransformer().transform(lark.Lark(SYNTAX).parse(contents)),
+            ),
+            (
+                "lalr: build grammar",
+                lambda: lark.Lark(SYNTAX, parser="lalr"),
+            ),
+            (
+                "lalr: load cached grammar",
+                lambda: lark.Lark(
+                    SYNTAX,
+                    parser="lalr",
+                    cache=os.path.join(cache_dir, "grammar.cache"),
+                ),
+            ),
+            (
+                "lalr: build grammar + parse",
+                lambda: FrofParser(cache_dir=None).parse(contents),
+            ),
+        ]
+        # Warm the spec cache once, so that the next entry only measures hits:
+        FrofParser(cache_dir=cache_dir).parse(contents)
+        results.append(
+            ("spec cache hit", lambda: FrofParser(cache_dir=cache_dir).parse(contents))
+        )
+        spec = FrofParser(cache_dir=cache_dir).parse_spec(contents)
+        results.append(("  of which building the plan", lambda: build_plan(spec)))
+
+        for name, fn in results:
+            frof_parser._lark_parser = None
+            print(f"{name:40s} {best_of(args.repeat, fn) * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Benchmark the startup time of the frof CLI.
+
+Times `frof --help` and a run of a single-job .frof file, each in a fresh
+interpreter, against a bare `python -c pass`:
+
+    python benchmarks/startup_benchmark.py [--repeat 10] [--max-help-ms 150]
+
+With --max-help-ms or --max-run-ms, exits nonzero if the median time (over
+the bare interpreter's) is above the limit, so it can be used as a
+regression check. Set PYTHONPROFILEIMPORTTIME=1 to see where the time goes.
+
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FROF = os.path.join(ROOT, "bin", "frof")
+
+
+def median_ms(cmd, repeat: int, env: dict, cwd: str) -> float:
+    """
+    Run a command `repeat` times and get its median wall time.
+
+    Arguments:
+        cmd (List[str]): The command to run
+        repeat (int): How many times to run it
+        env (dict): The environment to run it in
+        cwd (str): The directory to run it in
+
+    Returns:
+        float: The median wall time, in milliseconds
+
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max-help-ms", type=float, default=None)
+    parser.add_argument("--max-run-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]),
+        "PYTHONWARNINGS": "ignore",
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "single-job.frof"), "w") as fh:
+            fh.write("A\nA: true\n")
+        # Warm the parser caches, as a second run of the same file would be:
+        subprocess.run(
+            [sys.executable, FROF, "single-job.frof", "--no-journal"],
+            env=env,
+            cwd=tmp,
+            check=True,
+        )
+
+        python = median_ms([sys.executable, "-c", "pass"], args.repeat, env, tmp)
+        help_ms = median_ms([sys.executable, FROF, "--help"], args.repeat, env, tmp)
+        run_ms = median_ms(
+            [sys.executable, FROF, "single-job.frof", "--no-journal"],
+            args.repeat,
+            env,
+            tmp,
+        )
+
+    print(f"{'python -c pass':28s} {python:8.1f} ms")
+    print(f"{'frof --help':28s} {help_ms:8.1f} ms  (+{help_ms - python:.1f})")
+    print(f"{'frof single-job.frof':28s} {run_ms:8.1f} ms  (+{run_ms - python:.1f})")
+
+    failed = False
+    if args.max_help_ms is not None and help_ms - python > args.max_help_ms:
+        print(f"frof --help is over {args.max_help_ms} ms", file=sys.stderr)
+        failed = True
+    if args.max_run_ms is not None and run_ms - python > args.max_run_ms:
+        print(f"frof single-job.frof is over {args.max_run_ms} ms", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
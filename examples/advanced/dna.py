@@ -0,0 +1,18 @@
+"""
+Python versions of getDNA.py and countBases.py, for python-DNA.frof.
+
+"""
+import random
+
+
+def get_DNA(run_id):
+    with open(f"{run_id}-DNA.txt", "w") as fh:
+        fh.write("".join(random.choice("ATGC") for _ in range(100)))
+
+
+def count_base(job_param, run_id):
+    with open(f"{run_id}-DNA.txt", "r") as fh:
+        count = fh.read().count(job_param)
+    print(job_param + " = " + str(count))
+    with open(f"{run_id}-{job_param}", "w") as fh:
+        fh.write(f"{job_param} = {count}\n")
@@ -2,3 +2,12 @@ from .parser import FrofParser
 from .statusmonitor import NullStatusMonitor
 from .executor import LocalFrofExecutor
 from .version import __version__
+
+
+def __getattr__(name: str):
+    # The cluster module is only imported if a cluster is actually used:
+    if name == "ClusterFrofExecutor":
+        from .cluster import ClusterFrofExecutor
+
+        return ClusterFrofExecutor
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,256 @@
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
+from typing import Callable, Hashable, Optional
+
+import abc
+import functools
+import os
+import signal
+import threading
+
+from ..job import kill_running_jobs
+
+# Called with (key, None, usage) when a job succeeds, or (key, exception,
+# None) when it fails; usage is whatever the job's run returned (a dict of
+# resource usage, or None). Backends may call it from any thread.
+DoneCallback = Callable[[Hashable, Optional[BaseException], Optional[dict]], None]
+
+
+def _run_job(job: "Job", env_vars: dict, run_args: dict) -> Optional[dict]:
+    return job.run(env_vars=env_vars, **run_args)
+
+
+def _init_worker(pids: "multiprocessing.SimpleQueue") -> None:
+    # Runs first in each worker process of a ProcessBackend.
+    pids.put(os.getpid())
+
+    def terminate(signum, frame):
+        # Kill the command this worker is running, if any; the job then
+        # fails, and the worker exits once the pool is shut down. A worker
+        # that is only running Python code (or nothing) exits right away.
+        if not kill_running_jobs():
+            raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+
+class Backend(abc.ABC):
+    """
+    Backends run the jobs that a LocalFrofExecutor schedules.
+
+    The executor decides what runs when, and never has more than max_jobs
+    jobs submitted at once; a backend only decides how each job is run.
+    This is the abstract base class; do not use this class directly.
+    """
+
+    def __init__(self, max_jobs: int, done: DoneCallback) -> None:
+        """
+        Create a new Backend.
+
+        Arguments:
+            max_jobs (int): The most jobs that will be submitted at once
+            done (Callable): Called with (key, None, usage) when a job
+                succeeds, or (key, exception, None) when it fails
+
+        Returns:
+            None
+
+        """
+        self.max_jobs = max_jobs
+        self._done = done
+
+    @abc.abstractmethod
+    def submit(
+        self, key: Hashable, job: "Job", env_vars: dict, run_args: dict
+    ) -> None:
+        """
+        Start running a job. Must not block until the job finishes.
+
+        Arguments:
+            key (Hashable): Passed back to the done callback
+            job (Job): The job to run
+            env_vars (dict): The environment variables of the job
+            run_args (dict): More keyword arguments for the job's run:
+                stdout_path and stderr_path, if logging, and timeout, if the
+                job has one
+
+        Returns:
+            None
+
+        """
+        ...
+
+    def kill(self) -> None:
+        """
+        Stop the jobs that are running, when the run is being torn down.
+
+        The commands that BashJobs start in this process are killed by the
+        executor (see frof.job.kill_running_jobs); backends that run jobs
+        elsewhere must stop those. close is still called afterwards.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        pass
+
+    def close(self) -> None:
+        """
+        Release the backend's resources. Called once all jobs are done.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        pass
+
+
+class ThreadBackend(Backend):
+    """
+    Runs each job on a thread of a pool of max_jobs threads.
+
+    A BashJob's thread starts its shell directly and waits for it, so there
+    is a single process per job. This is the default backend.
+    """
+
+    def __init__(self, max_jobs: int, done: DoneCallback) -> None:
+        super().__init__(max_jobs, done)
+        self._pool = ThreadPoolExecutor(max_workers=max_jobs)
+
+    def submit(self, key, job, env_vars, run_args) -> None:
+        self._pool.submit(self._run, key, job, env_vars, run_args)
+
+    def _run(self, key, job, env_vars, run_args) -> None:
+        try:
+            usage = _run_job(job, env_vars, run_args)
+        except BaseException as e:
+            self._done(key, e, None)
+        else:
+            self._done(key, None, usage)
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+
+class AsyncioBackend(Backend):
+    """
+    Runs jobs as asyncio tasks on an event loop in a background thread.
+
+    Jobs with a run_async coroutine (like BashJob, which uses
+    asyncio.create_subprocess_shell) cost no thread at all while they run, so
+    thousands of them can be in flight at once; set max_jobs accordingly.
+    Other jobs are run on the loop's default thread pool.
+    """
+
+    def __init__(self, max_jobs: int, done: DoneCallback) -> None:
+        import asyncio
+
+        super().__init__(max_jobs, done)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._futures = set()
+
+    def submit(self, key, job, env_vars, run_args) -> None:
+        import asyncio
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(key, job, env_vars, run_args), self._loop
+        )
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+
+    async def _run(self, key, job, env_vars, run_args) -> None:
+        try:
+            if hasattr(job, "run_async"):
+                usage = await job.run_async(env_vars=env_vars, **run_args)
+            else:
+                usage = await self._loop.run_in_executor(
+                    None, functools.partial(_run_job, job, env_vars, run_args)
+                )
+        except BaseException as e:
+            self._done(key, e, None)
+        else:
+            self._done(key, None, usage)
+
+    def close(self) -> None:
+        # Only jobs that were killed can still be running; let them wrap up.
+        wait(list(self._futures))
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class ProcessBackend(Backend):
+    """
+    Runs jobs in a pool of max_jobs worker processes.
+
+    Jobs are pickled and sent to a worker, so this suits jobs that do their
+    work in Python; a BashJob still starts a shell from the worker. Workers
+    are forked from a clean server process, not from the (threaded)
+    executor, and stay up for the whole run.
+    """
+
+    def __init__(self, max_jobs: int, done: DoneCallback) -> None:
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        super().__init__(max_jobs, done)
+        context = multiprocessing.get_context("forkserver")
+        # Each worker sends its pid here when it starts, so that kill can
+        # reach it:
+        self._pids = context.SimpleQueue()
+        self._worker_pids = set()
+        # The futures of the jobs that have not finished, so that kill can
+        # cancel those that haven't started:
+        self._futures = set()
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_jobs,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._pids,),
+        )
+
+    def submit(self, key, job, env_vars, run_args) -> None:
+        future = self._pool.submit(_run_job, job, env_vars, run_args)
+        self._futures.add(future)
+        future.add_done_callback(functools.partial(self._future_done, key))
+
+    def _future_done(self, key, future) -> None:
+        self._futures.discard(future)
+        if future.cancelled():
+            self._done(key, CancelledError(), None)
+        elif future.exception() is not None:
+            self._done(key, future.exception(), None)
+        else:
+            self._done(key, None, future.result())
+
+    def kill(self) -> None:
+        # SIGTERM makes each worker kill the process group of the command it
+        # is running (see _init_worker); whatever hasn't started is dropped.
+        while not self._pids.empty():
+            self._worker_pids.add(self._pids.get())
+        for pid in self._worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # (shutdown's cancel_futures would do this, but needs Python 3.9.)
+        for future in list(self._futures):
+            future.cancel()
+        self._pool.shutdown(wait=False)
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+
+BACKENDS = {
+    "thread": ThreadBackend,
+    "asyncio": AsyncioBackend,
+    "process": ProcessBackend,
+}
@@ -0,0 +1,256 @@
+from typing import Iterable, List
+
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+_HOME = os.path.expanduser("~")
+
+DEFAULT_CACHE_DIR = os.path.join(_HOME, ".frof", "cache")
+
+# 64 MB of cache entries is plenty: each entry is well under a kilobyte.
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+_ENV_REFERENCE = re.compile(r"\$\{?(\w+)")
+
+
+def referenced_env(cmd: str, env: dict) -> dict:
+    """
+    Get the environment variables that a shell command refers to.
+
+    Arguments:
+        cmd (str): The command
+        env (dict): The environment that the command will run in
+
+    Returns:
+        dict: The subset of env that appears as $NAME or ${NAME} in cmd
+
+    """
+    return {k: env[k] for k in sorted(set(_ENV_REFERENCE.findall(cmd))) if k in env}
+
+
+class JobCache:
+    """
+    A content-addressed record of jobs that have already succeeded.
+
+    Each job is keyed on everything that could change what it does: its
+    interpolated command and the environment it refers to, the contents of
+    its declared input files, and the keys of the jobs upstream of it. If a
+    job's key is in the cache (and its declared outputs exist), the job can
+    be skipped.
+
+    The cache is a single SQLite file. Entries are evicted least-recently-used
+    first once they take up more than max_size bytes. The cache also keeps
+    the content hashes of input files, for as long as an entry refers to
+    them and they exist.
+
+    """
+
+    def __init__(self, cache_dir: str = None, max_size: int = None) -> None:
+        """
+        Create (or open) a JobCache.
+
+        Arguments:
+            cache_dir (str: ~/.frof/cache): Where to keep the cache
+            max_size (int: 64MB): The most bytes of entries to keep
+
+        Returns:
+            None
+
+        """
+        self.cache_dir = os.path.expanduser(cache_dir or DEFAULT_CACHE_DIR)
+        self.max_size = max_size or DEFAULT_MAX_SIZE
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(self.cache_dir, "cache.sqlite"), check_same_thread=False
+        )
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                key TEXT PRIMARY KEY,
+                record TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_last_used ON jobs (last_used);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                digest TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_files (
+                key TEXT NOT NULL,
+                path TEXT NOT NULL,
+                PRIMARY KEY (key, path)
+            );
+            CREATE INDEX IF NOT EXISTS job_files_path ON job_files (path);
+            """
+        )
+        self._file_digests = {}
+        # The input files of the keys computed by key(), until they are
+        # stored (or hit):
+        self._key_paths = {}
+
+    def file_digest(self, path: str) -> str:
+        """
+        Get the content hash of a file.
+
+        Files whose mtime and size have not changed since they were last
+        hashed are not read again.
+
+        Arguments:
+            path (str): The path of the file
+
+        Returns:
+            str: The sha256 of the file, or a marker if it does not exist
+
+        """
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return "missing"
+        stat_key = (path, st.st_mtime_ns, st.st_size)
+        if stat_key in self._file_digests:
+            return self._file_digests[stat_key]
+
+        row = self._db.execute(
+            "SELECT digest FROM files WHERE path = ? AND mtime_ns = ? AND size = ?",
+            stat_key,
+        ).fetchone()
+        if row:
+            digest = row[0]
+        else:
+            h = hashlib.sha256()
+            with open(path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(1 << 20), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (*stat_key, digest)
+            )
+        self._file_digests[stat_key] = digest
+        return digest
+
+    def key(
+        self, fingerprint: str, env: dict, inputs: Iterable[str], upstream: List[str]
+    ) -> str:
+        """
+        Compute the cache key of a job.
+
+        Arguments:
+            fingerprint (str): A description of what the job runs
+            env (dict): The environment variables the job depends on
+            inputs (Iterable[str]): The job's declared input files (or globs)
+            upstream (List[str]): The digests of the job's upstream jobs
+
+        Returns:
+            str: The key
+
+        """
+        paths = []
+        for pattern in inputs:
+            paths.extend(sorted(glob.glob(pattern)) or [pattern])
+        description = json.dumps(
+            [
+                fingerprint,
+                sorted((str(k), str(v)) for k, v in env.items()),
+                [(p, self.file_digest(p)) for p in paths],
+                upstream,
+            ]
+        )
+        key = hashlib.sha256(description.encode()).hexdigest()
+        if paths:
+            self._key_paths[key] = [os.path.abspath(p) for p in paths]
+        return key
+
+    def hit(self, key: str, outputs: Iterable[str] = ()) -> bool:
+        """
+        Check whether a job with this key has already succeeded.
+
+        Arguments:
+            key (str): The job's cache key
+            outputs (Iterable[str]): Files (or globs) the job must have left
+                behind; if any is missing, this is a miss
+
+        Returns:
+            bool: True if the job can be skipped
+
+        """
+        if self._db.execute("SELECT 1 FROM jobs WHERE key = ?", (key,)).fetchone():
+            if all(glob.glob(pattern) for pattern in outputs):
+                self._db.execute(
+                    "UPDATE jobs SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+                self._key_paths.pop(key, None)
+                return True
+        return False
+
+    def store(self, key: str, job_name: str) -> None:
+        """
+        Record that a job with this key succeeded.
+
+        Arguments:
+            key (str): The job's cache key
+            job_name (str): The name of the job, for inspection
+
+        Returns:
+            None
+
+        """
+        record = json.dumps({"job": job_name, "finished": time.time()})
+        paths = self._key_paths.pop(key, [])
+        size = len(key) + len(record) + sum(len(key) + len(p) for p in paths)
+        self._db.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)",
+            (key, record, size, time.time()),
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO job_files VALUES (?, ?)", ((key, p) for p in paths)
+        )
+
+    def save(self) -> None:
+        """
+        Evict least-recently-used entries over max_size, and save the cache.
+
+        File hashes are dropped along with the last entry that refers to
+        them, and once their file no longer exists.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM jobs").fetchone()
+        if total > self.max_size:
+            excess = total - self.max_size
+            for key, size in self._db.execute(
+                "SELECT key, size FROM jobs ORDER BY last_used"
+            ).fetchall():
+                if excess <= 0:
+                    break
+                self._db.execute("DELETE FROM jobs WHERE key = ?", (key,))
+                excess -= size
+            self._db.execute(
+                "DELETE FROM job_files WHERE key NOT IN (SELECT key FROM jobs)"
+            )
+        self._db.execute(
+            "DELETE FROM files WHERE path NOT IN (SELECT path FROM job_files)"
+        )
+        missing = [
+            (path,)
+            for (path,) in self._db.execute("SELECT path FROM files").fetchall()
+            if not os.path.exists(path)
+        ]
+        self._db.executemany("DELETE FROM files WHERE path = ?", missing)
+        # The hashes remembered here may have just been dropped from the
+        # database, so they would not be stored again:
+        self._file_digests.clear()
+        self._db.commit()
@@ -0,0 +1,617 @@
+from collections import deque
+from typing import Hashable, Optional, Tuple
+
+import base64
+import hmac
+import itertools
+import json
+import os
+import pickle
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from ..backends import BACKENDS, Backend, DoneCallback
+from ..executor import LocalFrofExecutor, _exit_on_sigterm
+from ..job import kill_running_jobs
+from ..version import __version__
+
+DEFAULT_PORT = 8112
+# Workers and the coordinator each send a heartbeat this often...
+HEARTBEAT_SECONDS = 2.0
+# ...and give up on the other end if they hear nothing for this long:
+HEARTBEAT_TIMEOUT = 10.0
+# How often a worker tries to reach a coordinator that isn't up:
+RECONNECT_SECONDS = 1.0
+# How many workers a job may be started on before its run gives up on it:
+MAX_ATTEMPTS = 3
+
+
+class WorkerError(RuntimeError):
+    """
+    A job failed on a worker (other than by a command failing), or kept
+    losing the workers it was running on.
+
+    """
+
+
+def parse_address(text: str, host: str = "127.0.0.1") -> Tuple[str, int]:
+    """
+    Parse a "HOST:PORT" (or just "PORT") address.
+
+    Arguments:
+        text (str): The address
+        host (str: "127.0.0.1"): The host, if the address only has a port
+
+    Returns:
+        Tuple[str, int]: (host, port)
+
+    """
+    if ":" in text:
+        host, _, port = text.rpartition(":")
+    else:
+        port = text
+    try:
+        return host, int(port)
+    except ValueError:
+        raise ValueError(f"Expected HOST:PORT or PORT, not {text!r}")
+
+
+def is_loopback(host: str) -> bool:
+    """
+    Check whether a host is only reachable from this machine.
+
+    Arguments:
+        host (str): A host name or IP address
+
+    Returns:
+        bool: Whether every address of the host is a loopback address
+
+    """
+    import ipaddress
+    import socket
+
+    try:
+        infos = socket.getaddrinfo(host or None, None)
+    except OSError:
+        return False
+    return bool(infos) and all(
+        ipaddress.ip_address(info[4][0].split("%")[0]).is_loopback for info in infos
+    )
+
+
+def check_token(address: Tuple[str, int], token: Optional[str]) -> None:
+    """
+    Refuse to run the cluster protocol on a network without a token.
+
+    Jobs are sent as pickles, and running a job runs any code it likes, so
+    the coordinator and its workers must only talk to each other. Without a
+    token, that only holds on the loopback interface.
+
+    Arguments:
+        address (Tuple[str, int]): The (host, port) to listen on or connect to
+        token (str): The cluster token, if there is one
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If there is no token and the host is not loopback
+
+    """
+    if not token and not is_loopback(address[0]):
+        raise ValueError(
+            f"{address[0]} is not a loopback address, so a cluster token is "
+            "required (--cluster-token, --token, or $FROF_CLUSTER_TOKEN)"
+        )
+
+
+def _token_matches(given, token: str) -> bool:
+    # Constant-time, so that the token can't be guessed a byte at a time:
+    if not isinstance(given, str):
+        return False
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+def _send(sock: "socket.socket", lock: threading.Lock, message: dict) -> None:
+    line = (json.dumps(message) + "\n").encode()
+    with lock:
+        sock.sendall(line)
+
+
+class _Worker:
+    """
+    A worker that is connected to a ClusterBackend.
+
+    """
+
+    def __init__(self, sock: "socket.socket", name: str, capacity: int) -> None:
+        """
+        Create a new _Worker.
+
+        Arguments:
+            sock (socket.socket): The connection to the worker
+            name (str): The worker's name (hostname:pid)
+            capacity (int): The most jobs the worker runs at once
+
+        Returns:
+            None
+
+        """
+        self.sock = sock
+        self.name = name
+        self.capacity = capacity
+        # The IDs of the jobs that the worker is running:
+        self.running = set()
+        self.lock = threading.Lock()
+
+
+class ClusterBackend(Backend):
+    """
+    Runs jobs on `frof worker` processes, which connect to it over TCP.
+
+    Each worker says how many jobs it can run at once, and is sent jobs as
+    it has free slots. Messages are lines of JSON; jobs are pickled, as for
+    the "process" backend, so workers must run the same version of frof
+    (with access to the same modules, for PythonJobs, and the same files).
+
+    Both ends send a heartbeat every HEARTBEAT_SECONDS. A worker that
+    disconnects or goes HEARTBEAT_TIMEOUT seconds without a word is dropped,
+    and the jobs it was running are started again on other workers (up to
+    MAX_ATTEMPTS times each; then the job fails with a WorkerError). Jobs
+    wait, in the order they were submitted, while no worker has a free slot.
+    """
+
+    def __init__(
+        self,
+        max_jobs: int,
+        done: DoneCallback,
+        address: Tuple[str, int] = ("127.0.0.1", DEFAULT_PORT),
+        token: str = None,
+    ) -> None:
+        """
+        Start listening for workers.
+
+        Arguments:
+            max_jobs (int): The most jobs that will be submitted at once
+            done (Callable): Called with (key, None, usage) when a job
+                succeeds, or (key, exception, None) when it fails
+            address (Tuple[str, int]: ("127.0.0.1", 8112)): Where to listen
+                for workers; ("0.0.0.0", port) accepts workers on other hosts
+            token (str: None): If set, workers must present this token.
+                Required unless the address is loopback
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If there is no token and the address is not loopback
+
+        """
+        import socket
+
+        check_token(address, token)
+        super().__init__(max_jobs, done)
+        self.token = token
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        # [key, message, attempts] of each unfinished job, by ID:
+        self._jobs = {}
+        self._pending = deque()
+        self._workers = []
+        self._closed = threading.Event()
+        self._listener = socket.create_server(address)
+        self.address = self._listener.getsockname()[:2]
+        threading.Thread(target=self._accept, daemon=True).start()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+
+    def submit(self, key, job, env_vars, run_args) -> None:
+        job_id = next(self._ids)
+        message = {
+            "type": "job",
+            "id": job_id,
+            "job": base64.b64encode(pickle.dumps(job)).decode("ascii"),
+            "env": env_vars,
+            "run_args": run_args,
+        }
+        with self._lock:
+            self._jobs[job_id] = [key, message, 0]
+            self._pending.append(job_id)
+        self._dispatch()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                # The listener was closed:
+                return
+            thread = threading.Thread(target=self._serve, args=(sock,), daemon=True)
+            thread.start()
+
+    def _hello_error(self, hello: dict) -> Optional[str]:
+        if not isinstance(hello, dict) or hello.get("type") != "hello":
+            return "expected a hello"
+        if self.token and not _token_matches(hello.get("token"), self.token):
+            return "wrong token"
+        if hello.get("version") != __version__:
+            return f"the coordinator runs frof {__version__}"
+        if not isinstance(hello.get("capacity"), int) or hello["capacity"] < 1:
+            return "capacity must be a positive integer"
+        return None
+
+    def _serve(self, sock: "socket.socket") -> None:
+        worker = None
+        try:
+            sock.settimeout(HEARTBEAT_TIMEOUT)
+            reader = sock.makefile("rb")
+            hello = json.loads(reader.readline() or "null")
+            error = self._hello_error(hello)
+            if error is not None:
+                _send(sock, threading.Lock(), {"type": "error", "error": error})
+                return
+            worker = _Worker(sock, str(hello.get("worker")), hello["capacity"])
+            with self._lock:
+                self._workers.append(worker)
+            self._dispatch()
+            for line in reader:
+                message = json.loads(line)
+                if message["type"] in ("done", "failed"):
+                    self._finished(worker, message)
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            if worker is not None:
+                self._lost(worker)
+            sock.close()
+
+    def _heartbeat(self) -> None:
+        while not self._closed.wait(HEARTBEAT_SECONDS):
+            for worker in list(self._workers):
+                try:
+                    _send(worker.sock, worker.lock, {"type": "heartbeat"})
+                except OSError:
+                    self._lost(worker)
+
+    def _dispatch(self) -> None:
+        """
+        Send waiting jobs to the workers with the most free slots.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        sends = []
+        with self._lock:
+            while self._pending and self._workers:
+                worker = max(
+                    self._workers, key=lambda w: w.capacity - len(w.running)
+                )
+                if len(worker.running) >= worker.capacity:
+                    break
+                job_id = self._pending.popleft()
+                worker.running.add(job_id)
+                sends.append((worker, self._jobs[job_id][1]))
+        # Sent outside the lock, so that one slow worker doesn't hold up the rest:
+        for worker, message in sends:
+            try:
+                _send(worker.sock, worker.lock, message)
+            except OSError:
+                self._lost(worker)
+
+    def _finished(self, worker: _Worker, message: dict) -> None:
+        with self._lock:
+            job_id = message["id"]
+            if job_id not in worker.running:
+                return
+            worker.running.discard(job_id)
+            key = self._jobs.pop(job_id)[0]
+        if message["type"] == "done":
+            self._done(key, None, message.get("usage"))
+        elif message.get("returncode") is not None:
+            output = message.get("output")
+            self._done(
+                key,
+                subprocess.CalledProcessError(
+                    message["returncode"],
+                    message.get("cmd"),
+                    output=output.encode() if output is not None else None,
+                ),
+                None,
+            )
+        else:
+            error = WorkerError(f"{message.get('error')} (on {worker.name})")
+            self._done(key, error, None)
+        self._dispatch()
+
+    def _lost(self, worker: _Worker) -> None:
+        """
+        Drop a worker, and start the jobs it was running again elsewhere.
+
+        Arguments:
+            worker (_Worker): The worker
+
+        Returns:
+            None
+
+        """
+        given_up = []
+        with self._lock:
+            if worker not in self._workers:
+                return
+            self._workers.remove(worker)
+            for job_id in sorted(worker.running, reverse=True):
+                entry = self._jobs[job_id]
+                entry[2] += 1
+                if entry[2] >= MAX_ATTEMPTS:
+                    given_up.append(self._jobs.pop(job_id)[0])
+                else:
+                    self._pending.appendleft(job_id)
+            reassigned = len(worker.running) - len(given_up)
+            worker.running.clear()
+        try:
+            worker.sock.close()
+        except OSError:
+            pass
+        if self._closed.is_set():
+            return
+        print(
+            f"frof: lost worker {worker.name}; "
+            f"restarting its {reassigned} running job(s) elsewhere",
+            file=sys.stderr,
+        )
+        for key in given_up:
+            self._done(
+                key,
+                WorkerError(f"Lost the worker of this job {MAX_ATTEMPTS} times"),
+                None,
+            )
+        self._dispatch()
+
+    def kill(self) -> None:
+        # Workers kill the jobs they are running when they lose the
+        # coordinator, so hanging up on them is enough.
+        self.close()
+
+    def close(self) -> None:
+        import socket
+
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._listener.close()
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            # close alone doesn't hang up while _serve still reads from the
+            # socket's file, and the worker would only notice at its
+            # HEARTBEAT_TIMEOUT:
+            try:
+                worker.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                worker.sock.close()
+            except OSError:
+                pass
+
+
+class ClusterFrofExecutor(LocalFrofExecutor):
+    """
+    A FrofExecutor that runs jobs on `frof worker` processes on other hosts.
+
+    This process is the coordinator: it holds the plan and schedules it just
+    as a LocalFrofExecutor does (priorities, groups, resources, the cache,
+    journal, and history, and nested .frof files), but jobs are run by the
+    workers that connect to it. See ClusterBackend. Workers run each job in
+    their own working directory, so they should see the same files (e.g. a
+    shared filesystem) where they are started.
+    """
+
+    def __init__(
+        self,
+        fp: "FrofPlan",
+        address: Tuple[str, int] = ("127.0.0.1", DEFAULT_PORT),
+        token: str = None,
+        **kwargs,
+    ) -> None:
+        """
+        Create a new ClusterFrofExecutor.
+
+        Arguments:
+            fp (FrofPlan): The plan to run
+            address (Tuple[str, int]: ("127.0.0.1", 8112)): Where to listen
+                for workers; ("0.0.0.0", port) accepts workers on other hosts
+            token (str: None): If set, workers must present this token.
+                Required unless the address is loopback
+            **kwargs: As for LocalFrofExecutor. max_jobs is the most jobs to
+                have running on all of the workers together, so set it to
+                their total capacity; backend is not used
+
+        Returns:
+            None
+
+        """
+        check_token(address, token)
+        super().__init__(fp, **kwargs)
+        self.address = address
+        self.token = token
+        self.backend = ClusterBackend
+
+    def _backend_class(self, job: "Job") -> type:
+        # Workers pick each job's own backend (e.g. "process" for PythonJobs):
+        return ClusterBackend
+
+    def _start_backend(self, backend: type, done: DoneCallback) -> Backend:
+        return ClusterBackend(self.max_jobs, done, self.address, self.token)
+
+
+def _result(job_id: Hashable, error: Optional[BaseException], usage) -> dict:
+    if error is None:
+        return {"type": "done", "id": job_id, "usage": usage}
+    output = getattr(error, "output", None)
+    if isinstance(output, bytes):
+        output = output.decode("utf-8", "replace")
+    return {
+        "type": "failed",
+        "id": job_id,
+        "error": f"{type(error).__name__}: {error}",
+        "returncode": getattr(error, "returncode", None),
+        "cmd": str(getattr(error, "cmd", "")),
+        "output": output if isinstance(output, str) else None,
+    }
+
+
+def _work(sock: "socket.socket", capacity: int, token: str, backend: str) -> None:
+    """
+    Run jobs for a coordinator until the connection ends.
+
+    Arguments:
+        sock (socket.socket): The connection to the coordinator
+        capacity (int): The most jobs to run at once
+        token (str): The coordinator's token, if it has one
+        backend (str): The backend to run jobs on, unless they ask for another
+
+    Returns:
+        None
+
+    """
+    import socket
+
+    lock = threading.Lock()
+    stopped = threading.Event()
+    default = BACKENDS[backend]
+    backends = {}
+
+    def done(job_id, error, usage):
+        try:
+            _send(sock, lock, _result(job_id, error, usage))
+        except OSError:
+            # The coordinator is gone; it will run the job again elsewhere.
+            pass
+
+    def heartbeat():
+        while not stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                _send(sock, lock, {"type": "heartbeat"})
+            except OSError:
+                return
+
+    sock.settimeout(HEARTBEAT_TIMEOUT)
+    _send(
+        sock,
+        lock,
+        {
+            "type": "hello",
+            "worker": f"{socket.gethostname()}:{os.getpid()}",
+            "capacity": capacity,
+            "token": token,
+            "version": __version__,
+        },
+    )
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        for line in sock.makefile("rb"):
+            message = json.loads(line)
+            if message["type"] == "error":
+                raise WorkerError(
+                    f"The coordinator refused this worker: {message['error']}"
+                )
+            if message["type"] != "job":
+                continue
+            try:
+                job = pickle.loads(base64.b64decode(message["job"]))
+            except Exception as e:
+                done(message["id"], e, None)
+                continue
+            job_backend = BACKENDS.get(getattr(job, "backend", None), default)
+            if job_backend not in backends:
+                backends[job_backend] = job_backend(capacity, done)
+            backends[job_backend].submit(
+                message["id"], job, message["env"], message["run_args"]
+            )
+    except OSError:
+        pass
+    finally:
+        stopped.set()
+        sock.close()
+        # The coordinator has gone (or is done): its jobs are run again
+        # elsewhere if it comes back, so stop any that are still running.
+        kill_running_jobs()
+        for job_backend in backends.values():
+            job_backend.kill()
+            job_backend.close()
+
+
+def run_worker(
+    address: Tuple[str, int],
+    capacity: int = None,
+    token: str = None,
+    backend: str = "thread",
+    once: bool = False,
+) -> None:
+    """
+    Run jobs for a ClusterFrofExecutor (the `frof worker` command).
+
+    The worker connects to the coordinator, retrying every RECONNECT_SECONDS
+    while it isn't up, and runs the jobs it is sent. When the coordinator's
+    run ends, the worker waits for the next one (unless once is set). If
+    the worker loses the coordinator, or is stopped (Ctrl-C or SIGTERM), it
+    kills the jobs it is running.
+
+    Arguments:
+        address (Tuple[str, int]): The coordinator's (host, port)
+        capacity (int: None): The most jobs to run at once. Defaults to the
+            number of CPUs
+        token (str: None): The coordinator's token. Required unless the
+            coordinator's address is loopback
+        backend (str: "thread"): How to run jobs (see frof.backends), unless
+            they ask for a backend of their own
+        once (bool: False): Return after one coordinator's run, instead of
+            waiting for the next
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If there is no token and the address is not loopback
+
+    """
+    import socket
+
+    check_token(address, token)
+
+    capacity = capacity or os.cpu_count()
+    waiting = False
+    previous_sigterm = _exit_on_sigterm()
+    try:
+        while True:
+            try:
+                sock = socket.create_connection(address, timeout=HEARTBEAT_TIMEOUT)
+            except OSError:
+                if not waiting:
+                    print(
+                        "frof worker: waiting for a coordinator at "
+                        f"{address[0]}:{address[1]}",
+                        file=sys.stderr,
+                    )
+                    waiting = True
+                time.sleep(RECONNECT_SECONDS)
+                continue
+            waiting = False
+            print(
+                f"frof worker: running up to {capacity} jobs for "
+                f"{address[0]}:{address[1]}",
+                file=sys.stderr,
+            )
+            _work(sock, capacity, token, backend)
+            if once:
+                return
+    finally:
+        if previous_sigterm is not None:
+            signal.signal(signal.SIGTERM, previous_sigterm)
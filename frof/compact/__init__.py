@@ -0,0 +1,485 @@
+from array import array
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from ..job import Job
+
+# Seconds before the first retry of a failed job (see JobRecord.retries):
+DEFAULT_RETRY_DELAY = 1.0
+
+
+class LazyValues:
+    """
+    The values of an &variable that are produced lazily, e.g. from a file.
+
+    Only the definition's source is stored. Every iteration evaluates it
+    again, so each run of a plan gets a fresh iterator, and the values are
+    never all held in memory at once.
+
+    """
+
+    __slots__ = ("source",)
+
+    def __init__(self, source: str) -> None:
+        """
+        Create a new LazyValues.
+
+        Arguments:
+            source (str): The Python expression that produces the values
+
+        Returns:
+            None
+
+        """
+        self.source = source
+
+    def __iter__(self) -> Iterator:
+        return iter(eval(self.source))
+
+    def __repr__(self) -> str:
+        return f"LazyValues({self.source!r})"
+
+
+class ValueChunk(tuple):
+    """
+    Several values of an &variable, run together as one job.
+
+    """
+
+    __slots__ = ()
+
+
+class JobRecord:
+    """
+    One job of a CompactPlan.
+
+    A JobRecord with no param is a single job. A JobRecord with a param is a
+    whole sweep: one template job, plus the vector of values to run it with.
+    Each concrete job of the sweep is only built (by interpolating the value
+    into the template) when the scheduler asks for it.
+
+    """
+
+    __slots__ = (
+        "name",
+        "job",
+        "param",
+        "values",
+        "group",
+        "max_parallel_count",
+        "inputs",
+        "outputs",
+        "chunk",
+        "resources",
+        "retries",
+        "retry_delay",
+        "timeout",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        job: Job = None,
+        param: str = None,
+        values: Sequence = None,
+        group: str = None,
+        max_parallel_count: int = None,
+        inputs: Tuple[str, ...] = (),
+        outputs: Tuple[str, ...] = (),
+        chunk=None,
+        resources: dict = None,
+        retries: int = 0,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+        timeout: float = None,
+    ) -> None:
+        """
+        Create a new JobRecord.
+
+        Arguments:
+            name (str): The name of the job, as written in the .frof file
+            job (Job: None): The job (or template job, if param is set) to run
+            param (str: None): The name of the &variable to sweep over
+            values (Sequence: None): The values of the &variable
+            group (str: None): The parallelism group of this job
+            max_parallel_count (int: None): The most jobs of the group that
+                may run at once
+            inputs (Tuple[str]: ()): Files (or globs) that the job reads
+            outputs (Tuple[str]: ()): Files (or globs) that the job writes
+            chunk (Union[int, str]: None): How many values of the sweep to
+                run in each job: a number, or "auto" to adapt to how long the
+                jobs take. Defaults to one value per job.
+            resources (dict: None): How much of each resource (cpus, mem,
+                or any named token) each job of this record needs
+            retries (int: 0): How many times to run a failed job again
+            retry_delay (float: 1.0): Seconds to wait before the first
+                retry of a job; each further retry waits twice as long
+            timeout (float: None): Kill a job of this record that runs longer
+                than this many seconds; 0 for no timeout. Defaults to the
+                executor's timeout
+
+        Returns:
+            None
+
+        """
+        self.name = name
+        self.job = job
+        self.param = param
+        self.values = values
+        self.group = group
+        self.max_parallel_count = max_parallel_count
+        self.inputs = inputs
+        self.outputs = outputs
+        self.chunk = chunk
+        self.resources = resources or {}
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+
+    def __len__(self) -> int:
+        if self.lazy:
+            raise TypeError(f"Job {self.name} sweeps over a lazy &{self.param}")
+        return 1 if self.param is None else len(self.values)
+
+    @property
+    def lazy(self) -> bool:
+        """
+        Whether this record sweeps over LazyValues, of unknown length.
+
+        """
+        return isinstance(self.values, LazyValues)
+
+    def make_instance(self, value) -> Tuple[str, Job]:
+        """
+        Build the concrete job of this record for one value of its param.
+
+        Arguments:
+            value: The value of the &variable
+
+        Returns:
+            Tuple[str, Job]: (Job Name, Job Object)
+
+        """
+        return f"{self.name}_{value}", self.job.interpolate(self.param, value)
+
+    def make_chunk(self, values: ValueChunk) -> Tuple[str, Job]:
+        """
+        Build the job that runs several values of this record's param at once.
+
+        Arguments:
+            values (ValueChunk): The values of the &variable
+
+        Returns:
+            Tuple[str, Job]: (Job Name, Job Object). The name is that of the
+                single job if there is one value, else e.g. "count_base_1..9"
+
+        """
+        if len(values) == 1:
+            name = f"{self.name}_{values[0]}"
+        else:
+            name = f"{self.name}_{values[0]}..{values[-1]}"
+        return name, self.job.interpolate_chunk(self.param, values)
+
+    def interpolate(self, text: str, value) -> str:
+        """
+        Fill the value of this record's &variable into a piece of text.
+
+        Arguments:
+            text (str): Text that may contain {{&param}}
+            value: The value of the &variable (ignored if there is no param),
+                or a ValueChunk of values, which are joined with spaces
+
+        Returns:
+            str: The interpolated text
+
+        """
+        if self.param is None:
+            return text
+        if isinstance(value, ValueChunk):
+            value = " ".join(str(v) for v in value)
+        return text.replace("{{&" + self.param + "}}", str(value))
+
+    def instance_name(self, k: int) -> str:
+        """
+        Get the name of the k-th concrete job of this record.
+
+        Arguments:
+            k (int): The index of the value in the sweep
+
+        Returns:
+            str: The job name, e.g. "count_base_A"
+
+        """
+        if self.param is None:
+            return self.name
+        return f"{self.name}_{self.values[k]}"
+
+    def instance(self, k: int) -> Tuple[str, Job]:
+        """
+        Build the k-th concrete job of this record.
+
+        Arguments:
+            k (int): The index of the value in the sweep
+
+        Returns:
+            Tuple[str, Job]: (Job Name, Job Object)
+
+        """
+        if self.param is None:
+            return self.name, self.job
+        return self.make_instance(self.values[k])
+
+
+def _csr(adjacency: List[List[int]]) -> Tuple[array, array]:
+    """
+    Pack adjacency lists into CSR (offsets, targets) arrays.
+
+    Arguments:
+        adjacency (List[List[int]]): The neighbors of each index
+
+    Returns:
+        Tuple[array, array]: The neighbors of i are targets[offsets[i]:offsets[i+1]]
+
+    """
+    offsets = array("l", [0]) * (len(adjacency) + 1)
+    targets = array("l")
+    for i, neighbors in enumerate(adjacency):
+        targets.extend(neighbors)
+        offsets[i + 1] = len(targets)
+    return offsets, targets
+
+
+class CompactPlan:
+    """
+    An integer-indexed job network.
+
+    Jobs are JobRecords in a list; the dependencies between them are stored
+    as CSR (compressed sparse row) successor arrays plus an in-degree array.
+    Every concrete job of a record depends on every concrete job of each of
+    the record's predecessors, so a sweep between two fan-in points costs two
+    edges, not two per value.
+
+    """
+
+    def __init__(
+        self, records: List[JobRecord], edges: Iterable[Tuple[int, int]]
+    ) -> None:
+        """
+        Create a new CompactPlan.
+
+        Arguments:
+            records (List[JobRecord]): The jobs of the plan
+            edges (Iterable[Tuple[int, int]]): (upstream, downstream) indices
+                into records. Duplicate edges are ignored.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If the dependencies have a cycle
+
+        """
+        self.records = records
+        self.index = {record.name: i for i, record in enumerate(records)}
+
+        n = len(records)
+        successors = [[] for _ in range(n)]
+        predecessors = [[] for _ in range(n)]
+        seen = set()
+        for u, v in edges:
+            if (u, v) not in seen:
+                seen.add((u, v))
+                successors[u].append(v)
+                predecessors[v].append(u)
+
+        self.in_degree = array("l", (len(p) for p in predecessors))
+        self.succ_offsets, self.succ_targets = _csr(successors)
+        self.pred_offsets, self.pred_targets = _csr(predecessors)
+
+        if len(self.topological_order()) < n:
+            cycle = " -> ".join(records[i].name for i in self._find_cycle())
+            raise ValueError(f"The plan has a dependency cycle: {cycle}")
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def successors(self, i: int) -> array:
+        """
+        Get the indices of the records that depend directly on record i.
+
+        Arguments:
+            i (int): The index of the record
+
+        Returns:
+            array: The indices of the successor records
+
+        """
+        return self.succ_targets[self.succ_offsets[i] : self.succ_offsets[i + 1]]
+
+    def predecessors(self, i: int) -> array:
+        """
+        Get the indices of the records that record i depends on directly.
+
+        Arguments:
+            i (int): The index of the record
+
+        Returns:
+            array: The indices of the predecessor records
+
+        """
+        return self.pred_targets[self.pred_offsets[i] : self.pred_offsets[i + 1]]
+
+    def topological_order(self) -> List[int]:
+        """
+        Get the indices of the records, each after all of its predecessors.
+
+        Arguments:
+            None
+
+        Returns:
+            List[int]: The record indices, in topological order
+
+        """
+        remaining = array("l", self.in_degree)
+        order = [i for i in range(len(self.records)) if remaining[i] == 0]
+        for u in order:
+            for v in self.successors(u):
+                remaining[v] -= 1
+                if remaining[v] == 0:
+                    order.append(v)
+        return order
+
+    def _find_cycle(self) -> List[int]:
+        # Every record that topological_order leaves out has a predecessor
+        # that it also leaves out, so walking back through those must come
+        # around to a record that was already visited.
+        placed = set(self.topological_order())
+        i = next(i for i in range(len(self.records)) if i not in placed)
+        path = []
+        seen = {}
+        while i not in seen:
+            seen[i] = len(path)
+            path.append(i)
+            i = next(p for p in self.predecessors(i) if p not in placed)
+        cycle = path[seen[i] :] + [i]
+        cycle.reverse()
+        return cycle
+
+    def job_count(self) -> int:
+        """
+        Get the number of concrete jobs in this plan.
+
+        Lazy sweeps are not counted, since counting them would mean running
+        through all of their values.
+
+        Arguments:
+            None
+
+        Returns:
+            int: The total number of jobs, with every sized sweep expanded
+
+        """
+        return sum(len(record) for record in self.records if not record.lazy)
+
+    def instance_names(self) -> Iterator[str]:
+        """
+        Iterate over the names of every concrete job in the plan.
+
+        Single jobs come first, then the jobs of each sweep, matching the
+        node order of the expanded networkx graph. A lazy sweep is not run
+        through; it yields a single name that includes its definition.
+
+        Arguments:
+            None
+
+        Returns:
+            Iterator[str]: The job names
+
+        """
+        for record in self.records:
+            if record.param is None:
+                yield record.name
+        for record in self.records:
+            if record.lazy:
+                yield f"{record.name}_{{&{record.param}: {record.values.source}}}"
+            elif record.param is not None:
+                for k in range(len(record)):
+                    yield record.instance_name(k)
+
+    def to_networkx(self) -> "nx.DiGraph":
+        """
+        Expand this plan into a networkx graph with one node per job.
+
+        This is the only place where a sweep is fully materialized (lazy
+        sweeps included); it is meant for export and inspection, not for
+        execution.
+
+        Arguments:
+            None
+
+        Returns:
+            nx.DiGraph: The expanded job network
+
+        """
+        import networkx as nx
+
+        values = [
+            list(record.values) if record.lazy else record.values
+            for record in self.records
+        ]
+        names = [
+            [record.name]
+            if record.param is None
+            else [f"{record.name}_{value}" for value in values[i]]
+            for i, record in enumerate(self.records)
+        ]
+        G = nx.DiGraph()
+        for record in self.records:
+            if record.param is None:
+                if record.group:
+                    G.add_node(
+                        record.name,
+                        job=record.job,
+                        parallelism_group=record.group,
+                        max_parallel_count=record.max_parallel_count,
+                    )
+                else:
+                    G.add_node(record.name, job=record.job)
+        for i, record in enumerate(self.records):
+            if record.param is not None:
+                for value in values[i]:
+                    name, job = record.make_instance(value)
+                    G.add_node(
+                        name,
+                        max_parallel_count=record.max_parallel_count,
+                        parallelism_group=record.group,
+                        job=job,
+                    )
+        for u in range(len(self.records)):
+            for v in self.successors(u):
+                for downstream in names[v]:
+                    G.add_edges_from((name, downstream) for name in names[u])
+        return G
+
+    @classmethod
+    def from_networkx(cls, G: "nx.DiGraph") -> "CompactPlan":
+        """
+        Build a CompactPlan with one single-job record per node of a graph.
+
+        Arguments:
+            G (nx.DiGraph): A job network, with a "job" attribute on every
+                node and optional "parallelism_group"/"max_parallel_count"
+
+        Returns:
+            CompactPlan: The equivalent compact plan
+
+        """
+        records = [
+            JobRecord(
+                str(name),
+                job=node.get("job", None),
+                group=node.get("parallelism_group", None),
+                max_parallel_count=node.get("max_parallel_count", None),
+            )
+            for name, node in G.nodes(data=True)
+        ]
+        index = {name: i for i, name in enumerate(G.nodes())}
+        return cls(records, ((index[u], index[v]) for u, v in G.edges()))
@@ -1,28 +1,829 @@
-from typing import Callable, Union
-import abc
-import networkx as nx
-from joblib import Parallel, delayed
-from typing import Callable, List, Tuple, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import abc
-import copy
-import hashlib
+import heapq
+import itertools
 import os
+import queue
+import re
+import signal
+import sys
+import threading
 import time
 import uuid
 from datetime import datetime
 
-import networkx as nx
-
-from ..parser import FrofParser
+from ..backends import BACKENDS, Backend, DoneCallback
+from ..cache import JobCache, referenced_env
+from ..compact import ValueChunk
+from ..history import JobHistory
+from ..job import FrofJob, kill_running_jobs
+from ..journal import (
+    FAILED,
+    FINISHED,
+    STARTED,
+    RunJournal,
+    check_run_id,
+    read_journal,
+)
+from ..metrics import Metrics
 from ..plan import FrofPlan
-from ..statusmonitor import NullStatusMonitor
+from ..runstate import RunState
+from ..statusmonitor import NullStatusMonitor, StatusRefresher, StatusSnapshot
+from ..tokens import TOKEN_POOL_VAR, TokenPool
 from ..version import __version__
 
-MAX_PARALLEL = 99999
-
 _HOME = os.path.expanduser("~")
 
+# How often to check for free tokens, when jobs are waiting for one:
+_TOKEN_POLL_INTERVAL = 0.05
+
+_UNSAFE_FILENAME = re.compile(r"[^\w.-]+")
+
+
+def _exit_on_sigterm():
+    """
+    Make SIGTERM raise SystemExit, as Ctrl-C raises KeyboardInterrupt.
+
+    Then a run that is terminated still stops its jobs and closes its files.
+    Signal handlers can only be set on the main thread; elsewhere, this does
+    nothing.
+
+    Arguments:
+        None
+
+    Returns:
+        The previous SIGTERM handler, to restore; or None
+
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return None
+
+    def terminate(signum, frame):
+        raise SystemExit(128 + signum)
+
+    previous = signal.signal(signal.SIGTERM, terminate)
+    # (None means the handler was not set from Python; that's the default.)
+    return signal.SIG_DFL if previous is None else previous
+
+
+def _log_filename(seq: int, job_name: str) -> str:
+    """
+    Get a filesystem-safe, unique log filename stem for a job.
+
+    Arguments:
+        seq (int): The order in which the job was started
+        job_name (str): The name of the job
+
+    Returns:
+        str: e.g. "000012-count_base_A"
+
+    """
+    return "{:06d}-{}".format(seq, _UNSAFE_FILENAME.sub("_", job_name)[:100])
+
+
+def machine_resources() -> Dict[str, float]:
+    """
+    Get the resources of this machine: its CPUs, and its memory in MB.
+
+    Arguments:
+        None
+
+    Returns:
+        Dict[str, float]: cpus and mem (if it can be found out)
+
+    """
+    resources = {"cpus": float(os.cpu_count() or 1)}
+    try:
+        pages = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        resources["mem"] = float(pages // (1024 * 1024))
+    except (ValueError, OSError, AttributeError):
+        pass
+    return resources
+
+
+def _nested_env(parent_env: dict, run_id: str, plan_id: str) -> dict:
+    """
+    Get the FROF_* variables of a plan that is run by a job of another plan.
+
+    Arguments:
+        parent_env (dict): The FROF_* variables of the outer plan's run
+        run_id (str): The FROF_RUN_ID of the nested run
+        plan_id (str): The plan ID of the nested plan
+
+    Returns:
+        dict: The FROF_* variables of the nested run
+
+    """
+    return {
+        "FROF_RUN_ID": run_id,
+        "FROF_PLAN_ID": "{}--{}".format(parent_env["FROF_PLAN_ID"], plan_id),
+        "FROF_PARENT_PLAN_ID": parent_env["FROF_PLAN_ID"],
+        "FROF_PARENT_RUN_ID": parent_env["FROF_RUN_ID"],
+        "FROF_VERSION": __version__,
+    }
+
+
+class _SubRun:
+    """
+    One plan being run by a LocalFrofExecutor: its own plan, or a nested one.
+
+    """
+
+    def __init__(
+        self,
+        run_state: RunState,
+        env: dict,
+        prefix: str = "",
+        parent: "_SubRun" = None,
+        parent_job: str = None,
+    ) -> None:
+        """
+        Create a new _SubRun.
+
+        Arguments:
+            run_state (RunState): The state of the plan's run
+            env (dict): The FROF_* variables of the run
+            prefix (str: ""): Prepended to the plan's job names in journals,
+                logs, and the cache, e.g. "child/"
+            parent (_SubRun: None): The run whose job runs this plan
+            parent_job (str: None): The name of the job that runs this plan
+
+        Returns:
+            None
+
+        """
+        self.run_state = run_state
+        self.env = env
+        self.prefix = prefix
+        self.parent = parent
+        self.parent_job = parent_job
+        self.itercounter = 0
+        self.record_digests = {}
+        self.upstream_key = None
+
+
+class _RunLoop:
+    """
+    The scheduler of one run of a LocalFrofExecutor.
+
+    LocalFrofExecutor.execute() checks and sets up the run, then hands it to
+    a _RunLoop, which holds what changes as the run goes on (the jobs that
+    are running, the free resources and tokens, the retries that are due,
+    the first failure, ...). Each step of the loop is a method of its own:
+    dispatch() starts what it can, next_completion() waits for a job to
+    finish, and handle_completion() deals with it.
+
+    """
+
+    def __init__(
+        self,
+        fe: "LocalFrofExecutor",
+        env: dict,
+        journal: RunJournal = None,
+        finished_before: set = None,
+    ) -> None:
+        """
+        Create the scheduler of a run.
+
+        Arguments:
+            fe (LocalFrofExecutor): The executor, whose run_id, run_state,
+                snapshot, and metrics are already those of the new run
+            env (dict): The FROF_* variables of the run
+            journal (RunJournal: None): The run's journal, if it keeps one
+            finished_before (set: None): The names of the jobs that already
+                finished, in the run that this run resumes
+
+        Returns:
+            None
+
+        """
+        self.fe = fe
+        self.env = env
+        self.journal = journal
+        self.finished_before = finished_before or set()
+        self.snapshot = fe.snapshot
+        self.metrics = fe.metrics
+        self.max_jobs = fe.max_jobs
+        self.keep_going = fe.keep_going
+
+        self.subruns = fe._subruns = [_SubRun(fe.run_state, env)]
+        # The job counts of nested runs that have completed:
+        self.retired = [0, 0]
+        self.active = 0
+        self.seq = 0
+        self.failure = None
+        # The names of the jobs that failed (for good, after any retries):
+        self.failed_jobs = []
+        self.cache_keys = {}
+        # Each running job's (job, job_env), to run it again if it fails; how
+        # many times each job has failed; and a heap of (time due, order,
+        # run, job name) of the failed jobs that are waiting to be retried:
+        self.submitted = {}
+        self.attempts = {}
+        self.delayed = []
+        self.retry_order = itertools.count()
+        # The token held by each running job (None for the implicit token):
+        self.tokens = None
+        self.owns_tokens = False
+        self.held_tokens = {}
+        self.implicit_busy = False
+        self.token = None
+        # The resources that are free, and those held by each running job:
+        self.available = dict(fe.resources)
+        self.held_resources = {}
+        # Backends are started on first use. Most jobs run on fe.backend,
+        # but some kinds of job (like PythonJobs) ask for a backend of their
+        # own:
+        self.backends = {}
+        # Workers push (run, job name, exception or None, usage, end time)
+        # here when they finish:
+        self.completions = queue.Queue()
+        self.started_at = {}
+        self.log_index = None
+        self.run_log_dir = None
+        self.refresher = None
+        # Time spent waiting for jobs to finish, as opposed to scheduling:
+        self.waiting = 0.0
+        self.execute_start = time.perf_counter()
+
+    def setup(self) -> None:
+        """
+        Open the run's log index, start redrawing its status monitor, and
+        join (or create) its token pool.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        fe = self.fe
+        if fe.log_dir:
+            self.run_log_dir = os.path.join(os.path.expanduser(fe.log_dir), fe.run_id)
+            os.makedirs(self.run_log_dir, exist_ok=True)
+            self.log_index = open(os.path.join(self.run_log_dir, "index.tsv"), "a")
+        fe.status_monitor.launch_status()
+        self.refresher = StatusRefresher(fe.status_monitor, self.snapshot)
+
+        if os.getenv(TOKEN_POOL_VAR):
+            try:
+                self.tokens = TokenPool(os.getenv(TOKEN_POOL_VAR))
+            except FileNotFoundError:
+                # The run that made the pool has ended; there's nothing to share.
+                pass
+        elif fe.token_dir:
+            # This process's own implicit token is the max_jobs-th one:
+            self.tokens = TokenPool.create(fe.run_id, self.max_jobs - 1, fe.token_dir)
+            self.owns_tokens = True
+        if self.tokens is not None:
+            self.env[TOKEN_POOL_VAR] = self.tokens.path
+
+        # The job counts and the gauges are only worked out when someone reads
+        # them (from any thread), not as each job starts or finishes:
+        self.snapshot.track_progress(self.progress)
+        self.metrics.collect = self.collect_gauges
+
+    def run(self) -> None:
+        """
+        Run the plan to the end, as LocalFrofExecutor.execute() describes.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        previous_sigterm = _exit_on_sigterm()
+        try:
+            self.setup()
+            while True:
+                waiting_for_token = self.dispatch()
+                retrying = self.delayed and self.may_start()
+                if not self.active and not retrying:
+                    break
+
+                timeout = _TOKEN_POLL_INTERVAL if waiting_for_token else None
+                if retrying and self.delayed[0][0] > time.monotonic():
+                    due = self.delayed[0][0] - time.monotonic()
+                    timeout = due if timeout is None else min(timeout, due)
+                completion = self.next_completion(timeout)
+                if completion is not None:
+                    self.handle_completion(*completion)
+
+        except BaseException:
+            # Interrupted (or broken): don't leave any job running.
+            for backend in self.backends.values():
+                backend.kill()
+            kill_running_jobs()
+            raise
+        finally:
+            if previous_sigterm is not None:
+                signal.signal(signal.SIGTERM, previous_sigterm)
+            self.close()
+
+        self.snapshot.set_progress(*self.progress(), finished=True)
+        self.fe.status_monitor.emit_status()
+        if self.failure is not None:
+            if self.keep_going:
+                names = ", ".join(self.failed_jobs[:10])
+                if len(self.failed_jobs) > 10:
+                    names += f", and {len(self.failed_jobs) - 10} more"
+                print(
+                    f"\nfrof: {len(self.failed_jobs)} job(s) failed: {names}. "
+                    "Every job that doesn't depend on them has finished.",
+                    file=sys.stderr,
+                )
+            raise self.failure
+
+    def close(self) -> None:
+        """
+        Close everything that the run opened, and record how it went.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        fe = self.fe
+        ok = self.failure is None and fe.run_state.is_complete()
+        if self.refresher is not None:
+            self.refresher.stop()
+        for backend in self.backends.values():
+            backend.close()
+        if fe.cache is not None:
+            fe.cache.save()
+        if self.journal is not None:
+            # A run that succeeded has nothing left to resume:
+            self.journal.close(remove=ok)
+        if self.log_index is not None:
+            self.log_index.close()
+        if self.tokens is not None:
+            self.tokens.close(remove=self.owns_tokens)
+        if fe.history is not None:
+            fe.history.finish_run(
+                fe.run_id,
+                ok=ok,
+                scheduler=time.perf_counter() - self.execute_start - self.waiting,
+            )
+        self.snapshot.set_progress(*self.progress())
+        self.collect_gauges()
+        self.metrics.collect = None
+        if fe.metrics_file:
+            with open(os.path.expanduser(fe.metrics_file), "w") as fh:
+                fh.write(self.metrics.render())
+
+    def may_start(self) -> bool:
+        # Whether new jobs (and retries) may still start:
+        return self.failure is None or self.keep_going
+
+    def fits(self, record: "JobRecord") -> bool:
+        """
+        Find out whether one of a record's jobs fits in the free resources.
+
+        Arguments:
+            record (JobRecord): The record
+
+        Returns:
+            bool: True if every resource it declares is free
+
+        """
+        available = self.available
+        return all(available.get(k, 0) >= v for k, v in record.resources.items())
+
+    def backend_for(self, job: "Job") -> Backend:
+        """
+        Get the backend that a job runs on, starting it if it's the first.
+
+        Arguments:
+            job (Job): The job
+
+        Returns:
+            Backend: The backend
+
+        """
+        backend = self.fe._backend_class(job)
+        if backend not in self.backends:
+            completions = self.completions
+            self.backends[backend] = self.fe._start_backend(
+                backend,
+                lambda key, error, usage: completions.put(
+                    (*key, error, usage, time.time())
+                ),
+            )
+        return self.backends[backend]
+
+    def progress(self) -> Tuple[int, int]:
+        """
+        Count the jobs of the run, and those that are done.
+
+        Called by the status snapshot, from any thread.
+
+        Arguments:
+            None
+
+        Returns:
+            Tuple[int, int]: (total, done), for StatusSnapshot.set_progress
+
+        """
+        runs = [sub.run_state for sub in list(self.subruns)]
+        return (
+            self.retired[0] + sum(len(run_state) for run_state in runs),
+            self.retired[1] + sum(run_state.done_count for run_state in runs),
+        )
+
+    def collect_gauges(self) -> None:
+        # Called by Metrics.render(), from any thread:
+        metrics = self.metrics
+        metrics.jobs_running.set(self.active)
+        metrics.ready_records.set(
+            sum(sub.run_state.ready_count() for sub in list(self.subruns))
+        )
+        metrics.completion_queue.set(self.completions.qsize())
+
+    def take_token(self) -> bool:
+        """
+        Make sure that this process may start another job.
+
+        It may if its own implicit token is free, or if it holds (or can
+        get) a token from the shared pool.
+
+        Arguments:
+            None
+
+        Returns:
+            bool: Whether another job may start
+
+        """
+        if self.tokens is None or not self.implicit_busy or self.token is not None:
+            return True
+        self.token = self.tokens.acquire()
+        return self.token is not None
+
+    def dispatch(self) -> bool:
+        """
+        Start as many jobs as may start: first retries that are due, then
+        ready jobs of each (possibly nested) run.
+
+        Arguments:
+            None
+
+        Returns:
+            bool: Whether jobs are waiting for a token from the shared pool
+
+        """
+        dispatched = True
+        waiting_for_token = False
+        while self.may_start() and self.active < self.max_jobs and dispatched:
+            dispatched = False
+            # Failed jobs whose retry is due go before new jobs:
+            delayed = self.delayed
+            while delayed and delayed[0][0] <= time.monotonic():
+                _, _, sub, i = delayed[0]
+                r, _ = sub.run_state.instance_of(i)
+                if self.active >= self.max_jobs or not self.fits(
+                    sub.run_state.records[r]
+                ):
+                    break
+                if not self.take_token():
+                    waiting_for_token = True
+                    break
+                heapq.heappop(delayed)
+                self.submit(sub, i, *self.submitted[sub.prefix + i])
+                dispatched = True
+            for sub in list(self.subruns):
+                if self.active >= self.max_jobs:
+                    break
+                if not self.take_token():
+                    waiting_for_token = True
+                    break
+                next_job = sub.run_state.pop_ready(self.fits)
+                if next_job is None:
+                    continue
+                dispatched = True
+                if not self.start(sub, *next_job):
+                    break
+        if self.token is not None:
+            self.tokens.release(self.token)
+            self.token = None
+        return waiting_for_token
+
+    def start(self, sub: _SubRun, i: str, job: "Job") -> bool:
+        """
+        Start a job that the run state handed out, unless it can be skipped.
+
+        Jobs that finished in the run being resumed, and jobs whose result is
+        in the cache, are skipped. Jobs that run another .frof file start a
+        nested run instead.
+
+        Arguments:
+            sub (_SubRun): The (possibly nested) run that the job is part of
+            i (str): The name of the job
+            job (Job): The job
+
+        Returns:
+            bool: False if the job failed to start (only a nested plan can)
+
+        """
+        fe = self.fe
+        name = sub.prefix + i
+        job_env = {
+            **sub.env,
+            "FROF_BATCH_ITER": str(sub.itercounter),
+            "FROF_JOB_NAME": str(i),
+            "HOME": _HOME,
+        }
+        if name in self.finished_before:
+            key = None
+            if fe.cache is not None:
+                key = fe._cache_key(sub, i, job, job_env)
+            self.snapshot.job_skipped(name)
+            self.metrics.jobs_skipped.inc()
+            self.finish(sub, i, key)
+            return True
+        if isinstance(job, FrofJob):
+            if self.journal is not None:
+                self.journal.record(STARTED, name)
+            try:
+                self.start_nested(sub, i, job, job_env)
+            except Exception as e:
+                if self.journal is not None:
+                    self.journal.record(FAILED, name)
+                sub.run_state.fail(i)
+                self.failure = self.failure or e
+                self.failed_jobs.append(name)
+                return False
+            sub.itercounter += 1
+            return True
+        if fe.cache is not None:
+            key = fe._cache_key(sub, i, job, job_env)
+            r, value = sub.run_state.instance_of(i)
+            record = sub.run_state.records[r]
+            outputs = [record.interpolate(p, value) for p in record.outputs]
+            if fe.cache.hit(key, outputs):
+                self.snapshot.job_skipped(name)
+                self.metrics.jobs_skipped.inc()
+                self.finish(sub, i, key)
+                return True
+            self.cache_keys[name] = key
+        r, _ = sub.run_state.instance_of(i)
+        self.metrics.schedule_latency.observe(
+            time.monotonic() - sub.run_state.ready_since[r]
+        )
+        self.submit(sub, i, job, job_env)
+        sub.itercounter += 1
+        return True
+
+    def start_nested(self, sub: _SubRun, i: str, job: FrofJob, job_env: dict) -> None:
+        """
+        Start running the plan of a `frof child.frof` job, inline.
+
+        Arguments:
+            sub (_SubRun): The run that the job is part of
+            i (str): The name of the job
+            job (FrofJob): The job
+            job_env (dict): The environment the job would run with
+
+        Returns:
+            None
+
+        """
+        fe = self.fe
+        plan = fe._nested_plan(job.path)
+        fe._check_resources(plan)
+        # Derived from the outer run, so that a resumed run's nested runs
+        # keep their FROF_RUN_IDs:
+        nested_run_id = str(
+            uuid.uuid5(uuid.NAMESPACE_URL, f"{sub.env['FROF_RUN_ID']}/{i}")
+        )
+        nested_env = _nested_env(sub.env, nested_run_id, plan.plan_id)
+        nested = _SubRun(
+            RunState(plan, fe._durations(nested_env["FROF_PLAN_ID"])),
+            nested_env,
+            prefix=f"{sub.prefix}{i}/",
+            parent=sub,
+            parent_job=i,
+        )
+        if fe.cache is not None:
+            nested.upstream_key = fe._cache_key(sub, i, job, job_env)
+        self.subruns.append(nested)
+        self.close_if_complete(nested)
+
+    def submit(self, sub: _SubRun, i: str, job: "Job", job_env: dict) -> None:
+        """
+        Hand a job to its backend, with the token and resources it holds.
+
+        Arguments:
+            sub (_SubRun): The (possibly nested) run that the job is part of
+            i (str): The name of the job
+            job (Job): The job
+            job_env (dict): The environment to run the job with
+
+        Returns:
+            None
+
+        """
+        fe = self.fe
+        name = sub.prefix + i
+        if self.journal is not None:
+            self.journal.record(STARTED, name)
+        r, _ = sub.run_state.instance_of(i)
+        record = sub.run_state.records[r]
+        run_args = {}
+        if self.log_index is not None:
+            stem = os.path.join(self.run_log_dir, _log_filename(self.seq, name))
+            run_args = {
+                "stdout_path": stem + ".out",
+                "stderr_path": stem + ".err",
+            }
+            self.log_index.write(f"{name}\t{stem}.out\t{stem}.err\n")
+            self.log_index.flush()
+        timeout = fe.timeout if record.timeout is None else record.timeout
+        if timeout:
+            run_args["timeout"] = timeout
+        self.started_at[name] = time.time()
+        self.submitted[name] = (job, job_env)
+        self.snapshot.job_started(name, job)
+        self.metrics.jobs_started.inc()
+        self.backend_for(job).submit((sub, i), job, job_env, run_args)
+        self.held_tokens[name] = self.token
+        if record.resources:
+            self.held_resources[name] = record.resources
+            for k, v in record.resources.items():
+                self.available[k] -= v
+        self.implicit_busy = self.implicit_busy or self.token is None
+        self.token = None
+        self.active += 1
+        self.seq += 1
+
+    def next_completion(self, timeout: float = None) -> Optional[tuple]:
+        """
+        Wait for a job to finish.
+
+        Arguments:
+            timeout (float: None): The most seconds to wait
+
+        Returns:
+            tuple: (run, job name, exception or None, usage, end time), or
+                None if no job finished in time
+
+        """
+        wait_start = time.perf_counter()
+        try:
+            return self.completions.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        finally:
+            self.waiting += time.perf_counter() - wait_start
+
+    def release(self, name: str) -> None:
+        """
+        Give back the token and resources that a finished job held.
+
+        Arguments:
+            name (str): The name of the job (with its run's prefix)
+
+        Returns:
+            None
+
+        """
+        held = self.held_tokens.pop(name)
+        released = self.held_resources.pop(name, None)
+        if released:
+            for k, v in released.items():
+                self.available[k] += v
+            for other in self.subruns:
+                other.run_state.unblock()
+        if held is None:
+            self.implicit_busy = False
+        else:
+            self.tokens.release(held)
+
+    def handle_completion(
+        self, sub: _SubRun, i: str, error: Exception, usage: dict, ended: float
+    ) -> None:
+        """
+        Deal with a job that finished: record it, and then retry it, fail
+        it, or mark it done.
+
+        Arguments:
+            sub (_SubRun): The (possibly nested) run that the job is part of
+            i (str): The name of the job
+            error (Exception): Why the job failed, or None if it succeeded
+            usage (dict): The job's resource usage, from its backend
+            ended (float): When the job ended (time.time())
+
+        Returns:
+            None
+
+        """
+        fe = self.fe
+        self.active -= 1
+        name = sub.prefix + i
+        r, value = sub.run_state.instance_of(i)
+        record = sub.run_state.records[r]
+        started = self.started_at.pop(name)
+        self.metrics.job_duration(record.name, ended - started)
+        if fe.history is not None:
+            fe.history.record(
+                fe.run_id,
+                sub.env["FROF_PLAN_ID"],
+                name,
+                record.name,
+                started,
+                ended,
+                0 if error is None else getattr(error, "returncode", 1),
+                usage=usage,
+                size=len(value) if isinstance(value, ValueChunk) else 1,
+            )
+        self.release(name)
+        attempt = self.attempts.get(name, 0)
+        if error is not None and attempt < record.retries and self.may_start():
+            self.attempts[name] = attempt + 1
+            delay = record.retry_delay * 2**attempt
+            heapq.heappush(
+                self.delayed,
+                (time.monotonic() + delay, next(self.retry_order), sub, i),
+            )
+            self.metrics.jobs_retried.inc()
+            self.snapshot.job_finished(
+                name,
+                retrying=True,
+                error=f"{error} (attempt {attempt + 1} of "
+                f"{record.retries + 1}; retrying in {delay:g}s)",
+            )
+            return
+        del self.submitted[name]
+        self.attempts.pop(name, None)
+        if error is None:
+            self.metrics.jobs_finished.inc()
+        else:
+            self.metrics.jobs_failed.inc()
+        self.snapshot.job_finished(
+            name,
+            failed=error is not None,
+            error=None if error is None else str(error),
+        )
+        key = self.cache_keys.pop(name, None)
+        if self.journal is not None:
+            self.journal.record(FINISHED if error is None else FAILED, name)
+        if error is not None:
+            sub.run_state.fail(i)
+            self.failure = self.failure or error
+            self.failed_jobs.append(name)
+            return
+        if key is not None:
+            fe.cache.store(key, name)
+        self.finish(sub, i, key)
+
+    def finish(self, sub: _SubRun, i: str, key: str = None) -> None:
+        """
+        Mark a job as done, and, if that completes a nested run, its parent.
+
+        Arguments:
+            sub (_SubRun): The (possibly nested) run that the job is part of
+            i (str): The name of the job
+            key (str: None): The job's cache key, if it has one
+
+        Returns:
+            None
+
+        """
+        if key is not None:
+            self.fe._cache_success(sub, i, key)
+        sub.run_state.finish(i)
+        self.close_if_complete(sub)
+
+    def close_if_complete(self, sub: _SubRun) -> None:
+        """
+        Once a nested run is complete, so is the job that ran it.
+
+        Arguments:
+            sub (_SubRun): A (possibly nested) run
+
+        Returns:
+            None
+
+        """
+        if sub.parent is None or not sub.run_state.is_complete():
+            return
+        # (Counted as retired before it is removed, so that the run's progress
+        # never seems to go backwards.)
+        self.retired[0] += len(sub.run_state)
+        self.retired[1] += sub.run_state.done_count
+        self.subruns.remove(sub)
+        if self.journal is not None:
+            self.journal.record(FINISHED, sub.parent.prefix + sub.parent_job)
+        key = None
+        if self.fe.cache is not None:
+            digest = int(sub.upstream_key, 16) + sum(sub.record_digests.values())
+            key = "%064x" % (digest % (1 << 256))
+        self.finish(sub.parent, sub.parent_job, key)
+
 
 class FrofExecutor(abc.ABC):
     """
@@ -37,10 +838,10 @@ class FrofExecutor(abc.ABC):
     def get_next_jobs(self) -> List:
         ...
 
-    def get_current_network(self) -> nx.DiGraph:
+    def get_current_network(self) -> "nx.DiGraph":
         ...
 
-    def get_network(self) -> nx.DiGraph:
+    def get_network(self) -> "nx.DiGraph":
         ...
 
 
@@ -54,9 +855,20 @@ class LocalFrofExecutor(FrofExecutor):
 
     def __init__(
         self,
-        fp: Union["FrofPlan", str, nx.DiGraph],
+        fp: Union["FrofPlan", str, "nx.DiGraph"],
         status_monitor: Callable = NullStatusMonitor,
         max_jobs: int = None,
+        cache: JobCache = None,
+        journal_dir: str = None,
+        log_dir: str = None,
+        token_dir: str = None,
+        backend: Union[str, Callable] = "thread",
+        durations: Dict[str, float] = None,
+        history: JobHistory = None,
+        resources: Dict[str, float] = None,
+        metrics_file: str = None,
+        keep_going: bool = False,
+        timeout: float = None,
     ) -> None:
         """
         Create a new LocalFrofExecutor.
@@ -72,32 +884,102 @@ class LocalFrofExecutor(FrofExecutor):
                 execution. Defaults to the NullStatusMonitor.
             max_jobs (int: None): The maximum number of jobs to run at once.
                 Defaults to the number of CPUs on this machine.
+            cache (JobCache: None): If set, jobs that already succeeded with
+                the same command, environment, inputs, and upstream jobs are
+                skipped, and jobs that succeed are added to the cache.
+            journal_dir (str: None): If set, every run keeps a journal of the
+                jobs it started and finished in this directory, so that it
+                can be resumed with execute(run_id=...) if it dies.
+            log_dir (str: None): If set, each job's stdout and stderr are
+                written to files in <log_dir>/<FROF_RUN_ID>/, and listed in
+                that directory's index.tsv. Otherwise, job stdout is dropped
+                (only its tail is kept, to report failures) and stderr goes
+                to this process's stderr.
+            token_dir (str: None): If set, this run creates a machine-wide
+                pool of max_jobs tokens in this directory, and hands it down
+                to any frof that its jobs start, so that the whole tree of
+                runs never runs more than max_jobs jobs at once. A run that
+                was started by another frof's job always joins that frof's
+                pool, whether or not this is set.
+            backend (str: "thread"): How to run jobs: "thread" (a pool of
+                max_jobs threads), "asyncio" (asyncio subprocesses; cheap
+                enough to run thousands of jobs at once), or "process" (a
+                pool of max_jobs worker processes). You can also pass a
+                Backend subclass. PythonJobs always run on the "process"
+                backend.
+            durations (Dict[str, float]: None): Expected seconds per job, by
+                the name of the job in the plan (e.g. from earlier runs).
+                When more jobs are ready than can run, those with the longest
+                expected path to the end of the run start first.
+            history (JobHistory: None): If set, the start and end time, exit
+                code, CPU time, and peak memory of every job is recorded in
+                it, and (unless durations are given) each plan's durations
+                are taken from its earlier runs in the history.
+            resources (Dict[str, float]: None): How much of each resource
+                there is for jobs to share, e.g. {"gpu_license": 2}. Defaults
+                to this machine's cpus and mem (in MB), and none of any other
+                resource. Jobs only start when there is enough left of every
+                resource they declare (as well as a free max_jobs slot).
+            metrics_file (str: None): If set, the run's metrics are written
+                to this file, in the OpenMetrics text format, when it ends.
+            keep_going (bool: False): If a job fails (after any retries),
+                keep starting every job that doesn't depend on it, instead
+                of starting no new jobs; the first failure is still raised
+                at the end.
+            timeout (float: None): Kill any job (with its whole process
+                group) that runs longer than this many seconds, unless it
+                has a timeout option of its own. A job that is killed fails
+                (or is retried, if it has retries).
 
         """
-        self.current_network = nx.DiGraph()
         if isinstance(fp, FrofPlan):
             self.fp = fp
         else:
             self.fp = FrofPlan(fp)
 
         self.max_jobs = max_jobs if max_jobs else os.cpu_count()
+        self.cache = cache
+        self.journal_dir = journal_dir
+        self.log_dir = log_dir
+        self.token_dir = token_dir
+        self.backend = BACKENDS[backend] if isinstance(backend, str) else backend
+        self.durations = durations
+        self.history = history
+        self.resources = {**machine_resources(), **(resources or {})}
+        self.run_state = RunState(self.fp, self.durations)
+        self._subruns = [_SubRun(self.run_state, {})]
+        # The FROF_RUN_ID of the latest run, and the path of its journal (if
+        # it got as far as opening one):
+        self.run_id = None
+        self.journal_path = None
 
+        self.metrics_file = metrics_file
+        self.keep_going = keep_going
+        self.timeout = timeout
+        self.metrics = Metrics()
+        self.snapshot = StatusSnapshot()
         self.status_monitor = status_monitor(self)
 
-    def get_current_network(self) -> nx.DiGraph:
+    def get_current_network(self) -> "nx.DiGraph":
         """
-        Get a pointer to the current_network of this execution.
+        Get a read-only view of the jobs that have not finished yet.
+
+        This is a filtered view onto the plan's network, not a copy; but it
+        costs O(jobs) to build (and expands the plan into a networkx graph
+        the first time), so prefer get_run_state for bookkeeping.
 
         Arguments:
             None
 
         Returns:
-            nx.DiGraph: The current (mutable) network of this execution
+            nx.DiGraph: The unfinished part of the network of this execution
 
         """
-        return self.current_network
+        return self.fp.network.subgraph(
+            [i for i, _, _ in self.run_state.unfinished()]
+        )
 
-    def get_network(self) -> nx.DiGraph:
+    def get_network(self) -> "nx.DiGraph":
         """
         Get a pointer to the unchanged, original network plan.
 
@@ -110,13 +992,58 @@ class LocalFrofExecutor(FrofExecutor):
         """
         return self.fp.network
 
+    def get_run_state(self) -> RunState:
+        """
+        Get the state of the current (or most recent) run of the plan.
+
+        Arguments:
+            None
+
+        Returns:
+            RunState: Per-job status and scheduling state for this execution
+
+        """
+        return self.run_state
+
+    def get_status_snapshot(self) -> StatusSnapshot:
+        """
+        Get the status summary of the current (or most recent) run.
+
+        Unlike get_run_state, this is safe and cheap to read from any thread
+        while the run goes on.
+
+        Arguments:
+            None
+
+        Returns:
+            StatusSnapshot: Counters and recent job state changes of the run
+
+        """
+        return self.snapshot
+
+    def get_metrics(self) -> Metrics:
+        """
+        Get the metrics of the current (or most recent) run.
+
+        Like the status snapshot, they are safe and cheap to read from any
+        thread while the run goes on.
+
+        Arguments:
+            None
+
+        Returns:
+            Metrics: Job counters, scheduling gauges, and duration histograms
+
+        """
+        return self.metrics
+
     def get_next_jobs(self) -> List:
         """
-        Get a list of the next jobs to run.
+        Get a list of the jobs that are currently running.
 
-        If a job belongs to a parallelism group that has a max_parallel_count,
-        this function will only return the first max_parallel_count jobs from
-        that group (but an unlimited number of jobs from nongroups).
+        This reads the scheduler's bookkeeping directly, so it costs
+        O(max_jobs) regardless of the size of the plan. Jobs of nested plans
+        are listed under "<outer job name>/<job name>".
 
         Arguments:
             None
@@ -125,69 +1052,235 @@ class LocalFrofExecutor(FrofExecutor):
             Tuple[str, FrofJob]: (Job Name, Job Object)
 
         """
-        jobs = [
-            (i, j)
-            for i, j in self.current_network.nodes(data=True)
-            if self.current_network.in_degree(i) == 0
+        return [
+            (sub.prefix + i, job)
+            for sub in self._subruns
+            for i, job in sub.run_state.running.items()
+            if not isinstance(job, FrofJob)
         ]
 
-        parallelism_groups = {}
-
-        result_jobs = []
-        for i, job in jobs:
-            if job.get("parallelism_group", None):
-                if "max_parallel_count" in job and job.get("max_parallel_count"):
-                    mpc = int(job.get("max_parallel_count", MAX_PARALLEL))
-                else:
-                    mpc = MAX_PARALLEL
-                parallelism_groups[job["parallelism_group"]] = (
-                    parallelism_groups.get(job["parallelism_group"], 0) + 1
-                )
-                if parallelism_groups[job["parallelism_group"]] <= mpc:
-                    result_jobs.append((i, job["job"]))
-            else:
-                result_jobs.append((i, job["job"]))
-        return result_jobs
+    def _cache_key(self, sub: "_SubRun", i: str, job: "Job", env: dict) -> str:
+        """
+        Compute the cache key of a job that is about to run.
+
+        Arguments:
+            sub (_SubRun): The (possibly nested) run that the job is part of
+            i (str): The name of the job
+            job (Job): The job
+            env (dict): The environment the job will run with
+
+        Returns:
+            str: The job's key in self.cache
 
-    def execute(self) -> None:
         """
-        Execute the FrofPlan locally, using the current shell.
+        run_state = sub.run_state
+        r, value = run_state.instance_of(i)
+        record = run_state.records[r]
+        upstream = [
+            "%064x" % sub.record_digests.get(p, 0)
+            for p in run_state.plan.predecessors(r)
+        ]
+        if sub.upstream_key and not upstream:
+            upstream = [sub.upstream_key]
+        return self.cache.key(
+            job.fingerprint(),
+            referenced_env(getattr(job, "cmd", ""), env),
+            [record.interpolate(p, value) for p in record.inputs],
+            upstream,
+        )
+
+    def _cache_success(self, sub: "_SubRun", i: str, key: str) -> None:
+        """
+        Fold the key of a successful job into its record's digest.
+
+        The digest of a record is the sum of its jobs' keys, so it does not
+        depend on the order the jobs finished in, and takes O(1) memory.
+
+        Arguments:
+            sub (_SubRun): The (possibly nested) run that the job is part of
+            i (str): The name of the job
+            key (str): The job's cache key
+
+        Returns:
+            None
+
+        """
+        r, _ = sub.run_state.instance_of(i)
+        sub.record_digests[r] = (sub.record_digests.get(r, 0) + int(key, 16)) % (
+            1 << 256
+        )
+
+    def _nested_plan(self, path: str) -> FrofPlan:
+        """
+        Get the plan of a nested .frof file, parsing each file only once.
+
+        Arguments:
+            path (str): The path of the .frof file, relative to the working
+                directory
+
+        Returns:
+            FrofPlan: The parsed plan
+
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        if path not in self._nested_plans:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"No such .frof file: {path}")
+            self._nested_plans[path] = FrofPlan(path)
+        return self._nested_plans[path]
+
+    def _durations(self, plan_id: str) -> Dict[str, float]:
+        """
+        Get the expected duration of the jobs of a plan, for prioritizing.
 
         Arguments:
+            plan_id (str): The FROF_PLAN_ID that the plan's jobs are recorded
+                under in the history (for a nested plan, the combined ID)
+
+        Returns:
+            Dict[str, float]: Seconds per job, by job name (or None)
+
+        """
+        if self.durations is not None or self.history is None:
+            return self.durations
+        return self.history.durations(plan_id)
+
+    def _backend_class(self, job: "Job") -> type:
+        """
+        Get the kind of backend that a job runs on.
+
+        Arguments:
+            job (Job): The job
+
+        Returns:
+            type: The Backend subclass
+
+        """
+        return BACKENDS.get(getattr(job, "backend", None), self.backend)
+
+    def _start_backend(self, backend: type, done: DoneCallback) -> Backend:
+        """
+        Start a backend, the first time that one of its jobs is submitted.
+
+        Arguments:
+            backend (type): The Backend subclass
+            done (DoneCallback): The callback for the backend's jobs
+
+        Returns:
+            Backend: The backend
+
+        """
+        return backend(self.max_jobs, done)
+
+    def _check_resources(self, plan: "FrofPlan") -> None:
+        """
+        Make sure that each job of a plan could ever get the resources it needs.
+
+        Arguments:
+            plan (FrofPlan): This executor's plan, or a nested plan
+
+        Returns:
             None
 
+        """
+        for record in plan.compact.records:
+            for name, amount in record.resources.items():
+                if amount > self.resources.get(name, 0):
+                    raise ValueError(
+                        f"Job '{record.name}' needs {amount:g} {name}, but there "
+                        f"are only {self.resources.get(name, 0):g} to share"
+                    )
+
+    def execute(self, run_id: str = None) -> None:
+        """
+        Execute the FrofPlan locally, using the current shell.
+
+        Jobs are handed to a pool of max_jobs workers. As soon as a job
+        finishes, any successor whose last dependency it was is started; there
+        is no barrier between "waves" of jobs.
+
+        Jobs that only run another .frof file (`frof child.frof`) are not run
+        in a new frof process. The nested plan gets its own RunState, and its
+        jobs are scheduled alongside this plan's, sharing the same max_jobs.
+        They see the same FROF_* variables as they would in a new process.
+
+        A failed job with a retries option is run again after its retry_delay
+        (doubling each time), without holding a slot while it waits. If a job
+        fails for good, no new jobs are started; jobs that are already running
+        are allowed to finish, and then the failure is raised. With
+        keep_going, every job that doesn't depend on a failed job is run
+        first.
+
+        If the run is interrupted (Ctrl-C or SIGTERM), the jobs that are
+        running are killed, each with its whole process group, before the
+        exception is raised.
+
+        Arguments:
+            run_id (str: None): The FROF_RUN_ID to use (letters, digits, _
+                and -). If this executor has a journal_dir and there is a
+                journal for this run ID, the run is resumed: jobs that the
+                journal lists as finished are not run again. Defaults to a
+                new, random run ID.
+
         Returns:
             None
 
         """
-        run_id = str(uuid.uuid4())
-        self.current_network = copy.deepcopy(self.fp.network)
-        self.status_monitor.launch_status()
+        run_id = check_run_id(run_id) if run_id else str(uuid.uuid4())
+        self.run_id = run_id
+        self.journal_path = None
+        self._check_resources(self.fp)
+        journal = None
+        finished_before = set()
+        if self.journal_dir:
+            try:
+                header, finished_before = read_journal(run_id, self.journal_dir)
+            except FileNotFoundError:
+                pass
+            else:
+                if header.get("plan_id") != self.fp.plan_id:
+                    raise ValueError(
+                        f"Run {run_id} was a run of a different plan; cannot resume it."
+                    )
+            journal = RunJournal(
+                run_id,
+                self.journal_dir,
+                header={
+                    "plan_id": self.fp.plan_id,
+                    "frof_file": self.fp.source,
+                    "cwd": os.getcwd(),
+                    "started": datetime.now().isoformat(),
+                },
+            )
+            self.journal_path = journal.path
         env = {
             "FROF_RUN_ID": run_id,
             "FROF_PLAN_ID": self.fp.plan_id,
             "FROF_VERSION": __version__,
         }
-        if os.getenv("FROF_PARENT_PLAN_ID"):
-            env["FROF_PARENT_PLAN_ID"] = os.getenv("FROF_PARENT_PLAN_ID")
-            env["FROF_PARENT_RUN_ID"] = os.getenv("FROF_PARENT_RUN_ID")
-            env["FROF_PLAN_ID"] = "{}--{}".format(
-                os.getenv("FROF_PARENT_PLAN_ID"), self.fp.plan_id
+        if os.getenv("FROF_PLAN_ID") and os.getenv("FROF_RUN_ID"):
+            # This plan is being run by a job of another plan:
+            env = _nested_env(os.environ, run_id, self.fp.plan_id)
+        self.run_state = RunState(self.fp, self._durations(env["FROF_PLAN_ID"]))
+        self._nested_plans = {}
+        self.snapshot.reset(run_id)
+        self.metrics.reset()
+        self.metrics.max_jobs.set(self.max_jobs)
+        if self.history is not None:
+            records = self.fp.compact.records
+            self.history.start_run(
+                run_id,
+                env["FROF_PLAN_ID"],
+                frof_file=self.fp.source,
+                max_jobs=self.max_jobs,
+                backend=next(
+                    (k for k, v in BACKENDS.items() if v is self.backend),
+                    self.backend.__name__,
+                ),
+                edges=[
+                    (records[u].name, records[v].name)
+                    for u in range(len(records))
+                    for v in self.fp.compact.successors(u)
+                ],
             )
-        while len(self.current_network):
-            current_jobs = self.get_next_jobs()
-            Parallel(n_jobs=self.max_jobs)(
-                delayed(job.run)(
-                    env_vars={
-                        **env,
-                        "FROF_BATCH_ITER": str(itercounter),
-                        "FROF_JOB_NAME": str(i),
-                        "HOME": _HOME
-                    }
-                )
-                for itercounter, (i, job) in enumerate(current_jobs)
-            )
-
-            for (i, _) in current_jobs:
-                self.current_network.remove_node(i)
-            self.status_monitor.emit_status()
+        _RunLoop(self, env, journal, finished_before).run()
@@ -0,0 +1,438 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_HOME = os.path.expanduser("~")
+
+DEFAULT_HISTORY_DIR = os.path.join(_HOME, ".frof", "history")
+
+# Keep the job records of this many runs of each plan:
+DEFAULT_KEEP_RUNS = 50
+
+# Job records are written in batches of this many:
+_BATCH_SIZE = 1000
+
+
+class JobHistory:
+    """
+    A record of how long each job took, and what it used, in past runs.
+
+    For every job that a run starts, the history keeps its start and end
+    times, its exit code, and (when the job reports it) its CPU time and
+    peak memory. Records are keyed by plan ID and job name, so that later
+    runs of the same plan can estimate how long their jobs will take, and
+    `frof profile` can report where a run's time went.
+
+    The history is a single SQLite file. Only the most recent keep_runs runs
+    of each plan are kept.
+
+    """
+
+    def __init__(self, history_dir: str = None, keep_runs: int = None) -> None:
+        """
+        Create (or open) a JobHistory.
+
+        Arguments:
+            history_dir (str: ~/.frof/history): Where to keep the history
+            keep_runs (int: 50): How many runs of each plan to keep
+
+        Returns:
+            None
+
+        """
+        self.history_dir = os.path.expanduser(history_dir or DEFAULT_HISTORY_DIR)
+        self.keep_runs = keep_runs or DEFAULT_KEEP_RUNS
+        os.makedirs(self.history_dir, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(self.history_dir, "history.sqlite"), check_same_thread=False
+        )
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                plan_id TEXT NOT NULL,
+                frof_file TEXT,
+                max_jobs INTEGER,
+                backend TEXT,
+                edges TEXT,
+                started REAL NOT NULL,
+                ended REAL,
+                scheduler REAL,
+                ok INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS runs_plan ON runs (plan_id, started);
+            CREATE TABLE IF NOT EXISTS jobs (
+                run_id TEXT NOT NULL,
+                plan_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                record TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                started REAL NOT NULL,
+                ended REAL NOT NULL,
+                exit_code INTEGER NOT NULL,
+                cpu REAL,
+                maxrss INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS jobs_run ON jobs (run_id);
+            CREATE INDEX IF NOT EXISTS jobs_plan ON jobs (plan_id, record);
+            """
+        )
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def start_run(
+        self,
+        run_id: str,
+        plan_id: str,
+        frof_file: str = None,
+        max_jobs: int = None,
+        backend: str = None,
+        edges: Iterable[Tuple[str, str]] = (),
+    ) -> None:
+        """
+        Record the start of a run.
+
+        A resumed run keeps its original start time.
+
+        Arguments:
+            run_id (str): The FROF_RUN_ID of the run
+            plan_id (str): The FROF_PLAN_ID of the plan
+            frof_file (str: None): The .frof file of the plan
+            max_jobs (int: None): How many jobs the run may run at once
+            backend (str: None): The name of the run's backend
+            edges (Iterable[Tuple[str, str]]): The plan's dependencies, as
+                (upstream, downstream) job names
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO runs (run_id, plan_id, frof_file, max_jobs, "
+                "backend, edges, started) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id,
+                    plan_id,
+                    frof_file,
+                    max_jobs,
+                    backend,
+                    json.dumps(list(edges)),
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def record(
+        self,
+        run_id: str,
+        plan_id: str,
+        name: str,
+        record: str,
+        started: float,
+        ended: float,
+        exit_code: int,
+        usage: dict = None,
+        size: int = 1,
+    ) -> None:
+        """
+        Record a job that finished (successfully or not).
+
+        Arguments:
+            run_id (str): The FROF_RUN_ID of the run
+            plan_id (str): The FROF_PLAN_ID of the job's plan
+            name (str): The name of the job, e.g. "count_base_A"
+            record (str): The name of the job in the plan, e.g. "count_base"
+            started (float): When the job started (seconds since the epoch)
+            ended (float): When the job finished
+            exit_code (int): 0 if the job succeeded
+            usage (dict: None): cpu (seconds) and maxrss (KiB), if known
+            size (int: 1): How many values of its sweep the job ran
+
+        Returns:
+            None
+
+        """
+        usage = usage or {}
+        row = (
+            run_id,
+            plan_id,
+            name,
+            record,
+            size,
+            started,
+            ended,
+            exit_code,
+            usage.get("cpu"),
+            usage.get("maxrss"),
+        )
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= _BATCH_SIZE:
+                self._flush()
+
+    def _flush(self) -> None:
+        # Must hold self._lock.
+        if self._pending:
+            self._db.executemany(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._pending
+            )
+            self._db.commit()
+            self._pending = []
+
+    def finish_run(self, run_id: str, ok: bool, scheduler: float = None) -> None:
+        """
+        Record the end of a run, and forget the oldest runs of its plan.
+
+        Arguments:
+            run_id (str): The FROF_RUN_ID of the run
+            ok (bool): Whether every job succeeded
+            scheduler (float: None): Seconds that the scheduler spent busy
+                (not waiting for jobs to finish)
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._flush()
+            self._db.execute(
+                "UPDATE runs SET ended = ?, ok = ?, "
+                "scheduler = COALESCE(scheduler, 0) + ? WHERE run_id = ?",
+                (time.time(), int(ok), scheduler or 0.0, run_id),
+            )
+            old = self._db.execute(
+                "SELECT run_id FROM runs WHERE plan_id = "
+                "(SELECT plan_id FROM runs WHERE run_id = ?) "
+                "ORDER BY started DESC LIMIT -1 OFFSET ?",
+                (run_id, self.keep_runs),
+            ).fetchall()
+            for (old_run_id,) in old:
+                self._db.execute("DELETE FROM jobs WHERE run_id = ?", (old_run_id,))
+                self._db.execute("DELETE FROM runs WHERE run_id = ?", (old_run_id,))
+            self._db.commit()
+
+    def durations(self, plan_id: str) -> Dict[str, float]:
+        """
+        Get the mean duration of the successful jobs of a plan in past runs.
+
+        Arguments:
+            plan_id (str): The FROF_PLAN_ID of the plan
+
+        Returns:
+            Dict[str, float]: Seconds per value, by the name of the job (or
+                sweep) in the plan
+
+        """
+        with self._lock:
+            return dict(
+                self._db.execute(
+                    "SELECT record, AVG((ended - started) / size) FROM jobs "
+                    "WHERE plan_id = ? AND exit_code = 0 GROUP BY record",
+                    (plan_id,),
+                ).fetchall()
+            )
+
+    def last_run_id(self) -> Optional[str]:
+        """
+        Get the FROF_RUN_ID of the run that started most recently.
+
+        Arguments:
+            None
+
+        Returns:
+            str: The run ID, or None if the history is empty
+
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT run_id FROM runs ORDER BY started DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def run(self, run_id: str) -> Tuple[dict, List[dict]]:
+        """
+        Get everything that the history knows about a run.
+
+        Arguments:
+            run_id (str): The FROF_RUN_ID of the run
+
+        Returns:
+            Tuple[dict, List[dict]]: (The run, its jobs in order of start)
+
+        """
+        with self._lock:
+            self._flush()
+            cursor = self._db.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+            row = cursor.fetchone()
+            if row is None:
+                raise KeyError(f"No run {run_id} in the history")
+            run = dict(zip([c[0] for c in cursor.description], row))
+            run["edges"] = json.loads(run["edges"] or "[]")
+            cursor = self._db.execute(
+                "SELECT * FROM jobs WHERE run_id = ? ORDER BY started", (run_id,)
+            )
+            columns = [c[0] for c in cursor.description]
+            jobs = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return run, jobs
+
+    def close(self) -> None:
+        """
+        Write any buffered records, and close the history.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._flush()
+        self._db.close()
+
+
+def _critical_path(run: dict, jobs: List[dict]) -> List[Tuple[str, float, float]]:
+    """
+    Find the chain of jobs that the end of a run waited on.
+
+    Starting from the job (or sweep) that finished last, each step goes to
+    the dependency that finished last, since that is the one that held it up.
+    Only the jobs of the run's own plan are considered, not nested plans.
+
+    Arguments:
+        run (dict): The run, from JobHistory.run
+        jobs (List[dict]): Its jobs, from JobHistory.run
+
+    Returns:
+        List[Tuple[str, float, float]]: (job name in the plan, first start,
+            last end) along the path, from the start of the run to the end
+
+    """
+    spans = {}
+    for job in jobs:
+        if job["plan_id"] != run["plan_id"]:
+            # A job of a nested plan
+            continue
+        start, end = spans.get(job["record"], (job["started"], job["ended"]))
+        spans[job["record"]] = (min(start, job["started"]), max(end, job["ended"]))
+    if not spans:
+        return []
+    predecessors = {}
+    for u, v in run["edges"]:
+        predecessors.setdefault(v, []).append(u)
+
+    path = []
+    record = max(spans, key=lambda r: spans[r][1])
+    while record is not None:
+        path.append((record, *spans[record]))
+        upstream = [p for p in predecessors.get(record, ()) if p in spans]
+        record = max(upstream, key=lambda r: spans[r][1]) if upstream else None
+    return path[::-1]
+
+
+def _lanes(jobs: List[dict]) -> List[float]:
+    """
+    Pack a run's jobs into as few lanes (worker slots) as possible.
+
+    Arguments:
+        jobs (List[dict]): The jobs, in order of start
+
+    Returns:
+        List[float]: The busy seconds of each lane
+
+    """
+    lane_free = []
+    busy = []
+    for job in jobs:
+        for k, free in enumerate(lane_free):
+            if free <= job["started"]:
+                break
+        else:
+            k = len(lane_free)
+            lane_free.append(0.0)
+            busy.append(0.0)
+        lane_free[k] = job["ended"]
+        busy[k] += job["ended"] - job["started"]
+    return busy
+
+
+def format_profile(history: JobHistory, run_id: str, top: int = 10) -> str:
+    """
+    Describe where the time of a run went.
+
+    The report lists the run's wall time, how busy its worker slots were,
+    how much time the scheduler itself took compared to the jobs, the
+    critical path, and the slowest jobs.
+
+    Arguments:
+        history (JobHistory): The history that holds the run
+        run_id (str): The FROF_RUN_ID of the run
+        top (int: 10): How many of the slowest jobs to list
+
+    Returns:
+        str: The report
+
+    """
+    run, jobs = history.run(run_id)
+    ended = run["ended"] or max((job["ended"] for job in jobs), default=run["started"])
+    wall = max(ended - run["started"], 1e-9)
+    job_seconds = sum(job["ended"] - job["started"] for job in jobs)
+    cpu_seconds = sum(job["cpu"] or 0 for job in jobs)
+    failed = sum(1 for job in jobs if job["exit_code"] != 0)
+    status = {None: "unfinished", 1: "ok", 0: "failed"}[run["ok"]]
+
+    lines = [
+        f"run {run['run_id']} ({status})",
+        f"  plan       {run['frof_file'] or run['plan_id']}",
+        f"  wall time  {wall:.2f}s",
+        f"  jobs       {len(jobs)} ({failed} failed), "
+        f"max_jobs {run['max_jobs']}, backend {run['backend']}",
+        "",
+        "time",
+        f"  in jobs    {job_seconds:.2f}s (cpu {cpu_seconds:.2f}s)",
+    ]
+    if run["scheduler"] is not None:
+        per_job = run["scheduler"] / len(jobs) * 1000 if jobs else 0
+        lines.append(
+            f"  scheduler  {run['scheduler']:.2f}s ({per_job:.2f}ms per job), "
+            f"{run['scheduler'] / wall:.1%} of wall time"
+        )
+    if run["max_jobs"]:
+        lines.append(
+            f"  slot use   {job_seconds / (wall * run['max_jobs']):.1%} "
+            f"of {run['max_jobs']} slots"
+        )
+
+    busy = _lanes(jobs)
+    if busy:
+        lines += ["", "worker slots (busy time / wall time)"]
+        for k, seconds in enumerate(busy):
+            lines.append(
+                f"  {k:4d}  {'#' * round(20 * seconds / wall):20s} "
+                f"{seconds / wall:6.1%}"
+            )
+
+    path = _critical_path(run, jobs)
+    if path:
+        lines += ["", "critical path"]
+        for record, start, end in path:
+            lines.append(
+                f"  {start - run['started']:8.2f}s  {end - start:8.2f}s  {record}"
+            )
+
+    slowest = sorted(jobs, key=lambda job: job["started"] - job["ended"])[:top]
+    if slowest:
+        lines += ["", "slowest jobs", "  duration       cpu    max rss  exit  name"]
+        for job in slowest:
+            cpu = "" if job["cpu"] is None else f"{job['cpu']:.2f}s"
+            rss = "" if job["maxrss"] is None else f"{job['maxrss'] / 1024:.1f}MB"
+            lines.append(
+                f"  {job['ended'] - job['started']:8.2f}s {cpu:>9s} {rss:>10s} "
+                f"{job['exit_code']:5d}  {job['name']}"
+            )
+    return "\n".join(lines)
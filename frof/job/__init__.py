@@ -1,9 +1,232 @@
+import contextlib
+import heapq
+import importlib
+import inspect
+import itertools
+import os
+import resource
+import signal
+import sys
+import threading
 import time
 import subprocess
+from collections import deque
+
+# When a job's output isn't sent to a log file, only this many bytes of the
+# end of its stdout are kept (to report with the error if the job fails).
+OUTPUT_TAIL_BYTES = 64 * 1024
+
+# How long a command gets to exit after SIGTERM (when it times out, or when
+# frof is stopped) before its process group is sent SIGKILL:
+KILL_GRACE_SECONDS = 5.0
+
+
+def _usage(rusage) -> dict:
+    """
+    Summarize the resource usage of a job.
+
+    Arguments:
+        rusage (resource.struct_rusage): From os.wait4 or resource.getrusage
+
+    Returns:
+        dict: cpu (user + system seconds) and maxrss (peak resident set
+            size, in KiB)
+
+    """
+    return {"cpu": rusage.ru_utime + rusage.ru_stime, "maxrss": rusage.ru_maxrss}
+
+
+def _exit_code(status: int) -> int:
+    # Like subprocess: the exit status, or -N if killed by signal N.
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _killpg(pgid: int, sig: int) -> None:
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        # The whole group has exited already.
+        pass
+
+
+class _ProcessGroups:
+    """
+    The process groups of the commands that this process is running.
+
+    Each command is started in a session (and so a process group) of its
+    own, so that the shell and everything it started can be killed together,
+    and nothing is left running after the job. One watchdog thread, started
+    the first time a command has a timeout, kills the groups of commands that
+    run too long: SIGTERM first, then SIGKILL if the group is still there
+    KILL_GRACE_SECONDS later.
+
+    """
+
+    def __init__(self) -> None:
+        # Reentrant, since kill_all may be called from a signal handler that
+        # interrupted this thread in add or remove:
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        # pgid -> [id, timed out]; the id tells a group apart from a later
+        # one that gets the same pgid:
+        self._groups = {}
+        self._ids = itertools.count()
+        # A heap of (time, id, pgid, signal):
+        self._deadlines = []
+        self._thread = None
+
+    def add(self, pgid: int, timeout: float = None) -> None:
+        """
+        Start tracking the process group of a command that was just started.
+
+        Arguments:
+            pgid (int): The process group (the pid of the shell)
+            timeout (float: None): Kill the group after this many seconds
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            group_id = next(self._ids)
+            self._groups[pgid] = [group_id, False]
+            if timeout is not None:
+                self._schedule(time.monotonic() + timeout, group_id, pgid)
+
+    def remove(self, pgid: int) -> bool:
+        """
+        Stop tracking the process group of a command that has exited.
+
+        Arguments:
+            pgid (int): The process group
+
+        Returns:
+            bool: Whether the command was killed for running too long
+
+        """
+        with self._lock:
+            _, timed_out = self._groups.pop(pgid, (None, False))
+            return timed_out
+
+    def kill_all(self) -> int:
+        """
+        Kill the process groups of all of the commands that are running.
+
+        Arguments:
+            None
+
+        Returns:
+            int: How many commands were running
+
+        """
+        with self._lock:
+            deadline = time.monotonic() + KILL_GRACE_SECONDS
+            for pgid, (group_id, _) in self._groups.items():
+                _killpg(pgid, signal.SIGTERM)
+                self._schedule(deadline, group_id, pgid, signal.SIGKILL)
+            return len(self._groups)
+
+    def _schedule(self, when, group_id, pgid, sig=signal.SIGTERM) -> None:
+        # Must hold self._lock.
+        heapq.heappush(self._deadlines, (when, group_id, pgid, sig))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+        self._wakeup.notify()
+
+    def _watch(self) -> None:
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, group_id, pgid, sig = heapq.heappop(self._deadlines)
+                    group = self._groups.get(pgid)
+                    if group is None or group[0] != group_id:
+                        continue
+                    if sig == signal.SIGTERM:
+                        group[1] = True
+                        self._schedule(
+                            now + KILL_GRACE_SECONDS, group_id, pgid, signal.SIGKILL
+                        )
+                    _killpg(pgid, sig)
+                timeout = self._deadlines[0][0] - now if self._deadlines else None
+                self._wakeup.wait(timeout)
+
+
+_PROCESS_GROUPS = _ProcessGroups()
+
+
+def kill_running_jobs() -> int:
+    """
+    Kill every command that this process is running, with all its children.
+
+    Each command's process group gets SIGTERM now, and SIGKILL if it is still
+    there KILL_GRACE_SECONDS later. The jobs then fail, as if the commands
+    had failed.
+
+    Arguments:
+        None
+
+    Returns:
+        int: How many commands were running
+
+    """
+    return _PROCESS_GROUPS.kill_all()
 
 
 class Job:
-    ...
+    # The name of the backend that this kind of job must run on (see
+    # frof.backends), or None to use the executor's backend:
+    backend = None
+
+    def fingerprint(self) -> str:
+        """
+        Describe what this job does, for use in cache keys.
+
+        Two jobs with the same fingerprint are expected to do the same work.
+
+        Arguments:
+            None
+
+        Returns:
+            str: A deterministic description of the job
+
+        """
+        return f"{type(self).__name__}{sorted(vars(self).items())!r}"
+
+    def interpolate(self, param: str, value) -> "Job":
+        """
+        Get the concrete job for one value of an &variable.
+
+        Jobs that do not depend on the value may return themselves.
+
+        Arguments:
+            param (str): The name of the &variable (without the &)
+            value: The value of the &variable for this job
+
+        Returns:
+            Job: The job to run for this value
+
+        """
+        return self
+
+    def interpolate_chunk(self, param: str, values: tuple) -> "Job":
+        """
+        Get the job that runs several values of an &variable at once.
+
+        Jobs that do not depend on the value may return themselves.
+
+        Arguments:
+            param (str): The name of the &variable (without the &)
+            values (tuple): The values of the &variable for this job
+
+        Returns:
+            Job: The job to run for these values
+
+        """
+        return self
 
 
 class BashJob(Job):
@@ -30,26 +253,179 @@ class BashJob(Job):
         self.use_env_vars = use_env_vars
         self.env = env if env else {}
 
-    def run(self, env_vars=None):
+    def run(self, env_vars=None, stdout_path=None, stderr_path=None, timeout=None):
         """
         Run the command.
 
+        The command's output is never buffered whole in this process: if a
+        log path is given, the command writes straight to that file;
+        otherwise only the last OUTPUT_TAIL_BYTES of its stdout are kept, and
+        its stderr goes to this process's stderr.
+
+        The command runs in a process group of its own. If it times out, or
+        this call is interrupted, the whole group is killed, so no children
+        of the command are left running.
+
+        Arguments:
+            env_vars (dict: None): Custom environment variables to use
+            stdout_path (str: None): A file to write the command's stdout to
+            stderr_path (str: None): A file to write the command's stderr to
+            timeout (float: None): Kill the command, and raise
+                subprocess.TimeoutExpired, after this many seconds
+
+        Returns:
+            dict: The resource usage of the command (cpu, maxrss), from
+                os.wait4
+
+        """
+        cmd = self.cmd
+        env = self._env(env_vars)
+        stdout = open(stdout_path, "wb") if stdout_path else subprocess.PIPE
+        stderr = open(stderr_path, "wb") if stderr_path else None
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                shell=True,
+                env=env,
+                stdout=stdout,
+                stderr=stderr,
+                start_new_session=True,
+            )
+            _PROCESS_GROUPS.add(proc.pid, timeout)
+            try:
+                tail = None
+                if proc.stdout:
+                    buffer = _TailBuffer()
+                    with proc.stdout as out:
+                        for chunk in iter(lambda: out.read1(OUTPUT_TAIL_BYTES), b""):
+                            buffer.write(chunk)
+                    tail = buffer.getvalue()
+                # Reap the shell ourselves, to get its rusage:
+                _, status, rusage = os.wait4(proc.pid, 0)
+                proc.returncode = returncode = _exit_code(status)
+            except BaseException:
+                _killpg(proc.pid, signal.SIGTERM)
+                raise
+            finally:
+                timed_out = _PROCESS_GROUPS.remove(proc.pid)
+        finally:
+            for fh in (stdout, stderr):
+                if hasattr(fh, "close"):
+                    fh.close()
+        if timed_out:
+            raise subprocess.TimeoutExpired(cmd, timeout, output=tail)
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, cmd, output=tail)
+        return _usage(rusage)
+
+    async def run_async(
+        self, env_vars=None, stdout_path=None, stderr_path=None, timeout=None
+    ):
+        """
+        Run the command, without blocking the event loop.
+
+        This is the same as run, but uses asyncio.create_subprocess_shell, so
+        that no thread is tied up while the command runs. The event loop
+        reaps the command, so its resource usage is not reported.
+
         Arguments:
             env_vars (dict: None): Custom environment variables to use
+            stdout_path (str: None): A file to write the command's stdout to
+            stderr_path (str: None): A file to write the command's stderr to
+            timeout (float: None): Kill the command, and raise
+                subprocess.TimeoutExpired, after this many seconds
 
         Returns:
             None
 
         """
+        import asyncio
+
         cmd = self.cmd
+        env = self._env(env_vars)
+        stdout = open(stdout_path, "wb") if stdout_path else asyncio.subprocess.PIPE
+        stderr = open(stderr_path, "wb") if stderr_path else None
+        try:
+            proc = await asyncio.create_subprocess_shell(
+                cmd, env=env, stdout=stdout, stderr=stderr, start_new_session=True
+            )
+            _PROCESS_GROUPS.add(proc.pid, timeout)
+            try:
+                tail = None
+                if proc.stdout:
+                    buffer = _TailBuffer()
+                    while True:
+                        chunk = await proc.stdout.read(OUTPUT_TAIL_BYTES)
+                        if not chunk:
+                            break
+                        buffer.write(chunk)
+                    tail = buffer.getvalue()
+                returncode = await proc.wait()
+            except BaseException:
+                _killpg(proc.pid, signal.SIGTERM)
+                raise
+            finally:
+                timed_out = _PROCESS_GROUPS.remove(proc.pid)
+        finally:
+            for fh in (stdout, stderr):
+                if hasattr(fh, "close"):
+                    fh.close()
+        if timed_out:
+            raise subprocess.TimeoutExpired(cmd, timeout, output=tail)
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, cmd, output=tail)
+
+    def _env(self, env_vars: dict) -> dict:
         env = {}
         if self.use_env_vars:
             env = {**env_vars, **self.env}
 
         # Cast all env-vars to string (int/float other types are not supported
         # by Python's subprocess module).
-        env = {k: str(v) for k, v in env.items()}
-        subprocess.check_output(cmd, shell=True, env=env)
+        return {k: str(v) for k, v in env.items()}
+
+    def interpolate(self, param: str, value) -> "BashJob":
+        """
+        Get the concrete BashJob for one value of an &variable.
+
+        Every {{&param}} in the command is replaced by the value, and the value
+        is exposed to the command as $FROF_JOB_PARAM.
+
+        Arguments:
+            param (str): The name of the &variable (without the &)
+            value: The value of the &variable for this job
+
+        Returns:
+            BashJob: A new BashJob with the value filled in
+
+        """
+        return BashJob(
+            self.cmd.replace("{{&" + param + "}}", str(value)),
+            use_env_vars=self.use_env_vars,
+            env={**self.env, "FROF_JOB_PARAM": value},
+        )
+
+    def interpolate_chunk(self, param: str, values: tuple) -> "BashJob":
+        """
+        Get the BashJob that runs several values of an &variable at once.
+
+        Every {{&param}} in the command is replaced by the values, separated
+        by spaces, and the values are exposed to the command, one per line,
+        as $FROF_JOB_PARAMS.
+
+        Arguments:
+            param (str): The name of the &variable (without the &)
+            values (tuple): The values of the &variable for this job
+
+        Returns:
+            BashJob: A new BashJob with the values filled in
+
+        """
+        return BashJob(
+            self.cmd.replace("{{&" + param + "}}", " ".join(str(v) for v in values)),
+            use_env_vars=self.use_env_vars,
+            env={**self.env, "FROF_JOB_PARAMS": "\n".join(str(v) for v in values)},
+        )
 
     def __str__(self) -> str:
         """
@@ -72,6 +448,224 @@ class BashJob(Job):
         return f"BashJob('{self.cmd}', env={self.env})"
 
 
+class FrofJob(BashJob):
+    """
+    FrofJobs run another .frof plan, e.g. `child: frof child.frof`.
+
+    A LocalFrofExecutor does not start a new frof process for these: it runs
+    the jobs of the nested plan itself, alongside (and sharing max_jobs with)
+    the jobs of the outer plan. Anywhere else, a FrofJob runs its command in
+    the shell, like any other BashJob.
+    """
+
+    def __init__(self, cmd: str, path: str, use_env_vars=True, env=None) -> None:
+        """
+        Create a new FrofJob.
+
+        Arguments:
+            cmd (str): The command, e.g. "frof child.frof"
+            path (str): The path of the .frof file to run
+            use_env_vars (bool: True): Whether to set environment variables
+            env (dict: None): Custom environment variables to use
+
+        Returns:
+            None
+
+        """
+        super().__init__(cmd, use_env_vars=use_env_vars, env=env)
+        self.path = path
+
+    def interpolate(self, param: str, value) -> "FrofJob":
+        """
+        Get the concrete FrofJob for one value of an &variable.
+
+        Arguments:
+            param (str): The name of the &variable (without the &)
+            value: The value of the &variable for this job
+
+        Returns:
+            FrofJob: A new FrofJob with the value filled in
+
+        """
+        job = super().interpolate(param, value)
+        return FrofJob(
+            job.cmd,
+            self.path.replace("{{&" + param + "}}", str(value)),
+            use_env_vars=job.use_env_vars,
+            env=job.env,
+        )
+
+    def interpolate_chunk(self, param: str, values: tuple) -> "FrofJob":
+        raise ValueError(f"Jobs that run a .frof file ({self.cmd}) can't be chunked")
+
+    def __str__(self) -> str:
+        return f"<FrofJob [{self.path}]>"
+
+    def __repr__(self) -> str:
+        return f"FrofJob('{self.cmd}', '{self.path}', env={self.env})"
+
+
+class PythonJob(Job):
+    """
+    PythonJobs call a Python function, e.g. `count_base: @dna:count_base`.
+
+    PythonJobs always run in a pool of warm worker processes (the "process"
+    backend), so there is no shell or interpreter to start for each job, and
+    each module is only imported once per worker.
+
+    The function is called with the job's FROF_* variables as keyword
+    arguments, lowercased and without the FROF_ prefix: job_param (the value
+    of the job's &variable, not converted to a string), run_id, plan_id,
+    job_name, and so on. The function only gets the arguments that it takes,
+    unless it takes **kwargs. The job fails if the function raises.
+    """
+
+    backend = "process"
+
+    def __init__(self, module: str, function: str, env=None) -> None:
+        """
+        Create a new PythonJob.
+
+        Arguments:
+            module (str): The module to import, e.g. "dna" or "lab.dna"
+            function (str): The name of the function in the module
+            env (dict: None): Custom FROF_* variables to pass to the function
+
+        Returns:
+            None
+
+        """
+        self.module = module
+        self.function = function
+        self.env = env if env else {}
+
+    def run(self, env_vars=None, stdout_path=None, stderr_path=None, timeout=None):
+        """
+        Call the function.
+
+        The module is imported relative to the working directory. Anything
+        the function prints goes to the log files if they are given, and is
+        discarded otherwise.
+
+        Arguments:
+            env_vars (dict: None): The FROF_* variables of the job
+            stdout_path (str: None): A file to write the function's stdout to
+            stderr_path (str: None): A file to write the function's stderr to
+            timeout (float: None): Interrupt the function, and raise
+                TimeoutError, after this many seconds (only when it is called
+                on the main thread, as it is in a worker process)
+
+        Returns:
+            dict: The resource usage of the call: cpu, and maxrss (the peak
+                of the worker process, which may have run other jobs before)
+
+        """
+        if os.getcwd() not in sys.path:
+            sys.path.insert(0, os.getcwd())
+        function = getattr(importlib.import_module(self.module), self.function)
+
+        kwargs = {
+            k[len("FROF_") :].lower(): v
+            for k, v in {**(env_vars or {}), **self.env}.items()
+            if k.startswith("FROF_")
+        }
+        parameters = inspect.signature(function).parameters
+        if not any(p.kind == p.VAR_KEYWORD for p in parameters.values()):
+            kwargs = {k: v for k, v in kwargs.items() if k in parameters}
+
+        with contextlib.ExitStack() as stack:
+            stdout = stack.enter_context(open(stdout_path or os.devnull, "w"))
+            stderr = (
+                stack.enter_context(open(stderr_path, "w")) if stderr_path else None
+            )
+            stack.enter_context(contextlib.redirect_stdout(stdout))
+            if stderr:
+                stack.enter_context(contextlib.redirect_stderr(stderr))
+            if timeout and threading.current_thread() is threading.main_thread():
+                stack.enter_context(_alarm(timeout))
+            before = resource.getrusage(resource.RUSAGE_SELF)
+            function(**kwargs)
+            after = _usage(resource.getrusage(resource.RUSAGE_SELF))
+        after["cpu"] -= _usage(before)["cpu"]
+        return after
+
+    def interpolate(self, param: str, value) -> "PythonJob":
+        """
+        Get the concrete PythonJob for one value of an &variable.
+
+        Arguments:
+            param (str): The name of the &variable (without the &)
+            value: The value of the &variable for this job
+
+        Returns:
+            PythonJob: A new PythonJob that passes the value as job_param
+
+        """
+        return PythonJob(
+            self.module, self.function, env={**self.env, "FROF_JOB_PARAM": value}
+        )
+
+    def interpolate_chunk(self, param: str, values: tuple) -> "PythonJob":
+        """
+        Get the PythonJob that runs several values of an &variable at once.
+
+        Arguments:
+            param (str): The name of the &variable (without the &)
+            values (tuple): The values of the &variable for this job
+
+        Returns:
+            PythonJob: A new PythonJob that passes the values, as a list, as
+                job_params
+
+        """
+        return PythonJob(
+            self.module,
+            self.function,
+            env={**self.env, "FROF_JOB_PARAMS": list(values)},
+        )
+
+    def __str__(self) -> str:
+        return f"<PythonJob [@{self.module}:{self.function}]>"
+
+    def __repr__(self) -> str:
+        return f"PythonJob('{self.module}', '{self.function}', env={self.env})"
+
+
+@contextlib.contextmanager
+def _alarm(seconds: float):
+    # Raise TimeoutError in the main thread if the block takes too long.
+    def expired(signum, frame):
+        raise TimeoutError(f"Timed out after {seconds} seconds")
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class _TailBuffer:
+    """
+    A buffer that only keeps the last OUTPUT_TAIL_BYTES written to it.
+
+    """
+
+    def __init__(self) -> None:
+        self._chunks = deque()
+        self._size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        while self._size - len(self._chunks[0]) >= OUTPUT_TAIL_BYTES:
+            self._size -= len(self._chunks.popleft())
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._chunks)[-OUTPUT_TAIL_BYTES:]
+
+
 class NullJob(Job):
     """
     A no-op Job class that doesn't do anything.
@@ -94,8 +688,15 @@ class NullJob(Job):
         self.delay = delay
         pass
 
-    def run(self, env_vars=None):
+    def run(self, env_vars=None, stdout_path=None, stderr_path=None, timeout=None):
         time.sleep(self.delay)
 
+    async def run_async(
+        self, env_vars=None, stdout_path=None, stderr_path=None, timeout=None
+    ):
+        import asyncio
+
+        await asyncio.sleep(self.delay)
+
     def __str__(self) -> str:
         return "<NullJob>" if self.delay is 0 else "<NullJob delay={delay}s>"
@@ -0,0 +1,235 @@
+from typing import Set, Tuple
+
+import json
+import os
+import re
+import threading
+
+_HOME = os.path.expanduser("~")
+
+DEFAULT_JOURNAL_DIR = os.path.join(_HOME, ".frof", "runs")
+
+# The journal of a run that succeeds is deleted when it closes; the others
+# are kept (to resume) until there are more than this many:
+MAX_JOURNALS = 100
+
+STARTED = "S"
+FINISHED = "F"
+FAILED = "X"
+
+# FROF_RUN_IDs are used in file and directory names, so they may only hold
+# these characters (UUIDs do):
+_RUN_ID = re.compile(r"[A-Za-z0-9_-]+")
+
+
+class RunJournal:
+    """
+    An append-only record of the jobs that started and finished in a run.
+
+    Each run gets one file, named after its FROF_RUN_ID. The first line holds
+    the run's metadata; each later line is a JSON list: [event, job name].
+
+    Records are buffered in memory and written (and fsync'd) in batches by a
+    background thread, so journaling costs the scheduler an append to a list
+    no matter how quickly jobs finish. At most flush_interval seconds of
+    records can be lost if the machine goes down.
+
+    Only the MAX_JOURNALS most recently written journals are kept; the
+    oldest are deleted when a new one is created.
+
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        journal_dir: str = None,
+        header: dict = None,
+        flush_interval: float = 0.5,
+    ) -> None:
+        """
+        Open (or create) the journal of a run.
+
+        Arguments:
+            run_id (str): The FROF_RUN_ID of the run
+            journal_dir (str: ~/.frof/runs): Where to keep journals
+            header (dict: None): Metadata to write if the journal is new
+            flush_interval (float: 0.5): Seconds between batched writes
+
+        Returns:
+            None
+
+        """
+        self.path = journal_path(run_id, journal_dir)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            self._pending.append(json.dumps({"run_id": run_id, **(header or {})}))
+            self.flush()
+            _prune(os.path.dirname(self.path), MAX_JOURNALS)
+        else:
+            with open(self.path, "rb") as fh:
+                fh.seek(size - 1)
+                torn = fh.read(1) != b"\n"
+            if torn:
+                # The last run crashed mid-write; don't glue the first new
+                # record onto the torn line.
+                os.write(self._fd, b"\n")
+        self._flush_interval = flush_interval
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def record(self, event: str, job_name: str) -> None:
+        """
+        Add a record to the journal.
+
+        Arguments:
+            event (str): STARTED, FINISHED, or FAILED
+            job_name (str): The name of the job
+
+        Returns:
+            None
+
+        """
+        line = json.dumps([event, job_name])
+        with self._lock:
+            self._pending.append(line)
+
+    def flush(self) -> None:
+        """
+        Write and fsync all buffered records.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            os.write(self._fd, ("\n".join(pending) + "\n").encode())
+            os.fsync(self._fd)
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self._flush_interval):
+            self.flush()
+
+    def close(self, remove: bool = False) -> None:
+        """
+        Flush the journal and stop its writer thread.
+
+        Arguments:
+            remove (bool: False): Delete the journal, e.g. because its run
+                has succeeded, and there is nothing left to resume
+
+        Returns:
+            None
+
+        """
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        os.close(self._fd)
+        if remove:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def _prune(journal_dir: str, keep: int) -> None:
+    """
+    Delete the least recently written journals in a directory, keeping `keep`.
+
+    Arguments:
+        journal_dir (str): The directory of the journals
+        keep (int): The number of journals to keep
+
+    Returns:
+        None
+
+    """
+    entries = [
+        entry for entry in os.scandir(journal_dir) if entry.name.endswith(".journal")
+    ]
+    if len(entries) <= keep:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[: len(entries) - keep]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def check_run_id(run_id: str) -> str:
+    """
+    Check that a run ID is safe to use in a file name.
+
+    Arguments:
+        run_id (str): The FROF_RUN_ID to check
+
+    Returns:
+        str: The run ID
+
+    Raises:
+        ValueError: If the run ID holds anything but letters, digits, _ and -
+
+    """
+    if not _RUN_ID.fullmatch(run_id):
+        raise ValueError(
+            f"Invalid run ID {run_id!r}: use only letters, digits, _ and -"
+        )
+    return run_id
+
+
+def journal_path(run_id: str, journal_dir: str = None) -> str:
+    """
+    Get the path of the journal of a run.
+
+    Arguments:
+        run_id (str): The FROF_RUN_ID of the run
+        journal_dir (str: ~/.frof/runs): Where journals are kept
+
+    Returns:
+        str: The path of the journal file
+
+    Raises:
+        ValueError: If the run ID isn't safe to use in a file name
+
+    """
+    journal_dir = os.path.expanduser(journal_dir or DEFAULT_JOURNAL_DIR)
+    return os.path.join(journal_dir, f"{check_run_id(run_id)}.journal")
+
+
+def read_journal(run_id: str, journal_dir: str = None) -> Tuple[dict, Set[str]]:
+    """
+    Read the journal of a (possibly crashed) run.
+
+    Torn lines, from a crash mid-write, are ignored.
+
+    Arguments:
+        run_id (str): The FROF_RUN_ID of the run
+        journal_dir (str: ~/.frof/runs): Where journals are kept
+
+    Returns:
+        Tuple[dict, Set[str]]: (The run's metadata, the names of the jobs
+            that finished successfully)
+
+    """
+    finished = set()
+    with open(journal_path(run_id, journal_dir), "r") as fh:
+        header = json.loads(fh.readline())
+        for line in fh:
+            try:
+                event, job_name = json.loads(line)
+            except ValueError:
+                continue
+            if event == FINISHED:
+                finished.add(job_name)
+    return header, finished
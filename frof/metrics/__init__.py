@@ -0,0 +1,306 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import threading
+
+# Bucket upper bounds, in seconds:
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+    300.0, 600.0, 1800.0, 3600.0,
+)  # fmt: skip
+LATENCY_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0,
+)  # fmt: skip
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+class Counter:
+    """
+    A number that only goes up, like the number of jobs started.
+
+    Updating a metric is a plain attribute update, with no lock: metrics are
+    only updated by the scheduler thread, and a reader on another thread at
+    worst sees a value from a moment ago.
+
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    """
+    A number that goes up and down, like the number of jobs running.
+
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    """
+    The distribution of a measurement, like job durations, in fixed buckets.
+
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        """
+        Create a new, empty Histogram.
+
+        Arguments:
+            bounds (Sequence[float]): The sorted upper bounds of the buckets;
+                a last, unbounded (+Inf) bucket is added
+
+        Returns:
+            None
+
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    The counters, gauges, and histograms of a LocalFrofExecutor.
+
+    The executor updates them as it schedules jobs; each update costs well
+    under a microsecond, so they are always on. Gauges that would change on
+    every event are instead set by `collect`, which render() calls first.
+    render() produces them in the OpenMetrics (Prometheus) text format, for
+    MetricsServer or a file.
+
+    """
+
+    def __init__(self) -> None:
+        """
+        Create a new set of metrics, all at zero.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Set every metric back to zero, for a new run.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        self.jobs_started = Counter()
+        self.jobs_finished = Counter()
+        self.jobs_failed = Counter()
+        self.jobs_retried = Counter()
+        self.jobs_skipped = Counter()
+        self.job_seconds = Counter()
+        self.jobs_running = Gauge()
+        self.max_jobs = Gauge()
+        self.ready_records = Gauge()
+        self.completion_queue = Gauge()
+        self.schedule_latency = Histogram(LATENCY_BUCKETS)
+        self.job_durations: Dict[str, Histogram] = {}
+        # Sets the gauges to their current values, when they are read:
+        self.collect: Optional[Callable[[], None]] = None
+
+    def job_duration(self, job_name: str, seconds: float) -> None:
+        """
+        Record how long a job took.
+
+        Arguments:
+            job_name (str): The name of the job (or sweep) in the plan
+            seconds (float): How long it took
+
+        Returns:
+            None
+
+        """
+        histogram = self.job_durations.get(job_name)
+        if histogram is None:
+            histogram = self.job_durations[job_name] = Histogram(DURATION_BUCKETS)
+        histogram.observe(seconds)
+        self.job_seconds.inc(seconds)
+
+    def render(self) -> str:
+        """
+        Get every metric in the OpenMetrics text format.
+
+        Arguments:
+            None
+
+        Returns:
+            str: The metrics, ending with "# EOF"
+
+        """
+        collect = self.collect
+        if collect is not None:
+            collect()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"# HELP {name} {help_text}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_labels(labels)} {value}")
+
+        def histogram_samples(histogram, labels=()):
+            cumulative = 0
+            bounds = [*map(repr, histogram.bounds), "+Inf"]
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                yield "_bucket", (*labels, ("le", bound)), cumulative
+            yield "_count", labels, histogram.count
+            yield "_sum", labels, histogram.sum
+
+        for name, counter, help_text in [
+            ("frof_jobs_started", self.jobs_started, "Jobs started."),
+            ("frof_jobs_finished", self.jobs_finished, "Jobs that succeeded."),
+            ("frof_jobs_failed", self.jobs_failed, "Jobs that failed."),
+            (
+                "frof_jobs_retried",
+                self.jobs_retried,
+                "Failed jobs that were (or will be) run again.",
+            ),
+            (
+                "frof_jobs_skipped",
+                self.jobs_skipped,
+                "Jobs not run because they already succeeded (cache or resume).",
+            ),
+            ("frof_job_seconds", self.job_seconds, "Total seconds spent in jobs."),
+        ]:
+            family(name, "counter", help_text, [("_total", (), counter.value)])
+
+        max_jobs = self.max_jobs.value
+        for name, value, help_text in [
+            ("frof_jobs_running", self.jobs_running.value, "Jobs running now."),
+            ("frof_max_jobs", max_jobs, "The most jobs that may run at once."),
+            (
+                "frof_worker_utilization",
+                self.jobs_running.value / max_jobs if max_jobs else 0,
+                "The fraction of job slots in use.",
+            ),
+            (
+                "frof_ready_records",
+                self.ready_records.value,
+                "Jobs (or sweeps) that are ready to start but waiting.",
+            ),
+            (
+                "frof_completion_queue_depth",
+                self.completion_queue.value,
+                "Finished jobs that the scheduler has not handled yet.",
+            ),
+        ]:
+            family(name, "gauge", help_text, [("", (), value)])
+
+        family(
+            "frof_schedule_latency_seconds",
+            "histogram",
+            "Time from a job being ready to it starting.",
+            histogram_samples(self.schedule_latency),
+        )
+        lines.append("# TYPE frof_job_duration_seconds histogram")
+        lines.append("# HELP frof_job_duration_seconds How long jobs took, by job.")
+        for job_name, histogram in list(self.job_durations.items()):
+            samples = histogram_samples(histogram, (("job", job_name),))
+            for suffix, labels, value in samples:
+                lines.append(
+                    f"frof_job_duration_seconds{suffix}{_labels(labels)} {value}"
+                )
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves a Metrics on http://HOST:PORT/metrics, for Prometheus to scrape.
+
+    Uses only the standard library's http.server, on a daemon thread.
+
+    """
+
+    def __init__(self, metrics: Metrics, port: int, host: str = "127.0.0.1") -> None:
+        """
+        Start serving metrics.
+
+        Arguments:
+            metrics (Metrics): The metrics to serve
+            port (int): The port to listen on
+            host (str: "127.0.0.1"): The address to listen on
+
+        Returns:
+            None
+
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Stop serving.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,8 +1,11 @@
+import hashlib
+import json
+import os
+import re
 import uuid
-from lark import Lark, Transformer
-import networkx as nx
 
-from ..job import BashJob
+from ..compact import CompactPlan, JobRecord, LazyValues
+from ..job import BashJob, FrofJob, PythonJob
 
 SYNTAX = """
 start: line+
@@ -18,13 +21,21 @@ single_job  : jobname
 
 
 ?jobname    : VARNAME
-            | VARNAME"(" params ")"
-            | VARNAME"(" params "," max_parallel_count ")"
+            | VARNAME"(" job_args ")"
+
+job_args    : params ("," max_parallel_count)? ("," option)*
+            | option ("," option)*
 
 params      : (param)+
 
 ?max_parallel_count: SIGNED_NUMBER
 
+option      : VARNAME "=" option_value
+
+?option_value: SIGNED_NUMBER
+            | ESCAPED_STRING
+            | VARNAME
+
 ?param      : "&" PARAMNAME "[" SIGNED_NUMBER "]"
             | "&" PARAMNAME
 
@@ -37,10 +48,11 @@ param_defn  : "&" PARAMNAME ":" param_cmd
 ?param_cmd  : NONESCAPED_STRING
 ?command    : NONESCAPED_STRING
 
-VARNAME     : /[a-zA-Z_-]\w*/
+VARNAME     : /(?!->)[a-zA-Z_-]\w*/
 
 COMMENT     : /#.*/
 
+%import common.ESCAPED_STRING
 %import common.SIGNED_NUMBER
 %import common.WS
 %ignore COMMENT
@@ -48,94 +60,263 @@ NONESCAPED_STRING  : /[^\\n]+/
 %ignore WS
 """
 
-frof_parser = Lark(SYNTAX)
+_HOME = os.path.expanduser("~")
+
+DEFAULT_PARSER_CACHE_DIR = os.path.join(_HOME, ".frof", "parser")
+
+# Bump this whenever FrofTransformer.spec changes what it returns, so that
+# stale cached specs are not used:
+_SPEC_VERSION = 2
+
+# Parsed specs are small, but one is kept per distinct .frof file contents:
+_MAX_CACHED_SPECS = 1000
+
+_lark_parser = None
 
+# A command that does nothing but run another plan, e.g. `frof child.frof`:
+_NESTED_FROF = re.compile(r"frof\s+(\S+\.frof)")
 
-class FrofTransformer(Transformer):
+# A call to a Python function, e.g. `@dna:count_base`:
+_PYTHON_CALL = re.compile(r"@([A-Za-z_][\w.]*):([A-Za-z_]\w*)")
+
+# Options that can be set on a job, e.g. `count_base(&bases, inputs="DNA.txt")`
+JOB_OPTIONS = {
+    "inputs",
+    "outputs",
+    "chunk",
+    "resources",
+    "retries",
+    "retry_delay",
+    "timeout",
+}
+
+
+def lark_parser(cache_dir: str = DEFAULT_PARSER_CACHE_DIR) -> "lark.Lark":
     """
-    Lark Transformer for Frof syntax.
+    Get the Lark parser for the .frof syntax.
+
+    The parser is LALR(1) with a contextual lexer, so parsing takes linear
+    time. It is only built the first time it is needed, and the compiled
+    grammar is cached on disk, so later processes can skip building it.
 
-    You can probably ignore this, unless you're fiddling with the language.
+    Arguments:
+        cache_dir (str: ~/.frof/parser): Where to cache the compiled grammar;
+            if None, the grammar is not cached
+
+    Returns:
+        Lark: The parser
+
+    """
+    global _lark_parser
+    if _lark_parser is None:
+        from lark import Lark
+        from lark import __version__ as lark_version
+
+        cache = False
+        if cache_dir:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                cache = os.path.join(cache_dir, f"grammar-lark-{lark_version}.cache")
+            except OSError:
+                pass
+        try:
+            _lark_parser = Lark(SYNTAX, parser="lalr", cache=cache)
+        except OSError:
+            _lark_parser = Lark(SYNTAX, parser="lalr")
+    return _lark_parser
+
+
+def _make_job(command: str) -> "Job":
     """
+    Create the job for a command.
 
-    def __init__(self, *args, **kwargs) -> None:
-        self.G = nx.DiGraph()
-        self._params = {}
-        self._job_param_assignments = {}
-        super().__init__(*args, **kwargs)
+    Arguments:
+        command (str): The command, as written in the .frof file
 
-    def transform(self, tree):
-        self._transform_tree(tree)
+    Returns:
+        Job: A PythonJob if the command is `@module:function`; a FrofJob if
+            the command only runs another .frof file, so that executors can
+            run the nested plan themselves; otherwise, a BashJob
 
-        # TODO: This still needs some love, but is way better than before.
-        # In particular:
-        # - [ ] Remove all job creation from the domain of the language. This
-        #       should all be the job of the FrofPlan/Executor, not parser.
-        # - [ ] Meditate seriously on how to deal with notating parallelism.
-        #       This is a bit of a hack currently.
+    """
+    python_call = _PYTHON_CALL.fullmatch(command)
+    if python_call:
+        return PythonJob(python_call.group(1), python_call.group(2))
+    nested = _NESTED_FROF.fullmatch(command)
+    if nested:
+        return FrofJob(command, nested.group(1))
+    return BashJob(command)
 
-        for (
-            jobname,
-            (paramname, max_parallel_count),
-        ) in self._job_param_assignments.items():
-            job = self.G.node[jobname]
-            ins = [u for u, v in self.G.in_edges(jobname)]
-            outs = [v for u, v in self.G.out_edges(jobname)]
 
-            parallelism_group = str(uuid.uuid4())
-            for option in self._params[paramname]:
-                job_text = job["job"].cmd.replace("{{&" + paramname + "}}", str(option))
-                self.G.add_node(
-                    f"{jobname}_{option}",
-                    max_parallel_count=max_parallel_count,
-                    parallelism_group=parallelism_group,
-                    job=BashJob(job_text, env={"FROF_JOB_PARAM": option}),
-                )
-                for i in ins:
-                    self.G.add_edge(i, f"{jobname}_{option}")
-                for i in outs:
-                    self.G.add_edge(f"{jobname}_{option}", i)
-            self.G.remove_node(jobname)
+def _param_values(source: str, values):
+    """
+    Turn the value of an &variable definition into a compact value vector.
+
+    Ranges are kept as they are; other collections are deduplicated (by
+    string value, as two jobs with the same name would be the same job) into
+    a tuple. Anything else that can be iterated over (a generator, an open
+    file...) is swept lazily: the definition is evaluated again at the start
+    of each run, and values are pulled only as jobs are started.
+
+    Arguments:
+        source (str): The Python source of the &variable definition
+        values (Iterable): The evaluated &variable definition
+
+    Returns:
+        Sequence: The values to sweep over, or a LazyValues
+
+    """
+    if isinstance(values, range):
+        return values
+    if not isinstance(values, (list, tuple, set, frozenset, dict)):
+        if hasattr(values, "close"):
+            values.close()
+        return LazyValues(source)
+    unique = {}
+    for value in values:
+        unique.setdefault(str(value), value)
+    return tuple(unique.values())
+
+
+def parse_resources(text: str) -> dict:
+    """
+    Parse a list of resource amounts, like "cpus=4 mem=8000 gpu_license=1".
+
+    Arguments:
+        text (str): Space-separated name=amount pairs
+
+    Returns:
+        dict: The amount of each resource, as a number
+
+    """
+    resources = {}
+    for pair in text.split():
+        name, _, amount = pair.partition("=")
+        try:
+            resources[name] = float(amount)
+        except ValueError:
+            raise ValueError(f"Resources must look like name=amount, not '{pair}'")
+        if not name or resources[name] < 0:
+            raise ValueError(f"Resources must look like name=amount, not '{pair}'")
+    return resources
+
+
+def _chunk_option(jobname: str, value: str):
+    """
+    Check the value of a job's chunk option.
+
+    Arguments:
+        jobname (str): The name of the job, for the error message
+        value (str): The value of the option, as written
 
-        return self.G
+    Returns:
+        Union[int, str]: A chunk size of at least 1, or "auto"
 
-    def edgelist(self, edgelist):
-        nx.add_path(self.G, [str(e) for e in edgelist])
+    """
+    if value == "auto":
+        return value
+    try:
+        chunk = int(value)
+    except ValueError:
+        chunk = 0
+    if chunk < 1:
+        raise ValueError(
+            f"The chunk of job '{jobname}' must be a positive integer or auto"
+        )
+    return chunk
+
+
+def _number_option(jobname: str, option: str, value: str, kind: type):
+    """
+    Check the value of a job option that must be a number of at least 0.
 
-    def single_job(self, single_job):
-        self.G.add_node(str(single_job[0]))
+    Arguments:
+        jobname (str): The name of the job, for the error message
+        option (str): The name of the option, for the error message
+        value (str): The value of the option, as written
+        kind (type): int or float
+
+    Returns:
+        Union[int, float]: The value
+
+    """
+    try:
+        number = kind(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        noun = "whole number" if kind is int else "number"
+        raise ValueError(f"The {option} of job '{jobname}' must be a {noun} >= 0")
+    return number
 
-    def jobname(self, job):
-        jobname, param_set, max_parallel_count = (None, None, None)
-        if len(job) == 2:
-            jobname, param_set = job
-        elif len(job) == 3:
-            jobname, param_set, max_parallel_count = job
 
-        for param in param_set:
-            self._job_param_assignments[str(jobname)] = (param, max_parallel_count)
-        return jobname
+def build_plan(spec: dict) -> CompactPlan:
+    """
+    Build a CompactPlan from a plan spec.
 
-    def params(self, params):
-        for param in params:
-            if str(param) not in self._params:
-                self._params[str(param)] = {}
-        return [str(p) for p in params]
+    This is where &variable definitions are evaluated, so that a cached spec
+    still sees the files (or anything else) that its definitions read, as
+    they are when the plan is built.
 
-    def max_parallel_count(self, max_parallel_count):
-        return int(max_parallel_count.value)
+    Arguments:
+        spec (dict): A plan spec, from FrofTransformer.spec
 
-    def param_defn(self, param_defn):
-        param, param_defn = param_defn
-        self._params[str(param)] = eval(str(param_defn))
+    Returns:
+        CompactPlan: The job network
 
-    def definition(self, definition):
-        key, command = definition
-        key = str(key)
-        self.G.nodes[key]["job"] = BashJob(command)
+    """
+    records = {jobname: JobRecord(jobname) for jobname in spec["jobs"]}
+    for jobname, command in spec["definitions"].items():
+        records[jobname].job = _make_job(command)
+
+    params = {}
+    for paramname, source in spec["params"].items():
+        if source is None:
+            params[paramname] = ()
+        else:
+            params[paramname] = _param_values(source, eval(source))
+
+    # A parameterized job stays a single record: the template job plus the
+    # values of its &variable. Concrete jobs are built at run time.
+    for jobname, (paramname, max_parallel_count) in spec["job_params"].items():
+        record = records[jobname]
+        record.param = paramname
+        record.values = params[paramname]
+        record.max_parallel_count = max_parallel_count
+        record.group = str(uuid.uuid4())
+
+    for jobname, options in spec["job_options"].items():
+        record = records[jobname]
+        record.inputs = tuple(options.get("inputs", "").split())
+        record.outputs = tuple(options.get("outputs", "").split())
+        record.resources = parse_resources(options.get("resources", ""))
+        if "retries" in options:
+            record.retries = _number_option(jobname, "retries", options["retries"], int)
+        if "retry_delay" in options:
+            record.retry_delay = _number_option(
+                jobname, "retry_delay", options["retry_delay"], float
+            )
+        if "timeout" in options:
+            record.timeout = _number_option(
+                jobname, "timeout", options["timeout"], float
+            )
+            if isinstance(record.job, FrofJob):
+                raise ValueError(
+                    f"Job '{jobname}' runs a .frof file, so it can't have a timeout"
+                )
+        if "chunk" in options:
+            record.chunk = _chunk_option(jobname, options["chunk"])
+            if record.param is None:
+                raise ValueError(f"Job '{jobname}' has a chunk but no &variable")
+            if isinstance(record.job, FrofJob):
+                raise ValueError(
+                    f"Job '{jobname}' runs a .frof file, so it can't be chunked"
+                )
 
-    def command(self, command):
-        return str(command).strip()
+    index = {jobname: i for i, jobname in enumerate(records)}
+    return CompactPlan(
+        list(records.values()), [(index[u], index[v]) for u, v in spec["edges"]]
+    )
 
 
 class FrofParser:
@@ -143,22 +324,28 @@ class FrofParser:
     A parser for the .frof syntax.
 
     Contains minimal logic; see FrofTransformer for more details.
+
+    Parsed specs are cached on disk by the hash of the .frof contents, so a
+    file that has been parsed before (like a child .frof that is run over and
+    over) is never parsed again. &variable definitions are not cached: they
+    are evaluated every time a plan is built.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, cache_dir: str = DEFAULT_PARSER_CACHE_DIR) -> None:
         """
         Create a new Parser.
 
         Arguments:
-            None
+            cache_dir (str: ~/.frof/parser): Where to cache the compiled
+                grammar and parsed specs; if None, nothing is cached
 
         Returns:
             None
 
         """
-        pass
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
 
-    def parse(self, frof: str) -> nx.DiGraph:
+    def parse(self, frof: str) -> CompactPlan:
         """
         Parse a .frof syntax tree.
 
@@ -166,9 +353,76 @@ class FrofParser:
             frof (str): The contents to parse
 
         Return:
-            nx.DiGraph: The parsed job network
+            CompactPlan: The parsed job network
 
         """
-        tree = frof_parser.parse(frof)
-        G = FrofTransformer().transform(tree)
-        return G
+        return build_plan(self.parse_spec(frof))
+
+    def parse_spec(self, frof: str) -> dict:
+        """
+        Parse .frof contents into a plan spec, using the cache if possible.
+
+        Arguments:
+            frof (str): The contents to parse
+
+        Return:
+            dict: The plan spec (see FrofTransformer.spec)
+
+        """
+        from .transformer import FrofTransformer
+
+        if not self.cache_dir:
+            return FrofTransformer().spec(lark_parser(None).parse(frof))
+
+        key = hashlib.sha256(f"{_SPEC_VERSION}\0{SYNTAX}\0{frof}".encode()).hexdigest()
+        spec_dir = os.path.join(self.cache_dir, "specs")
+        path = os.path.join(spec_dir, key + ".json")
+        try:
+            with open(path, "r") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            pass
+
+        spec = FrofTransformer().spec(lark_parser(self.cache_dir).parse(frof))
+        try:
+            os.makedirs(spec_dir, exist_ok=True)
+            _prune(spec_dir, _MAX_CACHED_SPECS - 1)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as fh:
+                json.dump(spec, fh)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+        return spec
+
+
+def __getattr__(name: str):
+    # lark is only imported when a .frof file actually has to be parsed:
+    if name == "FrofTransformer":
+        from .transformer import FrofTransformer
+
+        return FrofTransformer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _prune(directory: str, keep: int) -> None:
+    """
+    Delete the least recently modified files in a directory, keeping `keep`.
+
+    Arguments:
+        directory (str): The directory to prune
+        keep (int): The number of files to keep
+
+    Returns:
+        None
+
+    """
+    entries = list(os.scandir(directory))
+    if len(entries) <= keep:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[: len(entries) - keep]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
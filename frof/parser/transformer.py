@@ -0,0 +1,123 @@
+import ast
+
+from lark import Transformer
+
+from ..compact import CompactPlan
+from . import JOB_OPTIONS, build_plan
+
+
+class FrofTransformer(Transformer):
+    """
+    Lark Transformer for Frof syntax.
+
+    You can probably ignore this, unless you're fiddling with the language.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._jobs = {}
+        self._edges = []
+        self._definitions = {}
+        self._params = {}
+        self._job_param_assignments = {}
+        self._job_options = {}
+        super().__init__(*args, **kwargs)
+
+    def _job(self, jobname) -> str:
+        jobname = str(jobname)
+        self._jobs.setdefault(jobname, None)
+        return jobname
+
+    def spec(self, tree) -> dict:
+        """
+        Turn a parse tree into a plan spec.
+
+        A spec is plain, JSON-serializable data: job names, commands, edges,
+        and the (unevaluated) source of each &variable definition. Nothing in
+        it depends on when it is built, so it can be cached, and built into a
+        CompactPlan (see build_plan) any number of times.
+
+        Arguments:
+            tree (lark.Tree): The parse tree of a .frof file
+
+        Returns:
+            dict: The plan spec
+
+        """
+        self._transform_tree(tree)
+        return {
+            "jobs": list(self._jobs),
+            "edges": self._edges,
+            "definitions": self._definitions,
+            "params": self._params,
+            "job_params": self._job_param_assignments,
+            "job_options": self._job_options,
+        }
+
+    def transform(self, tree) -> CompactPlan:
+        """
+        Turn a parse tree into a CompactPlan.
+
+        Arguments:
+            tree (lark.Tree): The parse tree of a .frof file
+
+        Returns:
+            CompactPlan: The job network
+
+        """
+        return build_plan(self.spec(tree))
+
+    def edgelist(self, edgelist):
+        jobnames = [self._job(e) for e in edgelist]
+        self._edges.extend([u, v] for u, v in zip(jobnames, jobnames[1:]))
+
+    def single_job(self, single_job):
+        self._job(single_job[0])
+
+    def jobname(self, job):
+        jobname, (param_set, max_parallel_count, options) = job
+
+        for param in param_set:
+            self._job_param_assignments[str(jobname)] = [param, max_parallel_count]
+        self._job_options.setdefault(str(jobname), {}).update(options)
+        return jobname
+
+    def job_args(self, job_args):
+        param_set, max_parallel_count, options = [], None, {}
+        for arg in job_args:
+            if isinstance(arg, list):
+                param_set = arg
+            elif isinstance(arg, tuple):
+                options[arg[0]] = arg[1]
+            else:
+                max_parallel_count = int(arg)
+        return param_set, max_parallel_count, options
+
+    def option(self, option):
+        key, value = option
+        key = str(key)
+        if key not in JOB_OPTIONS:
+            raise ValueError(
+                f"Unknown job option '{key}'. Options are: {sorted(JOB_OPTIONS)}"
+            )
+        if value.type == "ESCAPED_STRING":
+            value = ast.literal_eval(value)
+        return key, str(value)
+
+    def params(self, params):
+        for param in params:
+            self._params.setdefault(str(param), None)
+        return [str(p) for p in params]
+
+    def max_parallel_count(self, max_parallel_count):
+        return int(max_parallel_count.value)
+
+    def param_defn(self, param_defn):
+        param, param_defn = param_defn
+        self._params[str(param)] = str(param_defn).strip()
+
+    def definition(self, definition):
+        key, command = definition
+        self._definitions[str(key)] = str(command).strip()
+
+    def command(self, command):
+        return str(command).strip()
@@ -1,15 +1,13 @@
 from typing import Callable, List, Tuple, Union
 
 import abc
-import copy
 import hashlib
 import os
 import time
 import uuid
 from datetime import datetime
 
-import networkx as nx
-
+from ..compact import CompactPlan
 from ..parser import FrofParser
 from ..statusmonitor import NullStatusMonitor
 
@@ -41,17 +39,49 @@ class FrofPlan:
             None
 
         """
+        self._network = None
+        self.source = None
         if isinstance(frof, str):
             if "\n" not in frof:
                 try:
                     with open(os.path.expanduser(frof), "r") as fh:
-                        self.network = FrofParser().parse(fh.read())
+                        self.compact = FrofParser().parse(fh.read())
+                    self.source = os.path.abspath(os.path.expanduser(frof))
                 except FileNotFoundError:
-                    self.network = FrofParser().parse(frof)
+                    self.compact = FrofParser().parse(frof)
+            else:
+                self.compact = FrofParser().parse(frof)
         else:
-            self.network = frof
+            self._network = frof
+            self.compact = CompactPlan.from_networkx(frof)
         self.plan_id = self.generate_hash()
 
+    @property
+    def network(self) -> "nx.DiGraph":
+        """
+        The plan as a networkx graph, with one node per job.
+
+        Parsed plans are stored compactly; the graph is only built (once) the
+        first time it is asked for.
+
+        """
+        if self._network is None:
+            self._network = self.compact.to_networkx()
+        return self._network
+
+    def job_count(self) -> int:
+        """
+        Get the number of jobs in this Plan.
+
+        Arguments:
+            None
+
+        Returns:
+            int: The number of jobs, with every &variable sweep expanded
+
+        """
+        return self.compact.job_count()
+
     def generate_hash(self) -> str:
         """
         Generate a deterministic hash for this Plan.
@@ -65,19 +95,23 @@ class FrofPlan:
             str: The hash for this Plan
 
         """
-        long_str = ".".join([node_id for node_id in self.network.nodes()])
-        return hashlib.sha256(long_str.encode()).hexdigest()
+        h = hashlib.sha256()
+        for i, node_id in enumerate(self.compact.instance_names()):
+            h.update(("." + node_id if i else node_id).encode())
+        return h.hexdigest()
 
     def as_networkx(self):
         """
         Return this Plan as a NetworkX graph.
 
+        The plan is not copied: this is a read-only view of the plan network.
+        Call .copy() on the result if you need a graph that you can modify.
+
         Arguments:
             None
 
         Returns:
-            nx.DiGraph: This plan network
+            nx.DiGraph: A read-only view of this plan network
 
         """
-        return copy.deepcopy(self.network)
-
+        return self.network.copy(as_view=True)
@@ -0,0 +1,559 @@
+from array import array
+from collections import deque
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import heapq
+import itertools
+import time
+
+from frof.compact import JobRecord, ValueChunk
+
+PENDING = 0
+READY = 1
+RUNNING = 2
+DONE = 3
+FAILED = 4
+
+STATUS_NAMES = ["pending", "ready", "running", "done", "failed"]
+
+MAX_PARALLEL = 99999
+
+# With chunk=auto, chunks are sized to take about this many seconds each...
+AUTO_CHUNK_SECONDS = 0.5
+# ...but hold no more than this many values (they are passed in one
+# environment variable, whose size the kernel limits):
+MAX_AUTO_CHUNK = 1000
+
+
+class RunState:
+    """
+    The mutable state of a single execution of a FrofPlan.
+
+    A RunState never copies or mutates the plan it runs. It works on the
+    plan's CompactPlan, and keeps everything that changes during a run in
+    flat arrays indexed by job record: status, unfinished-predecessor counts,
+    and, for sweeps, how many of the record's jobs have been started and how
+    many have finished.
+
+    Lazy sweeps are pulled from one value at a time, only when a job of the
+    sweep is about to start; their size grows as values are pulled.
+
+    Ready records are started in order of priority: the expected time from
+    the start of the record to the end of the run, along its longest path of
+    successors. A record's expected time is the duration of one of its jobs
+    (from the durations passed in, e.g. from earlier runs; otherwise the mean
+    of the known durations, or 1 second, so that with nothing known the
+    longest chain of jobs goes first) times the number of rounds its sweep
+    needs under its max_parallel_count. While a sweep runs, its own priority
+    is updated from the durations of its finished jobs and the number of
+    values it has left.
+
+    Records with a chunk option start several values of their sweep as one
+    job. Counts (sizes, finished, total) are always in values, not jobs. With
+    chunk=auto, each record's chunk size starts at 1 and is adapted, as its
+    chunks finish, so that a chunk takes about AUTO_CHUNK_SECONDS.
+
+    """
+
+    def __init__(self, fp: "FrofPlan", durations: Dict[str, float] = None) -> None:
+        """
+        Create a new RunState for a plan.
+
+        Arguments:
+            fp (FrofPlan): The plan that this run executes
+            durations (Dict[str, float]: None): Expected seconds per job, by
+                the name of the job (or sweep) in the plan
+
+        Returns:
+            None
+
+        """
+        self.fp = fp
+        self.plan = fp.compact
+        self.records = self.plan.records
+        n = len(self.records)
+        self.status = array("b", bytes(n))
+        self.remaining = array("l", self.plan.in_degree)
+        self.sizes = array(
+            "l", (0 if record.lazy else len(record) for record in self.records)
+        )
+        self.cursor = array("l", [0]) * n
+        self.finished = array("l", [0]) * n
+        self.total = sum(self.sizes)
+        self.done_count = 0
+        self.done_records = 0
+
+        # Concrete jobs that are running, by name:
+        self.running = {}
+        self._running_records = {}
+        # Iterators of the lazy sweeps that are admitted but not exhausted:
+        self._iterators = {}
+        # For chunk=auto records: current chunk size, and seconds per value:
+        self._auto_chunk = {}
+        self._seconds_per_value = {}
+        # When each running job started, and the (count, total seconds) of
+        # each record's finished values:
+        self._started = {}
+        self._observed = {}
+        # When each record became ready (time.monotonic()):
+        self.ready_since = array("d", [0.0]) * n
+
+        # A heap of (-priority, sequence number, record index). A record has
+        # at most one live entry: the one whose sequence number is in
+        # self._entry (-1 if the record isn't in the heap). Pushing a record
+        # again, with a new priority, leaves its old entry behind as stale;
+        # stale entries are dropped when they reach the top of the heap.
+        self.ready = []
+        self._sequence = itertools.count()
+        self._entry = array("l", [-1]) * n
+        self._queued = 0
+        # Records waiting for a slot in their group, by group, and how many
+        # there are in all (so that ready_count() needn't add them up):
+        self.held = {}
+        self._held_count = 0
+        # Ready records that pop_ready() set aside because their resources
+        # didn't fit, until unblock() is called:
+        self.blocked = []
+        self.group_running = {}
+        self.group_limits = {}
+        for record in self.records:
+            if record.group and record.group not in self.group_limits:
+                self.group_limits[record.group] = int(
+                    record.max_parallel_count or MAX_PARALLEL
+                )
+
+        durations = durations or {}
+        known = [durations[rec.name] for rec in self.records if rec.name in durations]
+        default = sum(known) / len(known) if known else 1.0
+        self.seconds = array(
+            "d", (durations.get(record.name, default) for record in self.records)
+        )
+        self.priority = array("d", [0.0]) * n
+        for r in reversed(self.plan.topological_order()):
+            self.priority[r] = self._path_seconds(r)
+
+        self._admit([r for r in range(n) if self.remaining[r] == 0])
+
+    def __len__(self) -> int:
+        return self.total
+
+    def _path_seconds(self, r: int) -> float:
+        """
+        Estimate the time from now until the end of a record's longest path.
+
+        Arguments:
+            r (int): The index of the record (whose successors' priorities
+                must already be known)
+
+        Returns:
+            float: The expected seconds
+
+        """
+        record = self.records[r]
+        limit = self.group_limits[record.group] if record.group else 1
+        rounds = max(1.0, (self.sizes[r] - self.cursor[r]) / limit)
+        downstream = max(
+            (self.priority[s] for s in self.plan.successors(r)), default=0.0
+        )
+        return self.seconds[r] * rounds + downstream
+
+    def _push_ready(self, r: int) -> None:
+        if self._entry[r] < 0:
+            self._queued += 1
+        self._entry[r] = next(self._sequence)
+        heapq.heappush(self.ready, (-self.priority[r], self._entry[r], r))
+
+    def _peek_ready(self) -> Optional[int]:
+        # The record with the top live entry of the heap, if any:
+        while self.ready:
+            _, k, r = self.ready[0]
+            if self._entry[r] == k:
+                return r
+            heapq.heappop(self.ready)
+        return None
+
+    def _pop_ready(self) -> int:
+        # Take the record returned by the last _peek_ready() off the heap:
+        r = heapq.heappop(self.ready)[2]
+        self._entry[r] = -1
+        self._queued -= 1
+        return r
+
+    def ready_count(self) -> int:
+        """
+        Get the number of records that are ready, including held ones.
+
+        Arguments:
+            None
+
+        Returns:
+            int: The number of ready records
+
+        """
+        return self._queued + self._held_count + len(self.blocked)
+
+    def unblock(self) -> None:
+        """
+        Queue the records that were set aside because they didn't fit.
+
+        Call this whenever resources are released.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        blocked, self.blocked = self.blocked, []
+        for r in blocked:
+            self._push_ready(r)
+
+    def _admit(self, records) -> None:
+        """
+        Queue job records whose dependencies have all finished.
+
+        Empty sweeps have nothing to run, so they finish immediately and
+        admit their own successors in turn.
+
+        Arguments:
+            records (List[int]): The indices of the records
+
+        Returns:
+            None
+
+        """
+        stack = list(records)
+        while stack:
+            r = stack.pop()
+            if self.records[r].lazy:
+                self._iterators[r] = iter(self.records[r].values)
+            elif self.sizes[r] == 0:
+                stack.extend(self._complete(r))
+                continue
+            self.status[r] = READY
+            self.ready_since[r] = time.monotonic()
+            self._push_ready(r)
+
+    def _complete(self, r: int) -> list:
+        """
+        Mark a record as done, and find the successors that it unblocks.
+
+        Arguments:
+            r (int): The index of the record
+
+        Returns:
+            List[int]: The successors with no more unfinished dependencies
+
+        """
+        self.status[r] = DONE
+        self.done_records += 1
+        unblocked = []
+        for s in self.plan.successors(r):
+            self.remaining[s] -= 1
+            if self.remaining[s] == 0:
+                unblocked.append(s)
+        return unblocked
+
+    def pop_ready(
+        self, fits: Callable[[JobRecord], bool] = None
+    ) -> Optional[Tuple[str, "Job"]]:
+        """
+        Take the next job that may start, and mark it as running.
+
+        A record whose parallelism group is at its max_parallel_count is moved
+        to that group's held queue until one of the group's jobs finishes.
+
+        Records that declare resources are set aside (but stay ready) if they
+        don't fit, so that smaller jobs further down the queue can fill the
+        capacity that is left. They are not looked at again until unblock()
+        is called, since taking resources can't make them fit.
+
+        Arguments:
+            fits (Callable: None): Called with a record that declares
+                resources; returns whether one of its jobs fits right now
+
+        Returns:
+            Tuple[str, Job]: (Job Name, Job Object), or None if no job may
+                start right now
+
+        """
+        while True:
+            r = self._peek_ready()
+            if r is None:
+                return None
+            record = self.records[r]
+            group = record.group
+            running = self.group_running.get(group, 0) if group else 0
+            if group and running >= self.group_limits[group]:
+                held = self.held.setdefault(group, deque())
+                held.append(self._pop_ready())
+                self._held_count += 1
+                continue
+            if fits is not None and record.resources and not fits(record):
+                self.blocked.append(self._pop_ready())
+                continue
+
+            if record.chunk is not None:
+                value = self._pop_chunk(r)
+                if value is None:
+                    continue
+                name, job = record.make_chunk(value)
+            elif record.lazy:
+                try:
+                    value = next(self._iterators[r])
+                except StopIteration:
+                    del self._iterators[r]
+                    self._pop_ready()
+                    if self.status[r] == READY:
+                        self.status[r] = RUNNING
+                    if self.finished[r] == self.sizes[r]:
+                        self._admit(self._complete(r))
+                    continue
+                self.sizes[r] += 1
+                self.total += 1
+                self.cursor[r] += 1
+                name, job = record.make_instance(value)
+            else:
+                k = self.cursor[r]
+                self.cursor[r] += 1
+                if self.cursor[r] == self.sizes[r]:
+                    self._pop_ready()
+                    if self.status[r] == READY:
+                        self.status[r] = RUNNING
+                name, job = record.instance(k)
+                value = record.values[k] if record.param is not None else None
+
+            if group:
+                self.group_running[group] = self.group_running.get(group, 0) + 1
+            self.running[name] = job
+            self._running_records[name] = (r, value)
+            self._started[name] = time.monotonic()
+            return name, job
+
+    def _pop_chunk(self, r: int) -> Optional[ValueChunk]:
+        """
+        Take the values of the next chunk of a (ready) chunked record.
+
+        Arguments:
+            r (int): The index of the record
+
+        Returns:
+            ValueChunk: The values, or None if a lazy sweep turned out to be
+                exhausted (in which case the record is no longer ready)
+
+        """
+        record = self.records[r]
+        size = self._auto_chunk.get(r, 1) if record.chunk == "auto" else record.chunk
+        if record.lazy:
+            values = ValueChunk(itertools.islice(self._iterators[r], size))
+            if not values:
+                del self._iterators[r]
+                self._pop_ready()
+                if self.status[r] == READY:
+                    self.status[r] = RUNNING
+                if self.finished[r] == self.sizes[r]:
+                    self._admit(self._complete(r))
+                return None
+            self.sizes[r] += len(values)
+            self.total += len(values)
+            self.cursor[r] += len(values)
+            return values
+        k = self.cursor[r]
+        self.cursor[r] = min(k + size, self.sizes[r])
+        if self.cursor[r] == self.sizes[r]:
+            self._pop_ready()
+            if self.status[r] == READY:
+                self.status[r] = RUNNING
+        return ValueChunk(record.values[k : self.cursor[r]])
+
+    def _observe(self, r: int, seconds: float, count: int) -> None:
+        """
+        Learn from how long a record's job took.
+
+        If the record still has values to start, its priority is updated,
+        since it depends on the record's duration and how much is left of it.
+
+        Arguments:
+            r (int): The index of the record
+            seconds (float): How long the job took
+            count (int): The number of values that the job ran
+
+        Returns:
+            None
+
+        """
+        finished, total = self._observed.get(r, (0, 0.0))
+        finished, total = finished + count, total + seconds
+        self._observed[r] = (finished, total)
+        self.seconds[r] = total / finished
+        if self.status[r] == READY:
+            # Each re-queueing leaves a stale entry in the heap, so only do it
+            # if the priority changed by more than 10%. (Held records are
+            # queued with their current priority once they are released.)
+            priority = self._path_seconds(r)
+            if abs(priority - self.priority[r]) > 0.1 * self.priority[r]:
+                self.priority[r] = priority
+                if self._entry[r] >= 0:
+                    self._push_ready(r)
+        if self.records[r].chunk == "auto":
+            self._resize_chunk(r, seconds / count)
+
+    def _resize_chunk(self, r: int, seconds: float) -> None:
+        """
+        Adapt a chunk=auto record's chunk size to how long a chunk took.
+
+        The chunk size at most doubles each time, so that one fast chunk
+        can't make the next one huge.
+
+        Arguments:
+            r (int): The index of the record
+            seconds (float): The seconds per value of the chunk
+
+        Returns:
+            None
+
+        """
+        previous = self._seconds_per_value.get(r)
+        if previous is not None:
+            seconds = (previous + seconds) / 2
+        self._seconds_per_value[r] = seconds
+        size = int(AUTO_CHUNK_SECONDS / max(seconds, 1e-6))
+        limit = min(2 * self._auto_chunk.get(r, 1), MAX_AUTO_CHUNK)
+        self._auto_chunk[r] = max(1, min(size, limit))
+
+    def instance_of(self, name: str) -> Tuple[int, object]:
+        """
+        Find out which record (and which value of its sweep) a job belongs to.
+
+        Arguments:
+            name (str): The name of a running job
+
+        Returns:
+            Tuple[int, object]: (record index, &variable value or None)
+
+        """
+        return self._running_records[name]
+
+    def finish(self, name: str) -> None:
+        """
+        Mark a running job as successfully finished.
+
+        Once every job of a record has finished, the successors whose last
+        unfinished dependency it was are admitted.
+
+        Arguments:
+            name (str): The name of the job
+
+        Returns:
+            None
+
+        """
+        r, value = self._running_records.pop(name)
+        del self.running[name]
+        count = len(value) if isinstance(value, ValueChunk) else 1
+        self.done_count += count
+        self.finished[r] += count
+        self._observe(r, time.monotonic() - self._started.pop(name), count)
+
+        group = self.records[r].group
+        if group:
+            self.group_running[group] -= 1
+            held = self.held.get(group)
+            if held:
+                self._push_ready(held.popleft())
+                self._held_count -= 1
+
+        if self.finished[r] == self.sizes[r] and r not in self._iterators:
+            self._admit(self._complete(r))
+
+    def fail(self, name: str) -> None:
+        """
+        Mark a running job as failed. Its successors are never admitted.
+
+        The rest of its sweep (if any) may still run, and a slot of its
+        parallelism group is freed, so that a run can keep going after a
+        failure and only skip what depends on it.
+
+        Arguments:
+            name (str): The name of the job
+
+        Returns:
+            None
+
+        """
+        r, _ = self._running_records.pop(name)
+        del self.running[name]
+        self._started.pop(name, None)
+        self.status[r] = FAILED
+        group = self.records[r].group
+        if group:
+            self.group_running[group] -= 1
+            held = self.held.get(group)
+            if held:
+                self._push_ready(held.popleft())
+                self._held_count -= 1
+
+    def is_complete(self) -> bool:
+        """
+        Check whether every job of the plan has finished successfully.
+
+        Arguments:
+            None
+
+        Returns:
+            bool: True if the run is complete
+
+        """
+        return self.done_records == len(self.records)
+
+    def remaining_count(self) -> int:
+        """
+        Get the number of jobs that have not finished yet.
+
+        Jobs of lazy sweeps are only counted once they have been pulled.
+
+        Arguments:
+            None
+
+        Returns:
+            int: The number of pending and running jobs
+
+        """
+        return self.total - self.done_count
+
+    def unfinished(self) -> Iterator[Tuple[str, "Job", str]]:
+        """
+        Iterate over the jobs that have not finished yet.
+
+        Concrete jobs of sweeps are built on the fly, so this costs
+        O(remaining jobs); it is meant for inspection, not for scheduling.
+        Lazy sweeps only list their running jobs. Chunked records list their
+        running chunks, and each of their pending values as its own job.
+
+        Arguments:
+            None
+
+        Returns:
+            Iterator[Tuple[str, Job, str]]: (Job Name, Job Object, status name)
+
+        """
+        for r, record in enumerate(self.records):
+            if self.status[r] == DONE:
+                continue
+            if record.lazy or record.chunk is not None:
+                for name, (r_running, _) in list(self._running_records.items()):
+                    if r_running == r:
+                        yield name, self.running[name], STATUS_NAMES[RUNNING]
+                if record.lazy:
+                    continue
+                for k in range(self.cursor[r], self.sizes[r]):
+                    name, job = record.instance(k)
+                    yield name, job, STATUS_NAMES[PENDING]
+                continue
+            for k in range(self.sizes[r]):
+                name = record.instance_name(k)
+                if name in self.running:
+                    yield name, self.running[name], STATUS_NAMES[RUNNING]
+                elif k >= self.cursor[r]:
+                    yield name, record.instance(k)[1], STATUS_NAMES[PENDING]
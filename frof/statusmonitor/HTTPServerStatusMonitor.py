@@ -1,25 +1,75 @@
 from datetime import datetime
+import json
 import threading
+import time
 
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 
 
+from .. import metrics
 from .StatusMonitor import StatusMonitor
 
+# The most jobs that /status lists at once:
+MAX_PAGE_SIZE = 1000
+
+# Each /events client gets at most this many messages per second; changes
+# that happen in between are sent together:
+EVENTS_PER_SECOND = 10
+
+# Idle /events streams send a comment this often, so proxies keep them open:
+KEEPALIVE_SECONDS = 15
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"id: {data['version']}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _coalesce(changes: list) -> list:
+    # Keep only the latest change of each job, in order of version:
+    latest = {}
+    for change in changes:
+        latest.pop(change["name"], None)
+        latest[change["name"]] = change
+    return list(latest.values())
+
 
 class HTTPServerStatusMonitor(StatusMonitor):
+    """
+    A status monitor that serves a web page (and a JSON API) about the run.
+
+    GET /status returns the run's counters and a page of its running and
+    failed jobs (?offset=0&limit=100). With ?since=VERSION, it returns only
+    the job state changes after that version (or, if they are too old to
+    be remembered, a fresh page with "reset": true). Every response has an
+    ETag; a request with a matching If-None-Match gets a 304.
+
+    GET /events is a server-sent event stream of the same data: a "reset"
+    event with the counters and a page of jobs, then "changes" events (at
+    most EVENTS_PER_SECOND of them, each with only the latest change of
+    each job since the last one), and an "end" event once the run is over.
+    Clients that reconnect with Last-Event-ID only get what they missed.
+
+    All of this is read from the executor's StatusSnapshot, so it costs the
+    same for a run of 100,000 jobs as for a run of 10.
+    """
+
+    # Pages are built from the snapshot when they are requested:
+    refresh_rate = 0
+
     def __init__(self, fe: "FrofExecutor", port: int = 8111) -> None:
         self.fe = fe
         self.port = port
 
         self.started_time = datetime.now()
-        self.total_job_count = len(self.fe.fp.as_networkx())
+        self.total_job_count = self.fe.fp.job_count()
 
         self.app = Flask(__name__)
         CORS(self.app)
         self.app.add_url_rule("/", "home", self._home)
         self.app.add_url_rule("/status", "status", self._status)
+        self.app.add_url_rule("/events", "events", self._events)
+        self.app.add_url_rule("/metrics", "metrics", self._metrics)
         thread = threading.Thread(
             target=self.app.run, kwargs=dict(host="0.0.0.0", port=self.port)
         )
@@ -67,7 +117,7 @@ class HTTPServerStatusMonitor(StatusMonitor):
                                                     <code>{{ job.cmd }}</code>
                                                 </div>
                                                 <div class="column">
-                                                    {{ job.env }}
+                                                    {{ job.error }}
                                                 </div>
                                             </div>
                                         </div>
@@ -85,7 +135,8 @@ class HTTPServerStatusMonitor(StatusMonitor):
                             classify(s) {
                                 return {
                                     "running": "is-info",
-                                    "pending": ""
+                                    "retrying": "is-warning",
+                                    "failed": "is-danger"
                                 }[s];
                             }
                         }
@@ -104,19 +155,32 @@ class HTTPServerStatusMonitor(StatusMonitor):
                         </div>`,
                         created() {
                             console.log("creating...");
-                            window.setInterval(() => {
-                                fetch("[[URL]]/status").then(res => res.json()).then(res => {
-                                    this.jobs = res.remaining_jobs;
-                                    this.started_at = res.started_at;
-                                    //this.started_at = new Date(res.started_at).toLocaleString();
-                                    this.pct = res.pct * 100;
-                                    setTitle(`(${Math.ceil(this.pct)}%)`);
-                                }).catch(() => {
-                                    this.jobs = [];
-                                    this.pct = 100;
-                                    setTitle(`Idle`);
+                            let byName = {};
+                            let update = (res) => {
+                                (res.changes || []).forEach(change => {
+                                    if (["running", "retrying", "failed"].includes(change.status)) {
+                                        byName[change.name] = change;
+                                    } else {
+                                        delete byName[change.name];
+                                    }
                                 });
-                            }, 1000);
+                                this.jobs = Object.values(byName);
+                                this.started_at = res.started_at;
+                                this.pct = res.pct * 100;
+                                setTitle(`(${Math.ceil(this.pct)}%)`);
+                            };
+                            let events = new EventSource("[[URL]]/events");
+                            events.addEventListener("reset", (e) => {
+                                let res = JSON.parse(e.data);
+                                byName = {};
+                                res.jobs.forEach(job => { byName[job.name] = job; });
+                                update(res);
+                            });
+                            events.addEventListener("changes", (e) => update(JSON.parse(e.data)));
+                            events.addEventListener("end", () => {
+                                events.close();
+                                setTitle(`Done`);
+                            });
                         },
                         data: {
                             jobs: [],
@@ -132,31 +196,64 @@ class HTTPServerStatusMonitor(StatusMonitor):
         )
 
     def _status(self):
-        next_jobs = self.fe.get_next_jobs()
-        next_job_count = len(next_jobs)
-        remaining_count = len(self.fe.get_current_network())
-        return jsonify(
-            {
-                "started_at": self.started_time,
-                "pct": (self.total_job_count - remaining_count) / self.total_job_count,
-                "remaining_count": remaining_count,
-                "running": next_job_count,
-                "remaining_jobs": list(
-                    [
-                        {
-                            "cmd": str(v["job"].cmd),
-                            "type": str(type(v["job"]).__name__),
-                            "status": "running"
-                            if i in [i for i, k in next_jobs]
-                            else "pending",
-                            "env": v["job"].env,
-                        }
-                        for i, v in self.fe.get_current_network().nodes(data=True)
-                    ]
-                ),
-            }
+        snapshot = self.fe.get_status_snapshot()
+        etag = f"{snapshot.run_id}-{snapshot.version}"
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+        try:
+            offset = max(int(request.args.get("offset", 0)), 0)
+            limit = min(max(int(request.args.get("limit", 100)), 0), MAX_PAGE_SIZE)
+            since = request.args.get("since")
+            since = None if since is None else int(since)
+        except ValueError:
+            return jsonify({"error": "offset, limit, and since must be integers"}), 400
+
+        status = None if since is None else snapshot.changes_since(since)
+        if status is None:
+            status = snapshot.page(offset, limit)
+            status["reset"] = since is not None
+        response = jsonify(status)
+        response.set_etag(f"{status['run_id']}-{status['version']}")
+        return response
+
+    def _metrics(self):
+        return Response(
+            self.fe.get_metrics().render(), content_type=metrics.CONTENT_TYPE
+        )
+
+    def _events(self):
+        snapshot = self.fe.get_status_snapshot()
+        version = request.headers.get("Last-Event-ID", request.args.get("since"))
+        try:
+            version = None if version is None else int(version)
+        except ValueError:
+            version = None
+        return Response(
+            self._event_stream(snapshot, version),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
         )
 
+    def _event_stream(self, snapshot: "StatusSnapshot", version: int = None):
+        while True:
+            status = None if version is None else snapshot.changes_since(version)
+            if status is None:
+                status = snapshot.page(0, MAX_PAGE_SIZE)
+                yield _sse("reset", status)
+            elif status["version"] != version:
+                status["changes"] = _coalesce(status["changes"])
+                yield _sse("changes", status)
+            version = status["version"]
+            if status["finished"]:
+                yield _sse("end", {"version": version})
+                return
+            # Let changes pile up for a moment, so that a busy run sends a few
+            # big messages rather than one per job:
+            time.sleep(1 / EVENTS_PER_SECOND)
+            if snapshot.wait(version, KEEPALIVE_SECONDS) == version:
+                yield ": keep-alive\n\n"
+
     def launch_status(self):
         self.status = ""
 
@@ -8,6 +8,8 @@ class NullStatusMonitor(StatusMonitor):
     Do not use directly.
     """
 
+    refresh_rate = 0
+
     def __init__(self, fe, **kwargs):
         return
 
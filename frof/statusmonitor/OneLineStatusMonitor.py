@@ -37,14 +37,15 @@ class OneLineStatusMonitor(StatusMonitor):
         """
         self.fe = fe
         self.started_time = datetime.now()
-        self.total_job_count = len(self.fe.fp.as_networkx())
+        self.total_job_count = self.fe.fp.job_count()
 
     def emit_status(self):
         """
         Emit the current status of self.fe.
 
         Prints directly to stdout. Uses emojis. This is not the most backward-
-        compatible of all systems.
+        compatible of all systems. Only reads the executor's StatusSnapshot,
+        so it is safe to call from the status refresher's thread.
 
         Arguments:
             None
@@ -53,17 +54,17 @@ class OneLineStatusMonitor(StatusMonitor):
             None
 
         """
-        next_job_count = len(self.fe.get_next_jobs())
-        if next_job_count:
+        status = self.fe.get_status_snapshot().counters()
+        running = status["running"]
+        if running:
             emoji = "🤔"
         else:
             emoji = "👌"
-        remaining = len(self.fe.get_current_network())
-
-        pct = (self.total_job_count - remaining) / self.total_job_count
+        retrying = f", {status['retrying']} to retry" if status["retrying"] else ""
         print(
-            f"{emoji} ———— {next_job_count} jobs running, {remaining} remaining ({int(100*pct)}%).         ",
+            f"{emoji} ———— {running} jobs running{retrying}, {status['remaining']} remaining ({int(100*status['pct'])}%).         ",
             end="\r",
+            flush=True,
         )
 
     def launch_status(self):
@@ -78,7 +79,7 @@ class OneLineStatusMonitor(StatusMonitor):
 
         """
         print(
-            f"Starting job with {len(self.fe.get_network())} jobs total.         ",
+            f"Starting job with {self.total_job_count} jobs total.         ",
             end="\r",
         )
 
@@ -1,14 +1,24 @@
 import abc
 
+from .StatusRefresher import DEFAULT_REFRESH_RATE
+
 
 class StatusMonitor(abc.ABC):
     """
     Abstract class for status-monitoring capabilities.
 
     Do not use directly.
+
+    Monitors are not called by the executor's scheduling loop: a
+    StatusRefresher calls emit_status, on its own thread, at most
+    refresh_rate times a second (and once more when the run ends). So
+    emit_status should read the executor's StatusSnapshot, which is safe to
+    read from any thread, rather than its RunState. Monitors that are never
+    redrawn (like one that serves the snapshot on request) set refresh_rate
+    to 0.
     """
 
-    ...
+    refresh_rate = DEFAULT_REFRESH_RATE
 
     def emit_status(self):
         """
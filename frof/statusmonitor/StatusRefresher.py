@@ -0,0 +1,77 @@
+import threading
+import time
+
+# How many times a second a status monitor is redrawn, at most:
+DEFAULT_REFRESH_RATE = 4
+
+
+class StatusRefresher:
+    """
+    Redraws a status monitor on its own thread, at a fixed rate.
+
+    The executor never calls a monitor while it schedules jobs: it only
+    updates its StatusSnapshot, which costs a few dict operations under a
+    lock. This thread checks the snapshot refresh_rate times a second and,
+    if anything changed, calls the monitor's emit_status. So a slow terminal
+    (or anything else a monitor waits on) can only slow down the redraws,
+    never the run, and a run that finishes thousands of jobs a second still
+    only redraws a few times a second.
+
+    """
+
+    def __init__(
+        self,
+        monitor: "StatusMonitor",
+        snapshot: "StatusSnapshot",
+        refresh_rate: float = None,
+    ) -> None:
+        """
+        Start redrawing a status monitor.
+
+        Arguments:
+            monitor (StatusMonitor): The monitor to redraw
+            snapshot (StatusSnapshot): The snapshot that the monitor reads
+            refresh_rate (float: None): The most redraws a second. Defaults
+                to the monitor's refresh_rate (or DEFAULT_REFRESH_RATE); if
+                that is 0, the monitor is never redrawn
+
+        Returns:
+            None
+
+        """
+        if refresh_rate is None:
+            refresh_rate = getattr(monitor, "refresh_rate", DEFAULT_REFRESH_RATE)
+        self.monitor = monitor
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._stopped = False
+        if refresh_rate:
+            self._interval = 1 / refresh_rate
+            thread = threading.Thread(target=self._run, daemon=True)
+            thread.start()
+
+    def _run(self) -> None:
+        version = None
+        while True:
+            time.sleep(self._interval)
+            with self._lock:
+                if self._stopped:
+                    return
+                if self.snapshot.version == version:
+                    continue
+                version = self.snapshot.version
+                self.monitor.emit_status()
+
+    def stop(self) -> None:
+        """
+        Stop redrawing. Returns at once, unless a redraw is under way.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._stopped = True
@@ -0,0 +1,303 @@
+from collections import deque
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+import threading
+
+# How many job state changes to remember for `since` queries:
+DEFAULT_LOG_SIZE = 10000
+
+
+class StatusSnapshot:
+    """
+    A cheap-to-read summary of a run, kept up to date by the executor.
+
+    The snapshot holds counters (total, done, running, failed, retrying), a
+    table of the jobs that are running, waiting to be retried, or have
+    failed, and a log of the most recent
+    job state changes. Every change bumps the snapshot's version, so a
+    reader that has seen version v can ask for just the changes since v.
+
+    Jobs that finish successfully leave the table (they are only counted,
+    and remembered in the change log), and pending jobs are never listed,
+    so the snapshot stays small however big the plan is. Writers take a
+    lock for a few dict operations; readers copy what they need under the
+    same lock and do their formatting outside it.
+
+    """
+
+    def __init__(self, log_size: int = None) -> None:
+        """
+        Create a new, empty StatusSnapshot.
+
+        Arguments:
+            log_size (int: 10000): How many state changes to remember
+
+        Returns:
+            None
+
+        """
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._log = deque(maxlen=log_size or DEFAULT_LOG_SIZE)
+        self.reset()
+
+    def reset(self, run_id: str = None) -> None:
+        """
+        Forget everything, for a new run.
+
+        Arguments:
+            run_id (str: None): The FROF_RUN_ID of the new run
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self.run_id = run_id
+            self.started_at = datetime.now().isoformat()
+            self.version = 0
+            self.total = 0
+            self.done = 0
+            self.running = 0
+            self.failed = 0
+            self.retrying = 0
+            self.finished = False
+            self._progress = None
+            self._jobs = {}
+            self._log.clear()
+            self._changed.notify_all()
+
+    def _change(self, name: str, status: str) -> None:
+        # Must hold self._lock.
+        self.version += 1
+        job = self._jobs.get(name)
+        self._log.append((self.version, name, status, job))
+        if job is not None:
+            job["status"] = status
+            job["version"] = self.version
+        self._changed.notify_all()
+
+    def job_started(self, name: str, job: "Job") -> None:
+        """
+        Record that a job started.
+
+        Arguments:
+            name (str): The name of the job
+            job (Job): The job
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self.running += 1
+            previous = self._jobs.get(name)
+            if previous is not None and previous["status"] == "retrying":
+                self.retrying -= 1
+            self._jobs[name] = {
+                "name": name,
+                "type": type(job).__name__,
+                "cmd": str(getattr(job, "cmd", job)),
+            }
+            self._change(name, "running")
+
+    def job_finished(
+        self,
+        name: str,
+        failed: bool = False,
+        retrying: bool = False,
+        error: str = None,
+    ) -> None:
+        """
+        Record that a job that was started has finished.
+
+        Arguments:
+            name (str): The name of the job
+            failed (bool: False): Whether the job failed
+            retrying (bool: False): Whether the job failed, but will be run
+                again (it stays listed, as "retrying", until it is)
+            error (str: None): Why the job failed, to list with it
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self.running -= 1
+            if error is not None:
+                self._jobs[name]["error"] = error
+            if retrying:
+                self.retrying += 1
+                self._change(name, "retrying")
+            elif failed:
+                self.failed += 1
+                self._change(name, "failed")
+            else:
+                self._change(name, "done")
+                del self._jobs[name]
+
+    def job_skipped(self, name: str) -> None:
+        """
+        Record that a job was not run, because it had already succeeded.
+
+        Arguments:
+            name (str): The name of the job
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._change(name, "skipped")
+
+    def track_progress(self, progress: Callable[[], Tuple[int, int]]) -> None:
+        """
+        Read the job counts of the run from a function, whenever they are read.
+
+        This saves the executor from updating them as each job finishes. The
+        counts still change with the version, since every job that starts,
+        finishes, or is skipped is a change of its own.
+
+        Arguments:
+            progress (Callable): Returns (total, done), as for set_progress()
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._progress = progress
+
+    def set_progress(self, total: int, done: int, finished: bool = False) -> None:
+        """
+        Update the job counts of the run, and stop tracking them.
+
+        Arguments:
+            total (int): How many jobs the run has (so far, for lazy sweeps)
+            done (int): How many of them have succeeded or been skipped
+            finished (bool: False): Whether the run is over
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._progress = None
+            if (total, done, finished) != (self.total, self.done, self.finished):
+                self.total, self.done, self.finished = total, done, finished
+                self.version += 1
+                self._changed.notify_all()
+
+    def wait(self, version: int, timeout: float = None) -> int:
+        """
+        Wait until the snapshot is no longer at a version.
+
+        Arguments:
+            version (int): The version that the reader has seen
+            timeout (float: None): The most seconds to wait
+
+        Returns:
+            int: The current version (which is `version` on timeout)
+
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _counters(self) -> dict:
+        # Must hold self._lock.
+        if self._progress is not None:
+            self.total, self.done = self._progress()
+        return {
+            "run_id": self.run_id,
+            "version": self.version,
+            "started_at": self.started_at,
+            "finished": self.finished,
+            "total": self.total,
+            "done": self.done,
+            "running": self.running,
+            "failed": self.failed,
+            "retrying": self.retrying,
+            "remaining": self.total - self.done,
+            "pct": self.done / max(self.total, 1),
+        }
+
+    def counters(self) -> dict:
+        """
+        Get just the counters of the run.
+
+        Arguments:
+            None
+
+        Returns:
+            dict: run_id, version, started_at, finished, total, done,
+                running, failed, retrying, remaining, and pct
+
+        """
+        with self._lock:
+            return self._counters()
+
+    def page(self, offset: int = 0, limit: int = 100) -> dict:
+        """
+        Get the counters, and a page of the running and failed jobs.
+
+        Jobs are listed in the order of their last change, oldest first.
+
+        Arguments:
+            offset (int: 0): How many jobs to skip
+            limit (int: 100): The most jobs to list
+
+        Returns:
+            dict: The counters, plus jobs, job_count, offset, and limit
+
+        """
+        with self._lock:
+            status = self._counters()
+            jobs = sorted(self._jobs.values(), key=lambda job: job["version"])
+            status["job_count"] = len(jobs)
+            status["jobs"] = [dict(job) for job in jobs[offset : offset + limit]]
+        status["offset"] = offset
+        status["limit"] = limit
+        return status
+
+    def changes_since(self, version: int) -> Optional[dict]:
+        """
+        Get the counters, and the job state changes after a version.
+
+        Arguments:
+            version (int): The last version that the reader has seen
+
+        Returns:
+            dict: The counters, plus a list of changes (version, name,
+                status, and the job's type, cmd, and error if it was
+                started), or None if the changes are no longer all in the
+                log (then the reader must start over from page())
+
+        """
+        with self._lock:
+            if version > self.version:
+                return None
+            wrapped = len(self._log) == self._log.maxlen
+            if wrapped and version < self._log[0][0] - 1:
+                return None
+            status = self._counters()
+            changes = []
+            for entry in reversed(self._log):
+                if entry[0] <= version:
+                    break
+                changes.append(entry)
+        changes.reverse()
+        status["since"] = version
+        status["changes"] = [
+            {
+                "version": v,
+                "name": name,
+                "status": job_status,
+                "type": job and job["type"],
+                "cmd": job and job["cmd"],
+                "error": job and job.get("error"),
+            }
+            for v, name, job_status, job in changes
+        ]
+        return status
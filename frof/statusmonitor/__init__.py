@@ -1,4 +1,16 @@
 from .StatusMonitor import StatusMonitor
 from .NullStatusMonitor import NullStatusMonitor
-from .HTTPServerStatusMonitor import HTTPServerStatusMonitor
 from .OneLineStatusMonitor import OneLineStatusMonitor
+from .StatusRefresher import StatusRefresher
+from .StatusSnapshot import StatusSnapshot
+
+
+def __getattr__(name: str):
+    # Flask is only imported if the HTTP status monitor is actually used:
+    if name == "HTTPServerStatusMonitor":
+        from .HTTPServerStatusMonitor import HTTPServerStatusMonitor
+
+        # Importing the submodule binds its name here, so rebind it to the class:
+        globals()[name] = HTTPServerStatusMonitor
+        return HTTPServerStatusMonitor
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,132 @@
+from typing import Optional
+
+import fcntl
+import os
+import shutil
+
+_HOME = os.path.expanduser("~")
+
+DEFAULT_TOKEN_DIR = os.path.join(_HOME, ".frof", "tokens")
+
+# The environment variable that hands a token pool down to nested frofs:
+TOKEN_POOL_VAR = "FROF_TOKEN_POOL"
+
+
+class TokenPool:
+    """
+    A machine-wide pool of job tokens, shared by every frof in a run tree.
+
+    Like the jobserver of GNU make, each frof process may always run one job
+    without a token (its "implicit" token: the one held by the job that
+    started it, if any). Every other job it runs at the same time must hold a
+    token from the pool. However deeply frofs are nested, no more than the
+    pool's size plus one jobs run at once.
+
+    Tokens are slot files in a directory named after the root FROF_RUN_ID. A
+    token is held by holding an flock on its slot file, so the tokens of a
+    process that dies are returned to the pool by the kernel.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Join an existing TokenPool.
+
+        Arguments:
+            path (str): The directory of the pool
+
+        Returns:
+            None
+
+        """
+        self.path = path
+        self._fds = [
+            os.open(os.path.join(path, slot), os.O_RDWR)
+            for slot in sorted(os.listdir(path))
+        ]
+        self._held = set()
+        # Start looking at a different slot in each process, to spread out
+        # the contention on the slot files:
+        self._next = os.getpid() % len(self._fds) if self._fds else 0
+
+    @classmethod
+    def create(cls, run_id: str, size: int, token_dir: str = None) -> "TokenPool":
+        """
+        Create a new TokenPool for the root run of a run tree.
+
+        Arguments:
+            run_id (str): The FROF_RUN_ID of the root run
+            size (int): The number of tokens in the pool
+            token_dir (str: ~/.frof/tokens): Where to keep token pools
+
+        Returns:
+            TokenPool: The pool
+
+        """
+        token_dir = os.path.expanduser(token_dir or DEFAULT_TOKEN_DIR)
+        path = os.path.join(token_dir, run_id)
+        os.makedirs(path, exist_ok=True)
+        for k in range(size):
+            open(os.path.join(path, "slot-{:06d}".format(k)), "a").close()
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self._fds)
+
+    def acquire(self) -> Optional[int]:
+        """
+        Take a token from the pool, if one is free. Never blocks.
+
+        Arguments:
+            None
+
+        Returns:
+            int: The token, or None if every token is in use
+
+        """
+        n = len(self._fds)
+        for offset in range(n):
+            k = (self._next + offset) % n
+            if k in self._held:
+                continue
+            try:
+                fcntl.flock(self._fds[k], fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            self._held.add(k)
+            self._next = (k + 1) % n
+            return k
+        return None
+
+    def release(self, token: int) -> None:
+        """
+        Return a token to the pool.
+
+        Arguments:
+            token (int): A token from acquire()
+
+        Returns:
+            None
+
+        """
+        self._held.discard(token)
+        fcntl.flock(self._fds[token], fcntl.LOCK_UN)
+
+    def close(self, remove: bool = False) -> None:
+        """
+        Return all held tokens, and leave the pool.
+
+        Arguments:
+            remove (bool: False): Delete the pool; only the root run, which
+                created it, should do this
+
+        Returns:
+            None
+
+        """
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self._held = set()
+        if remove:
+            shutil.rmtree(self.path, ignore_errors=True)
@@ -17,7 +17,7 @@ DESCRIPTION = "frof runs other frofs"
 URL = "https://github.com/j6k4m8/frof"
 EMAIL = "j6k4m8@gmail.com"
 AUTHOR = "Jordan Matelsky"
-REQUIRES_PYTHON = ">=3.6.0"
+REQUIRES_PYTHON = ">=3.7.0"
 VERSION = "0.0.2"
 
 # What packages are required for this module to be executed?
@@ -95,7 +95,7 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
     ],
     # $ setup.py publish support.
     cmdclass={"upload": UploadCommand},
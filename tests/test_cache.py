@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from frof.cache import JobCache, referenced_env
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "in.txt").write_text("a")
+    return JobCache(str(tmp_path / "cache"))
+
+
+def _key(cache, cmd="echo hi", env=None, inputs=("in.txt",), upstream=()):
+    return cache.key(cmd, env or {}, inputs, list(upstream))
+
+
+def test_key_is_stable(cache):
+    assert _key(cache) == _key(cache)
+
+
+def test_key_changes_with_command(cache):
+    assert _key(cache, cmd="echo bye") != _key(cache)
+
+
+def test_key_changes_with_env(cache):
+    assert _key(cache, env={"X": "1"}) != _key(cache, env={"X": "2"})
+
+
+def test_key_changes_with_input_contents(cache):
+    before = _key(cache)
+    with open("in.txt", "w") as fh:
+        fh.write("a longer file")
+    assert _key(cache) != before
+
+
+def test_key_changes_when_input_is_missing(cache):
+    before = _key(cache)
+    os.remove("in.txt")
+    assert _key(cache) != before
+
+
+def test_key_changes_with_upstream(cache):
+    assert _key(cache, upstream=["x"]) != _key(cache, upstream=["y"])
+
+
+def test_hit_needs_outputs(cache):
+    key = _key(cache)
+    assert not cache.hit(key)
+    cache.store(key, "job")
+    assert cache.hit(key)
+    assert not cache.hit(key, ["out.txt"])
+    open("out.txt", "w").close()
+    assert cache.hit(key, ["out.txt"])
+
+
+def test_entries_survive_reopening(cache, tmp_path):
+    key = _key(cache)
+    cache.store(key, "job")
+    cache.save()
+    assert JobCache(str(tmp_path / "cache")).hit(key)
+
+
+def test_eviction_is_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = JobCache(str(tmp_path / "cache"), max_size=1000)
+    keys = [cache.key(f"job {i}", {}, (), []) for i in range(20)]
+    for key in keys:
+        cache.store(key, "job")
+    cache.hit(keys[0])
+    cache.save()
+    assert cache.hit(keys[0])
+    assert not cache.hit(keys[1])
+    assert cache.hit(keys[-1])
+
+
+def _file_rows(cache):
+    return [path for (path,) in cache._db.execute("SELECT path FROM files")]
+
+
+def test_unreferenced_file_hashes_are_evicted(cache):
+    _key(cache)
+    cache.save()
+    assert _file_rows(cache) == []
+
+    cache.store(_key(cache), "job")
+    cache.save()
+    assert _file_rows(cache) == [os.path.abspath("in.txt")]
+
+    os.remove("in.txt")
+    cache.save()
+    assert _file_rows(cache) == []
+
+
+def test_referenced_env():
+    env = {"A": "1", "B": "2", "FROF_JOB_PARAM": "x"}
+    assert referenced_env("echo $A ${FROF_JOB_PARAM} $C", env) == {
+        "A": "1",
+        "FROF_JOB_PARAM": "x",
+    }
@@ -0,0 +1,162 @@
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from frof.cluster import (
+    ClusterBackend,
+    ClusterFrofExecutor,
+    WorkerError,
+    _token_matches,
+    check_token,
+    is_loopback,
+    run_worker,
+)
+from frof.job import BashJob
+
+FROF = os.path.join(os.path.dirname(__file__), "..", "bin", "frof")
+PACKAGE = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_worker(port: int, *args) -> subprocess.Popen:
+    env = {**os.environ, "PYTHONPATH": PACKAGE}
+    return subprocess.Popen(
+        [sys.executable, FROF, "worker", str(port), "-p", "1", "--once", *args],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+@pytest.fixture
+def workers():
+    started = []
+    yield started
+    for worker in started:
+        if worker.poll() is None:
+            worker.kill()
+        worker.wait()
+
+
+def test_is_loopback():
+    assert is_loopback("127.0.0.1")
+    assert is_loopback("localhost")
+    assert not is_loopback("0.0.0.0")
+    assert not is_loopback("10.1.2.3")
+
+
+def test_token_is_required_off_loopback():
+    check_token(("127.0.0.1", 8112), None)
+    check_token(("0.0.0.0", 8112), "s3cret")
+    for address in [("0.0.0.0", 8112), ("10.1.2.3", 8112)]:
+        with pytest.raises(ValueError, match="cluster token is required"):
+            check_token(address, None)
+        with pytest.raises(ValueError, match="cluster token is required"):
+            check_token(address, "")
+    with pytest.raises(ValueError):
+        ClusterBackend(1, lambda *args: None, ("0.0.0.0", 0))
+    with pytest.raises(ValueError):
+        ClusterFrofExecutor("A\nA: true\n", address=("0.0.0.0", 0))
+    with pytest.raises(ValueError):
+        run_worker(("10.1.2.3", 8112), once=True)
+
+
+def test_token_matches():
+    assert _token_matches("s3cret", "s3cret")
+    assert not _token_matches("s3cre", "s3cret")
+    assert not _token_matches(None, "s3cret")
+    assert not _token_matches(12, "s3cret")
+
+
+@pytest.mark.parametrize("token", ["wrong", None])
+def test_worker_with_the_wrong_token_is_refused(token):
+    backend = ClusterBackend(1, lambda *args: None, ("127.0.0.1", 0), "s3cret")
+    try:
+        with pytest.raises(WorkerError, match="wrong token"):
+            run_worker(backend.address, token=token, once=True)
+    finally:
+        backend.close()
+
+
+def test_worker_with_the_token_runs_jobs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    done = queue.Queue()
+    backend = ClusterBackend(
+        1, lambda *args: done.put(args), ("127.0.0.1", 0), "s3cret"
+    )
+    worker = threading.Thread(
+        target=run_worker,
+        args=(backend.address,),
+        kwargs={"token": "s3cret", "once": True},
+        daemon=True,
+    )
+    worker.start()
+    try:
+        backend.submit("key", BashJob("touch ran"), {}, {})
+        key, error, _ = done.get(timeout=30)
+    finally:
+        backend.close()
+    # Closing the coordinator ends the worker's run:
+    worker.join(timeout=30)
+    assert not worker.is_alive()
+    assert key == "key" and error is None
+    assert (tmp_path / "ran").exists()
+
+
+def _worker_pids(tmp_path) -> list:
+    path = tmp_path / "pids.txt"
+    return [int(pid) for pid in path.read_text().split()] if path.exists() else []
+
+
+def test_two_workers_run_a_plan(tmp_path, monkeypatch, workers):
+    monkeypatch.chdir(tmp_path)
+    port = _free_port()
+    workers.extend(_start_worker(port) for _ in range(2))
+    # Each job records the pid of the worker that ran it:
+    ClusterFrofExecutor(
+        """A(&v) -> B
+A: echo $PPID >> pids.txt; sleep 1
+B: touch done
+&v: [str(i) for i in range(4)]
+""",
+        address=("127.0.0.1", port),
+        max_jobs=2,
+    ).execute()
+    assert (tmp_path / "done").exists()
+    assert sorted(set(_worker_pids(tmp_path))) == sorted(w.pid for w in workers)
+    for worker in workers:
+        assert worker.wait(timeout=30) == 0
+
+
+def test_lost_workers_jobs_are_reassigned(tmp_path, monkeypatch, workers):
+    monkeypatch.chdir(tmp_path)
+    port = _free_port()
+    workers.extend(_start_worker(port) for _ in range(2))
+
+    def kill_first_worker():
+        while not _worker_pids(tmp_path):
+            time.sleep(0.05)
+        os.kill(_worker_pids(tmp_path)[0], signal.SIGKILL)
+
+    killer = threading.Thread(target=kill_first_worker, daemon=True)
+    killer.start()
+    ClusterFrofExecutor(
+        "A\nA: echo $PPID >> pids.txt; sleep 1\n",
+        address=("127.0.0.1", port),
+        max_jobs=1,
+    ).execute()
+    killer.join()
+    first, second = _worker_pids(tmp_path)
+    assert first != second
+    assert {first, second} == {w.pid for w in workers}
@@ -0,0 +1,109 @@
+import networkx as nx
+import pytest
+
+from frof import LocalFrofExecutor
+from frof.compact import CompactPlan, JobRecord, ValueChunk
+from frof.job import BashJob, FrofJob, PythonJob
+from frof.parser import FrofParser
+
+
+def _plan(names: str, edges) -> CompactPlan:
+    return CompactPlan([JobRecord(name, BashJob("true")) for name in names], edges)
+
+
+def test_edges():
+    plan = _plan("ABCD", [(0, 1), (0, 2), (1, 3), (2, 3), (0, 1)])
+    assert list(plan.successors(0)) == [1, 2]
+    assert list(plan.predecessors(3)) == [1, 2]
+    assert list(plan.successors(3)) == []
+    # The duplicate edge is only counted once:
+    assert list(plan.in_degree) == [0, 1, 1, 2]
+
+
+def test_topological_order():
+    plan = _plan("ABCDE", [(3, 1), (1, 0), (4, 0), (0, 2)])
+    order = plan.topological_order()
+    assert sorted(order) == list(range(5))
+    position = {r: k for k, r in enumerate(order)}
+    for u in range(5):
+        for v in plan.successors(u):
+            assert position[u] < position[v]
+
+
+def test_cycle_names_its_records():
+    with pytest.raises(ValueError, match="B -> C -> D -> B"):
+        _plan("ABCD", [(0, 1), (1, 2), (2, 3), (3, 1)])
+
+
+def test_self_loop_is_a_cycle():
+    with pytest.raises(ValueError, match="A -> A"):
+        _plan("A", [(0, 0)])
+
+
+def test_parsed_cycle():
+    with pytest.raises(ValueError, match="dependency cycle"):
+        FrofParser().parse("A -> B\nB -> A\nA: true\nB: true\n")
+
+
+def test_networkx_cycle():
+    G = nx.DiGraph()
+    G.add_node("A", job=BashJob("true"))
+    G.add_node("B", job=BashJob("true"))
+    G.add_edge("A", "B")
+    G.add_edge("B", "A")
+    with pytest.raises(ValueError, match="dependency cycle"):
+        CompactPlan.from_networkx(G)
+
+
+def test_sweep_is_one_record():
+    plan = FrofParser().parse(
+        "A -> B(&v) -> C\nA: true\nB: echo {{&v}}\nC: true\n"
+        "&v: [str(i) for i in range(1000)]\n"
+    )
+    assert [record.name for record in plan.records] == ["A", "B", "C"]
+    assert plan.job_count() == 1002
+    b = plan.index["B"]
+    assert list(plan.predecessors(b)) == [plan.index["A"]]
+    assert list(plan.successors(b)) == [plan.index["C"]]
+
+
+def _sweep_record(job) -> JobRecord:
+    plan = FrofParser().parse("A(&v)\nA: true\n&v: ['x', 'y', 'z']\n")
+    record = plan.records[0]
+    record.job = job
+    return record
+
+
+def test_chunk_interpolation():
+    record = _sweep_record(BashJob("run {{&v}}", env={"K": "1"}))
+    name, job = record.make_chunk(ValueChunk(("x", "y", "z")))
+    assert name == "A_x..z"
+    assert job.cmd == "run x y z"
+    assert job.env == {"K": "1", "FROF_JOB_PARAMS": "x\ny\nz"}
+    assert record.interpolate("out/{{&v}}.txt", ValueChunk(("x", "y"))) == (
+        "out/x y.txt"
+    )
+    # A chunk of one value is named like the single job:
+    assert record.make_chunk(ValueChunk(("y",)))[0] == "A_y"
+
+
+def test_chunk_interpolation_of_other_jobs():
+    record = _sweep_record(PythonJob("mod", "fn"))
+    _, job = record.make_chunk(ValueChunk(("x", "y")))
+    assert job.env == {"FROF_JOB_PARAMS": ["x", "y"]}
+    record = _sweep_record(FrofJob("frof {{&v}}.frof", "{{&v}}.frof"))
+    with pytest.raises(ValueError, match="can't be chunked"):
+        record.make_chunk(ValueChunk(("x", "y")))
+
+
+def test_chunked_jobs_see_their_values(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    LocalFrofExecutor(
+        """A(&v, chunk=2)
+A: echo {{&v}} >> args.txt; echo "$FROF_JOB_PARAMS" >> params.txt
+&v: ["a", "b", "c"]
+""",
+        max_jobs=1,
+    ).execute()
+    assert (tmp_path / "args.txt").read_text() == "a b\nc\n"
+    assert (tmp_path / "params.txt").read_text() == "a\nb\nc\n"
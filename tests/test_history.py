@@ -0,0 +1,59 @@
+from frof import LocalFrofExecutor
+from frof.history import JobHistory
+from frof.plan import FrofPlan
+
+PARENT = """A -> child -> C
+A: true
+child: frof child.frof
+C: true
+"""
+
+CHILD = """X -> Y
+X: sleep 0.1
+Y: true
+"""
+
+
+class _RecordingHistory(JobHistory):
+    # Remembers which plan IDs the executor asked for durations of.
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.looked_up = {}
+
+    def durations(self, plan_id: str) -> dict:
+        durations = super().durations(plan_id)
+        self.looked_up[plan_id] = durations
+        return durations
+
+
+def test_nested_plans_get_their_durations(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("FROF_PLAN_ID", raising=False)
+    monkeypatch.delenv("FROF_RUN_ID", raising=False)
+    (tmp_path / "parent.frof").write_text(PARENT)
+    (tmp_path / "child.frof").write_text(CHILD)
+    parent = FrofPlan("parent.frof")
+    child_plan_id = f"{parent.plan_id}--{FrofPlan('child.frof').plan_id}"
+
+    history = _RecordingHistory(str(tmp_path / "history"))
+    LocalFrofExecutor(parent, history=history).execute()
+    assert history.looked_up[child_plan_id] == {}
+
+    LocalFrofExecutor(FrofPlan("parent.frof"), history=history).execute()
+    # (The child job runs inline, as the jobs of its plan.)
+    assert set(history.looked_up[parent.plan_id]) == {"A", "C"}
+    durations = history.looked_up[child_plan_id]
+    assert set(durations) == {"X", "Y"}
+    assert durations["X"] >= 0.1
+
+
+def test_run_under_another_plans_id(tmp_path, monkeypatch):
+    # As when a `frof plan.frof` job runs in a separate frof process:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("FROF_PLAN_ID", "outer")
+    monkeypatch.setenv("FROF_RUN_ID", "outer-run")
+    plan = FrofPlan(CHILD)
+    history = _RecordingHistory(str(tmp_path / "history"))
+    LocalFrofExecutor(plan, history=history).execute()
+    LocalFrofExecutor(plan, history=history).execute()
+    assert set(history.looked_up[f"outer--{plan.plan_id}"]) == {"X", "Y"}
@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+import frof.journal
+from frof import LocalFrofExecutor
+from frof.journal import FINISHED, RunJournal, journal_path, read_journal
+
+PLAN = """A -> B -> C
+A: echo A >> runs.txt
+B: echo B >> runs.txt; test -e ok
+C: echo C >> runs.txt
+"""
+
+
+def _runs(tmp_path):
+    return (tmp_path / "runs.txt").read_text().split()
+
+
+def test_resume_skips_finished_jobs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    journal_dir = str(tmp_path / "runs")
+    with pytest.raises(Exception):
+        LocalFrofExecutor(PLAN, journal_dir=journal_dir).execute(run_id="run-1")
+    assert _runs(tmp_path) == ["A", "B"]
+    _, finished = read_journal("run-1", journal_dir)
+    assert finished == {"A"}
+
+    (tmp_path / "ok").touch()
+    LocalFrofExecutor(PLAN, journal_dir=journal_dir).execute(run_id="run-1")
+    assert _runs(tmp_path) == ["A", "B", "B", "C"]
+    # The run has succeeded, so there's nothing left to resume:
+    assert not os.path.exists(journal_path("run-1", journal_dir))
+
+
+def test_only_the_newest_journals_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(frof.journal, "MAX_JOURNALS", 3)
+    for k in range(5):
+        RunJournal(f"run-{k}", str(tmp_path)).close()
+        os.utime(journal_path(f"run-{k}", str(tmp_path)), (k, k))
+    assert sorted(os.listdir(tmp_path)) == [
+        "run-2.journal",
+        "run-3.journal",
+        "run-4.journal",
+    ]
+
+
+def test_records_after_a_torn_line_are_kept(tmp_path):
+    journal = RunJournal("run-1", str(tmp_path), header={"plan": "x"})
+    journal.record(FINISHED, "A")
+    journal.close()
+    path = journal_path("run-1", str(tmp_path))
+    with open(path, "a") as fh:
+        fh.write('["F", "B')
+
+    journal = RunJournal("run-1", str(tmp_path))
+    journal.record(FINISHED, "C")
+    journal.close()
+    header, finished = read_journal("run-1", str(tmp_path))
+    assert header == {"run_id": "run-1", "plan": "x"}
+    assert finished == {"A", "C"}
+    with open(path) as fh:
+        assert json.loads(fh.readlines()[-1]) == [FINISHED, "C"]
+
+
+@pytest.mark.parametrize("run_id", ["../x", "a/b", "run 1"])
+def test_unsafe_run_ids_are_rejected(tmp_path, run_id):
+    with pytest.raises(ValueError):
+        journal_path(run_id, str(tmp_path))
+    with pytest.raises(ValueError):
+        LocalFrofExecutor("A\nA: true\n", journal_dir=str(tmp_path)).execute(
+            run_id=run_id
+        )
@@ -0,0 +1,78 @@
+from frof import LocalFrofExecutor
+from frof.metrics import Histogram, Metrics
+
+
+def _samples(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.max_jobs.set(4)
+    metrics.jobs_running.set(1)
+    metrics.jobs_started.inc(3)
+    metrics.job_duration('say "hi"', 0.2)
+    metrics.job_duration('say "hi"', 7.0)
+    text = metrics.render()
+    assert text.endswith("\n# EOF\n")
+    assert "# TYPE frof_jobs_started counter" in text
+    assert "# TYPE frof_job_duration_seconds histogram" in text
+
+    samples = _samples(text)
+    assert samples["frof_jobs_started_total"] == 3
+    assert samples["frof_worker_utilization"] == 0.25
+    job = 'job="say \\"hi\\""'
+    # Buckets are cumulative, and end with +Inf:
+    assert samples[f'frof_job_duration_seconds_bucket{{{job},le="0.1"}}'] == 0
+    assert samples[f'frof_job_duration_seconds_bucket{{{job},le="0.25"}}'] == 1
+    assert samples[f'frof_job_duration_seconds_bucket{{{job},le="5.0"}}'] == 1
+    assert samples[f'frof_job_duration_seconds_bucket{{{job},le="10.0"}}'] == 2
+    assert samples[f'frof_job_duration_seconds_bucket{{{job},le="+Inf"}}'] == 2
+    assert samples[f"frof_job_duration_seconds_count{{{job}}}"] == 2
+    assert samples[f"frof_job_duration_seconds_sum{{{job}}}"] == 7.2
+    assert samples["frof_job_seconds_total"] == 7.2
+
+
+def test_histogram_bounds_are_inclusive():
+    histogram = Histogram([1.0, 2.0])
+    for value in [1.0, 1.5, 2.0, 3.0]:
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1]
+
+
+def test_metrics_of_a_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(
+        """A(&v) -> B
+A: true
+B: true
+&v: ["1", "2", "3"]
+""",
+        metrics_file=str(tmp_path / "metrics.txt"),
+    )
+    fe.execute()
+    samples = _samples((tmp_path / "metrics.txt").read_text())
+    assert samples["frof_jobs_started_total"] == 4
+    assert samples["frof_jobs_finished_total"] == 4
+    assert samples["frof_jobs_running"] == 0
+    assert samples["frof_ready_records"] == 0
+    assert samples['frof_job_duration_seconds_count{job="A"}'] == 3
+    assert samples['frof_schedule_latency_seconds_bucket{le="+Inf"}'] == 4
+
+
+def test_gauges_are_collected_when_rendered():
+    metrics = Metrics()
+    running = [0]
+    metrics.collect = lambda: metrics.jobs_running.set(running[0])
+    running[0] = 3
+    assert _samples(metrics.render())["frof_jobs_running"] == 3
+    running[0] = 1
+    assert _samples(metrics.render())["frof_jobs_running"] == 1
+    # A reset run has nothing to collect from yet:
+    metrics.reset()
+    assert metrics.collect is None
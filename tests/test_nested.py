@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from frof import LocalFrofExecutor
+from frof.plan import FrofPlan
+
+PARENT = """A -> child -> C
+A: echo A >> order.txt
+child: frof child.frof
+C: echo C >> order.txt
+"""
+
+CHILD = """X -> Y
+X: sleep 0.2; echo X >> order.txt
+Y: echo Y >> order.txt; echo $FROF_PARENT_PLAN_ID > parent_plan_id.txt
+"""
+
+
+@pytest.fixture
+def plans(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("FROF_PLAN_ID", raising=False)
+    monkeypatch.delenv("FROF_RUN_ID", raising=False)
+    # A frof on the PATH that only notes it was run, to catch a child plan
+    # started as a separate process:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "frof"
+    fake.write_text("#!/bin/sh\ntouch spawned\n")
+    fake.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    (tmp_path / "parent.frof").write_text(PARENT)
+    return tmp_path
+
+
+def _order(tmp_path) -> list:
+    path = tmp_path / "order.txt"
+    return path.read_text().split() if path.exists() else []
+
+
+def test_child_plan_runs_inline(plans):
+    (plans / "child.frof").write_text(CHILD)
+    parent = FrofPlan("parent.frof")
+    LocalFrofExecutor(parent).execute()
+    assert not (plans / "spawned").exists()
+    assert (plans / "parent_plan_id.txt").read_text().strip() == parent.plan_id
+    # C waits for every job of the child plan, not just for it to start:
+    assert _order(plans) == ["A", "X", "Y", "C"]
+
+
+def test_child_failure_fails_the_parent_job(plans):
+    (plans / "child.frof").write_text(CHILD.replace("Y: echo Y", "Y: exit 1; echo Y"))
+    fe = LocalFrofExecutor(FrofPlan("parent.frof"))
+    with pytest.raises(Exception):
+        fe.execute()
+    assert not (plans / "spawned").exists()
+    assert _order(plans) == ["A", "X"]
+    assert fe.get_status_snapshot().counters()["failed"] == 1
@@ -0,0 +1,32 @@
+import pytest
+
+from frof.parser import FrofParser
+
+PLAN = """A(&v, inputs="données/é.txt", outputs="résultats/{{&v}}.txt", resources="licence_é=1") -> B
+A: cat données/é.txt > résultats/{{&v}}.txt
+B: true
+&v: ["ü", "x"]
+"""
+
+
+@pytest.fixture(params=["uncached", "cached"])
+def parser(request, tmp_path):
+    return FrofParser(cache_dir=None if request.param == "uncached" else str(tmp_path))
+
+
+def test_non_ascii_options(parser):
+    for _ in range(2):
+        record = parser.parse(PLAN).records[0]
+        assert record.inputs == ("données/é.txt",)
+        assert record.outputs == ("résultats/{{&v}}.txt",)
+        assert record.interpolate(record.outputs[0], "ü") == "résultats/ü.txt"
+        assert record.resources == {"licence_é": 1.0}
+
+
+def test_escapes_in_options(parser):
+    record = parser.parse(
+        'A(inputs="a\\"b c\\\\d", outputs="\\u00e9")\nA: true\n'
+    ).records[0]
+    assert record.inputs == ('a"b', "c\\d")
+    assert record.outputs == ("é",)
+
@@ -0,0 +1,64 @@
+import pytest
+
+from frof import LocalFrofExecutor
+
+
+def _runs(tmp_path) -> list:
+    path = tmp_path / "runs.txt"
+    return path.read_text().split() if path.exists() else []
+
+
+def test_unknown_resource_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(
+        """A(resources="licence=1")
+A: echo A >> runs.txt
+"""
+    )
+    with pytest.raises(ValueError, match="needs 1 licence, but there are only 0"):
+        fe.execute()
+    assert _runs(tmp_path) == []
+
+
+def test_request_larger_than_capacity_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(
+        """A -> B(resources="gpu=3")
+A: echo A >> runs.txt
+B: echo B >> runs.txt
+""",
+        resources={"gpu": 2},
+    )
+    # Checked before any job starts, not when B is reached:
+    with pytest.raises(ValueError, match="Job 'B' needs 3 gpu, but there are only 2"):
+        fe.execute()
+    assert _runs(tmp_path) == []
+
+
+def test_nested_plan_requests_are_checked(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "child.frof").write_text('X(resources="gpu=3")\nX: true\n')
+    fe = LocalFrofExecutor(
+        """A -> child
+A: echo A >> runs.txt
+child: frof child.frof
+""",
+        resources={"gpu": 2},
+    )
+    with pytest.raises(ValueError, match="Job 'X' needs 3 gpu"):
+        fe.execute()
+    assert _runs(tmp_path) == ["A"]
+
+
+def test_jobs_share_resources(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    LocalFrofExecutor(
+        """A(&v, resources="gpu=1")
+A: echo start >> runs.txt; sleep 0.2; echo end >> runs.txt
+&v: ["1", "2", "3"]
+""",
+        resources={"gpu": 1},
+        max_jobs=3,
+    ).execute()
+    # Only one job holds the gpu at a time:
+    assert _runs(tmp_path) == ["start", "end"] * 3
@@ -0,0 +1,77 @@
+import pytest
+
+from frof import LocalFrofExecutor
+
+# Fails the first {fails} times it runs, counting its runs in {name}.n:
+FLAKY = (
+    "n=$(cat {name}.n 2>/dev/null || echo 0); "
+    'echo $((n+1)) > {name}.n; test "$n" -ge {fails}'
+)
+
+
+def _runs(tmp_path):
+    path = tmp_path / "runs.txt"
+    return path.read_text().split() if path.exists() else []
+
+
+def test_flaky_job_succeeds_on_retry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(
+        f"""A(retries=2, retry_delay=0.01) -> B
+A: {FLAKY.format(name="A", fails=2)}
+B: echo B >> runs.txt
+"""
+    )
+    fe.execute()
+    assert (tmp_path / "A.n").read_text().strip() == "3"
+    assert _runs(tmp_path) == ["B"]
+    status = fe.get_status_snapshot().counters()
+    assert status["failed"] == 0
+    assert status["retrying"] == 0
+    assert status["remaining"] == 0
+
+
+def test_job_fails_once_retries_run_out(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(
+        f"""A(retries=1, retry_delay=0.01) -> B
+A: {FLAKY.format(name="A", fails=5)}
+B: echo B >> runs.txt
+"""
+    )
+    with pytest.raises(Exception):
+        fe.execute()
+    assert (tmp_path / "A.n").read_text().strip() == "2"
+    assert _runs(tmp_path) == []
+    page = fe.get_status_snapshot().page()
+    assert page["failed"] == 1
+    assert [(job["name"], job["status"]) for job in page["jobs"]] == [("A", "failed")]
+    assert page["jobs"][0]["error"]
+
+
+# F's chain is the longest path, so F starts before X.
+CHAINS = """F -> G -> H
+X
+F: echo F >> runs.txt; false
+G: echo G >> runs.txt
+H: echo H >> runs.txt
+X: echo X >> runs.txt
+"""
+
+
+def test_failure_stops_new_jobs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(Exception):
+        LocalFrofExecutor(CHAINS, max_jobs=1).execute()
+    assert _runs(tmp_path) == ["F"]
+
+
+def test_keep_going_runs_everything_independent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(CHAINS, max_jobs=1, keep_going=True)
+    with pytest.raises(Exception):
+        fe.execute()
+    assert _runs(tmp_path) == ["F", "X"]
+    status = fe.get_status_snapshot().counters()
+    assert status["failed"] == 1
+    assert status["done"] == 1
@@ -0,0 +1,88 @@
+import time
+
+from frof import LocalFrofExecutor
+from frof.executor import _RunLoop
+
+
+class _RecordingBackend:
+    # Never runs anything: the test finishes the jobs itself.
+    def __init__(self, max_jobs, done) -> None:
+        self.submitted = []
+
+    def submit(self, key, job, env, run_args) -> None:
+        self.submitted.append(key)
+
+    def kill(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def _loop(frof: str, **kwargs) -> _RunLoop:
+    fe = LocalFrofExecutor(frof, backend=_RecordingBackend, **kwargs)
+    fe.run_id = "run"
+    return _RunLoop(fe, {"FROF_RUN_ID": "run", "FROF_PLAN_ID": "plan"})
+
+
+def _submitted(loop: _RunLoop) -> list:
+    return [i for backend in loop.backends.values() for _, i in backend.submitted]
+
+
+def _complete(loop: _RunLoop, i: str, error: Exception = None) -> None:
+    loop.handle_completion(loop.subruns[0], i, error, {}, time.time())
+
+
+def test_dispatch_fills_the_free_slots():
+    loop = _loop("A -> B\nC\nA: true\nB: true\nC: true\n", max_jobs=1)
+    loop.dispatch()
+    assert _submitted(loop) == ["A"]
+    assert loop.active == 1
+    # No slot is free, so nothing else starts:
+    loop.dispatch()
+    assert _submitted(loop) == ["A"]
+    _complete(loop, "A")
+    assert loop.active == 0
+    # C was ready first, and B (now ready) is no more urgent:
+    loop.dispatch()
+    assert _submitted(loop) == ["A", "C"]
+    _complete(loop, "C")
+    loop.dispatch()
+    assert _submitted(loop) == ["A", "C", "B"]
+
+
+def test_failed_job_waits_for_its_retry():
+    loop = _loop("A(retries=1, retry_delay=60)\nA: true\n")
+    loop.dispatch()
+    _complete(loop, "A", RuntimeError("boom"))
+    assert loop.failure is None
+    assert [i for _, _, _, i in loop.delayed] == ["A"]
+    assert loop.snapshot.counters()["retrying"] == 1
+    # The retry isn't due yet:
+    loop.dispatch()
+    assert _submitted(loop) == ["A"]
+    _, order, sub, i = loop.delayed[0]
+    loop.delayed[0] = (0, order, sub, i)
+    loop.dispatch()
+    assert _submitted(loop) == ["A", "A"]
+    _complete(loop, "A", RuntimeError("boom"))
+    assert str(loop.failure) == "boom"
+    assert loop.failed_jobs == ["A"]
+
+
+def test_resources_are_held_until_the_job_finishes():
+    loop = _loop(
+        """A(resources="gpu=1")
+B(resources="gpu=1")
+A: true
+B: true
+""",
+        resources={"gpu": 1},
+    )
+    loop.dispatch()
+    assert len(_submitted(loop)) == 1
+    assert loop.available["gpu"] == 0
+    _complete(loop, _submitted(loop)[0])
+    assert loop.available["gpu"] == 1
+    loop.dispatch()
+    assert sorted(_submitted(loop)) == ["A", "B"]
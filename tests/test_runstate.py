@@ -0,0 +1,182 @@
+from frof.plan import FrofPlan
+from frof.runstate import DONE, FAILED, RunState
+
+
+def _run_state(frof: str) -> RunState:
+    return RunState(FrofPlan(frof))
+
+
+def _drain(rs: RunState, fits=None) -> list:
+    names = []
+    while True:
+        next_job = rs.pop_ready(fits)
+        if next_job is None:
+            return names
+        names.append(next_job[0])
+
+
+SWEEP = """A -> B(&v, 2) -> C
+A: true
+B: echo {{&v}}
+C: true
+&v: [str(i) for i in range(5)]
+"""
+
+
+def test_dependencies_gate_jobs():
+    rs = _run_state(SWEEP)
+    assert _drain(rs) == ["A"]
+    rs.finish("A")
+    assert _drain(rs) == ["B_0", "B_1"]
+
+
+def test_group_limit():
+    rs = _run_state(SWEEP)
+    rs.pop_ready()
+    rs.finish("A")
+    assert _drain(rs) == ["B_0", "B_1"]
+    assert rs.group_running[rs.records[1].group] == 2
+    assert rs.ready_count() == 1
+
+
+def test_finish_releases_group_slot():
+    rs = _run_state(SWEEP)
+    rs.pop_ready()
+    rs.finish("A")
+    _drain(rs)
+    rs.finish("B_0")
+    assert _drain(rs) == ["B_2"]
+    # B is held again, for its last two values:
+    assert rs.ready_count() == 1
+    for name in ["B_1", "B_2"]:
+        rs.finish(name)
+    assert _drain(rs) == ["B_3", "B_4"]
+    assert rs.ready_count() == 0
+    rs.finish("B_3")
+    rs.finish("B_4")
+    assert _drain(rs) == ["C"]
+    rs.finish("C")
+    assert rs.is_complete()
+    assert rs.remaining_count() == 0
+    assert rs.ready_count() == 0
+
+
+def test_fail_releases_group_slot_and_blocks_successors():
+    rs = _run_state(SWEEP)
+    rs.pop_ready()
+    rs.finish("A")
+    _drain(rs)
+    rs.fail("B_0")
+    assert rs.status[1] == FAILED
+    # The rest of the sweep can still run...
+    assert _drain(rs) == ["B_2"]
+    for name in ["B_1", "B_2"]:
+        rs.finish(name)
+    assert _drain(rs) == ["B_3", "B_4"]
+    rs.finish("B_3")
+    rs.finish("B_4")
+    # ...but what depends on it never does.
+    assert _drain(rs) == []
+    assert not rs.is_complete()
+
+
+def test_records_that_dont_fit_wait_for_unblock():
+    rs = _run_state(
+        """big(resources="tok=2")
+small(resources="tok=1")
+big: true
+small: true
+"""
+    )
+    available = {"tok": 1}
+
+    def fits(record):
+        return all(available.get(k, 0) >= v for k, v in record.resources.items())
+
+    assert _drain(rs, fits) == ["small"]
+    assert rs.blocked == [rs.plan.index["big"]]
+    assert rs.ready_count() == 1
+    available["tok"] = 2
+    assert _drain(rs, fits) == []
+    rs.unblock()
+    assert _drain(rs, fits) == ["big"]
+
+
+def test_fixed_chunks():
+    rs = _run_state(
+        """A(&v, chunk=3)
+A: echo {{&v}}
+&v: [str(i) for i in range(7)]
+"""
+    )
+    names = _drain(rs)
+    assert [len(rs.instance_of(name)[1]) for name in names] == [3, 3, 1]
+    for name in names:
+        rs.finish(name)
+    assert rs.done_count == 7
+    assert rs.is_complete()
+    assert rs.status[0] == DONE
+
+
+def test_auto_chunks_grow_while_jobs_are_quick():
+    rs = _run_state(
+        """A(&v, chunk=auto)
+A: echo {{&v}}
+&v: [str(i) for i in range(100)]
+"""
+    )
+    sizes = []
+    for _ in range(4):
+        name, _ = rs.pop_ready()
+        sizes.append(len(rs.instance_of(name)[1]))
+        rs.finish(name)
+    # Jobs that finish at once are well under AUTO_CHUNK_SECONDS, so the
+    # chunk size doubles each time (and no faster):
+    assert sizes == [1, 2, 4, 8]
+
+
+def test_auto_chunks_shrink_for_slow_jobs():
+    rs = _run_state(
+        """A(&v, chunk=auto)
+A: echo {{&v}}
+&v: [str(i) for i in range(100)]
+"""
+    )
+    rs._resize_chunk(0, 0.001)
+    rs._resize_chunk(0, 0.001)
+    assert rs._auto_chunk[0] == 4
+    rs._resize_chunk(0, 10.0)
+    assert rs._auto_chunk[0] == 1
+
+
+def test_lazy_sweep_counts_pulled_values():
+    rs = _run_state(
+        """A(&v) -> B
+A: echo {{&v}}
+B: true
+&v: (str(i) for i in range(3))
+"""
+    )
+    assert _drain(rs) == ["A_0", "A_1", "A_2"]
+    # The three values pulled from the sweep, and B:
+    assert len(rs) == 4
+    for name in ["A_0", "A_1", "A_2"]:
+        rs.finish(name)
+    assert _drain(rs) == ["B"]
+
+
+def test_observed_durations_reorder_ready_records():
+    rs = RunState(FrofPlan("A\nB\nA: true\nB: true\n"), {"A": 1.0, "B": 2.0})
+    a, b = rs.plan.index["A"], rs.plan.index["B"]
+    # A change of less than 10% doesn't re-queue B:
+    rs._observe(b, 2.1, 1)
+    assert len(rs.ready) == 2
+    # A took far longer than expected, so it now goes first. Its old entry
+    # is left behind in the heap, and skipped:
+    rs._observe(a, 10.0, 1)
+    assert rs.priority[a] == 10.0
+    assert len(rs.ready) == 3
+    assert rs.ready_count() == 2
+    assert _drain(rs) == ["A", "B"]
+    assert rs.ready_count() == 0
+    assert rs.ready == []
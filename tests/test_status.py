@@ -0,0 +1,127 @@
+from flask import Flask
+
+from frof.job import BashJob
+from frof.statusmonitor import StatusSnapshot
+from frof.statusmonitor.HTTPServerStatusMonitor import (
+    HTTPServerStatusMonitor,
+    _coalesce,
+)
+
+
+def _start(snapshot: StatusSnapshot, *names) -> None:
+    for name in names:
+        snapshot.job_started(name, BashJob(f"echo {name}"))
+
+
+def test_changes_since_a_version():
+    snapshot = StatusSnapshot()
+    _start(snapshot, "A", "B")
+    version = snapshot.version
+    snapshot.job_finished("A")
+    snapshot.job_finished("B", failed=True, error="exit status 1")
+    status = snapshot.changes_since(version)
+    assert status["since"] == version
+    assert [(c["name"], c["status"]) for c in status["changes"]] == [
+        ("A", "done"),
+        ("B", "failed"),
+    ]
+    assert status["changes"][1]["error"] == "exit status 1"
+    assert status["failed"] == 1 and status["running"] == 0
+    assert snapshot.changes_since(snapshot.version)["changes"] == []
+
+
+def test_changes_since_is_none_once_the_log_wraps():
+    snapshot = StatusSnapshot(log_size=3)
+    _start(snapshot, "A", "B")
+    assert snapshot.changes_since(0) is not None
+    _start(snapshot, "C", "D")
+    # The change to version 1 has been forgotten:
+    assert snapshot.changes_since(0) is None
+    assert [c["name"] for c in snapshot.changes_since(1)["changes"]] == ["B", "C", "D"]
+
+
+def test_changes_since_is_none_after_a_reset():
+    snapshot = StatusSnapshot()
+    _start(snapshot, "A", "B")
+    version = snapshot.version
+    snapshot.reset("another-run")
+    # A version from the previous run is ahead of the new one:
+    assert snapshot.changes_since(version) is None
+    _start(snapshot, "X")
+    assert [c["name"] for c in snapshot.changes_since(0)["changes"]] == ["X"]
+
+
+def test_page_lists_jobs_in_order_of_their_last_change():
+    snapshot = StatusSnapshot()
+    _start(snapshot, "A", "B", "C", "D")
+    snapshot.job_finished("B")
+    snapshot.job_finished("A", failed=True)
+    page = snapshot.page(offset=1, limit=2)
+    assert page["job_count"] == 3
+    assert [job["name"] for job in page["jobs"]] == ["D", "A"]
+    assert (page["offset"], page["limit"]) == (1, 2)
+    assert [job["name"] for job in snapshot.page(offset=3)["jobs"]] == []
+
+
+def test_tracked_progress_is_read_when_the_counters_are():
+    snapshot = StatusSnapshot()
+    progress = [10, 0]
+    snapshot.track_progress(lambda: tuple(progress))
+    progress[1] = 4
+    assert (snapshot.counters()["total"], snapshot.counters()["done"]) == (10, 4)
+    version = snapshot.version
+    snapshot.set_progress(10, 10, finished=True)
+    assert snapshot.version == version + 1
+    # set_progress() stops the tracking:
+    progress[1] = 5
+    status = snapshot.counters()
+    assert (status["done"], status["finished"]) == (10, True)
+
+
+def test_coalesce_keeps_the_latest_change_of_each_job():
+    changes = [
+        {"version": 1, "name": "A", "status": "running"},
+        {"version": 2, "name": "B", "status": "running"},
+        {"version": 3, "name": "A", "status": "retrying"},
+        {"version": 4, "name": "B", "status": "done"},
+        {"version": 5, "name": "A", "status": "running"},
+    ]
+    assert [(c["name"], c["version"]) for c in _coalesce(changes)] == [
+        ("B", 4),
+        ("A", 5),
+    ]
+    assert _coalesce([]) == []
+
+
+class _Executor:
+    def __init__(self, snapshot: StatusSnapshot) -> None:
+        self.snapshot = snapshot
+
+    def get_status_snapshot(self) -> StatusSnapshot:
+        return self.snapshot
+
+
+def _get_status(monitor, path: str, etag: str = None):
+    headers = {} if etag is None else {"If-None-Match": etag}
+    with Flask(__name__).test_request_context(path, headers=headers):
+        return monitor._status()
+
+
+def test_status_etag():
+    snapshot = StatusSnapshot()
+    snapshot.reset("run")
+    _start(snapshot, "A")
+    # Without starting its server:
+    monitor = HTTPServerStatusMonitor.__new__(HTTPServerStatusMonitor)
+    monitor.fe = _Executor(snapshot)
+
+    response = _get_status(monitor, "/status")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200 and etag == '"run-1"'
+    assert _get_status(monitor, "/status", etag).status_code == 304
+
+    snapshot.job_finished("A")
+    response = _get_status(monitor, "/status?since=1", etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"run-2"'
+    assert [c["status"] for c in response.get_json()["changes"]] == ["done"]
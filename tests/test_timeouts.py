@@ -0,0 +1,80 @@
+import subprocess
+import time
+
+import pytest
+
+from frof import LocalFrofExecutor
+from frof.job import BashJob
+
+# Leaves a grandchild behind, which only dies with the job's process group:
+HANG = "sleep 60 & echo $! > {name}.pid; wait"
+
+
+def _gone(pid: int, within: float = 5.0) -> bool:
+    deadline = time.monotonic() + within
+    while time.monotonic() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat") as fh:
+                if fh.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return True
+        except FileNotFoundError:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _pid(tmp_path, name: str) -> int:
+    return int((tmp_path / f"{name}.pid").read_text())
+
+
+def test_bash_job_timeout_kills_process_group(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    started = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        BashJob(HANG.format(name="job")).run(env_vars={}, timeout=0.5)
+    assert time.monotonic() - started < 10
+    assert _gone(_pid(tmp_path, "job"))
+
+
+@pytest.mark.parametrize("backend", ["thread", "asyncio", "process"])
+def test_timeout_option_kills_process_group(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(
+        f"""A(timeout=0.5) -> B
+A: {HANG.format(name="A")}
+B: touch B.done
+""",
+        backend=backend,
+    )
+    with pytest.raises(Exception):
+        fe.execute()
+    assert _gone(_pid(tmp_path, "A"))
+    assert not (tmp_path / "B.done").exists()
+
+
+def test_executor_timeout_and_exemption(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(
+        f"""A
+B(timeout=0)
+A: {HANG.format(name="A")}
+B: sleep 1; touch B.done
+""",
+        timeout=0.5,
+        keep_going=True,
+    )
+    with pytest.raises(Exception):
+        fe.execute()
+    assert _gone(_pid(tmp_path, "A"))
+    assert (tmp_path / "B.done").exists()
+
+
+def test_timed_out_job_is_retried(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fe = LocalFrofExecutor(
+        """A(timeout=0.5, retries=1, retry_delay=0.01)
+A: echo run >> runs.txt; test -e runs.2 || { touch runs.2; sleep 60; }
+"""
+    )
+    fe.execute()
+    assert (tmp_path / "runs.txt").read_text().split() == ["run", "run"]
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+from frof.tokens import TokenPool
+
+PACKAGE = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _drain(pool: TokenPool) -> list:
+    tokens = []
+    while True:
+        token = pool.acquire()
+        if token is None:
+            return tokens
+        tokens.append(token)
+
+
+def test_pools_on_the_same_dir_share_their_slots(tmp_path):
+    first = TokenPool.create("run", 3, str(tmp_path))
+    second = TokenPool(first.path)
+    assert len(first) == len(second) == 3
+
+    held = [first.acquire(), second.acquire()]
+    held += _drain(first) + _drain(second)
+    # However the two pools interleave, only three slots are ever held:
+    assert len(held) == 3
+    assert first.acquire() is None and second.acquire() is None
+
+    first.release(held[0])
+    assert second.acquire() == held[0]
+    assert first.acquire() is None
+
+
+def test_slots_are_released_on_close(tmp_path):
+    first = TokenPool.create("run", 2, str(tmp_path))
+    second = TokenPool(first.path)
+    assert len(_drain(first)) == 2
+    assert second.acquire() is None
+
+    first.close()
+    assert len(_drain(second)) == 2
+    second.close(remove=True)
+    assert not os.path.exists(first.path)
+
+
+def test_slots_of_a_dead_process_are_released(tmp_path):
+    pool = TokenPool.create("run", 2, str(tmp_path))
+    # Exits while it still holds every slot:
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from frof.tokens import TokenPool; "
+            "pool = TokenPool(sys.argv[1]); "
+            "assert pool.acquire() is not None and pool.acquire() is not None",
+            pool.path,
+        ],
+        env={**os.environ, "PYTHONPATH": PACKAGE},
+        check=True,
+    )
+    assert len(_drain(pool)) == 2
+    pool.close(remove=True)